@@ -2,28 +2,224 @@ import os
 import shutil
 import sqlite3
 import mimetypes
+import codecs
+import html
+import json
+import math
+import base64
+import time
+import hashlib
+import secrets
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
 from functools import wraps
 from flask import (Flask, render_template, request, redirect, url_for,
-                   send_from_directory, flash, session, jsonify, abort, Response)
+                   send_from_directory, flash, session, jsonify, abort, Response, g,
+                   before_render_template, template_rendered, send_file, make_response)
 # 移除 secure_filename 的导入，因为它不再被使用
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import is_resource_modified
+from werkzeug.utils import send_file as send_file_offloaded
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_wtf.csrf import CSRFProtect
+import database
+import metrics
+from search_index import FileNameIndex
+from fs_cache import DirSizeCache, DirListingCache, DirTreeCache, LISTING_SORT_KEYS
+from chunked_upload import ChunkedUploadStore, ChunkedUploadError
+from zip_stream import iter_zip
+from thumbnails import ThumbnailService, ThumbnailPending
+from jobs import JobManager
+from blob_store import BlobStore
+from fs_watcher import FileSystemWatcher
+from quota import QuotaManager
+from content_index import ContentIndex, SNIPPET_START, SNIPPET_END, MIN_QUERY_LENGTH as MIN_CONTENT_QUERY_LENGTH
+from static_assets import StaticAssets, tree_signature
+from sync_journal import ChangeJournal, CursorExpired, iter_manifest
+from process_lock import ProcessLock
 
 # --- 配置 ---
+def load_secret_key():
+    """
+    会话签名密钥：优先使用环境变量 FILE_MANAGER_SECRET_KEY，否则使用 DATA_DIR 下持久化的随机密钥 (首次启动时生成)。
+    所有工作进程共用同一个密钥，登录状态在进程之间通用，重启后也不会失效。
+    """
+    key = os.environ.get('FILE_MANAGER_SECRET_KEY')
+    if key: return key
+    path = os.path.join(database.DATA_DIR, 'secret_key')
+    if not os.path.exists(path):
+        # 先写临时文件再用 os.link 放到位 (目标已存在时失败)，多个进程同时启动时只有一个密钥生效
+        tmp = f'{path}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f: f.write(secrets.token_hex(32))
+        try: os.link(tmp, path)
+        except FileExistsError: pass
+        finally: os.remove(tmp)
+    with open(path) as f: return f.read().strip()
+
 app = Flask(__name__)
-app.config['SECRET_KEY'] = os.urandom(24) 
+app.config['SECRET_KEY'] = load_secret_key()
 BASE_DIR_ROOT = os.path.dirname(os.path.abspath(__file__))
-UPLOADS_DIR = os.path.join(BASE_DIR_ROOT, 'uploads')
-DB_PATH = os.path.join(BASE_DIR_ROOT, 'file_manager.db')
+UPLOADS_DIR = database.UPLOADS_DIR
+DB_PATH = database.DB_PATH
+INDEX_DB_PATH = os.path.join(database.DATA_DIR, 'file_index.db')
+CONTENT_INDEX_DB_PATH = os.path.join(database.DATA_DIR, 'content_index.db')
+UPLOAD_STAGING_DIR = os.path.join(database.DATA_DIR, 'upload_staging')
+THUMBNAIL_CACHE_DIR = os.path.join(database.DATA_DIR, 'thumbnail_cache')
+STATIC_CACHE_DIR = os.path.join(database.DATA_DIR, 'static_cache')
+# 存储模式：'plain' 每次上传保存完整副本；'dedup' 按内容去重，用户目录中的文件为指向 BLOB_STORE_DIR 的硬链接。
+# BLOB_STORE_DIR 必须与 UPLOADS_DIR 位于同一文件系统，否则无法建立硬链接，启动时会退回 'plain'。
+STORAGE_MODE = os.environ.get('FILE_MANAGER_STORAGE_MODE', 'plain')
+BLOB_STORE_DIR = os.path.join(database.DATA_DIR, 'blob_store')
+SEARCH_PER_PAGE = 100
+SEARCH_RESULT_LIMIT = 5000
+LISTING_PAGE_SIZE = 200
+LISTING_MAX_PAGE_SIZE = 1000
+DIR_TREE_MAX_DEPTH = 5
+PREVIEW_FULL_LIMIT = 1024 * 1024     # 小于该大小的文本文件一次性完整预览
+PREVIEW_PAGE_SIZE = 256 * 1024       # 大文件分页预览时每页的字节数
+PREVIEW_MAX_KB = 4096                # head/tail 模式允许请求的最大 KB 数
+PREVIEW_READ_SIZE = 64 * 1024
+THUMBNAIL_RETRY_AFTER = 3  # 秒；缩略图生成超时时建议浏览器重试的间隔
+USER_CACHE_TTL = 5  # 秒；多进程部署时其他进程中的缓存最多滞后这么久
+HTML_ETAG_WINDOW = 600  # 秒；HTML 页面内嵌 CSRF 令牌，ETag 每隔这么久变化一次，避免浏览器沿用过期的令牌
+STATIC_MAX_AGE = 365 * 24 * 3600
+WATCH_UPLOADS = True       # 监视 UPLOADS_DIR 中绕过路由的修改 (rsync、cron 等)
+WATCH_SCAN_INTERVAL = 60   # 秒；inotify 不可用时定期扫描的间隔
+WATCH_OWN_CHANGE_WINDOW = 2  # 秒；路由记录变更之后这段时间内同一目录的监视器事件视为应用自身的修改
+BACKGROUND_ELECTION_INTERVAL = 30  # 秒；非负责进程尝试接手目录监视和内容索引的间隔
+JOURNAL_FOLLOW_INTERVAL = 1        # 秒；各进程读取变更记录、失效内存缓存的间隔
+CONTENT_INDEX_MAX_BYTES = 1024 * 1024  # 每个文本文件最多索引开头的这么多字节
+CONTENT_INDEX_INTERVAL = 600           # 秒；内容索引全量核对的间隔
+MAX_QUOTA_MB = 1024 * 1024 * 1024  # 1 PB；配额以字节存入 SQLite INTEGER，需要有上限
+QUOTA_RECONCILE_INTERVAL = 3600  # 秒；按实际目录大小校正用户已用空间的间隔
+SYNC_JOURNAL_RETENTION = 30 * 24 * 3600  # 秒；同步接口的变更记录保留时间，更早的游标需要重新获取清单
+SYNC_JOURNAL_PRUNE_INTERVAL = 3600
+SYNC_CHANGES_PAGE_SIZE = 1000
+SYNC_CHANGES_MAX_PAGE_SIZE = 10000
+METRICS_ENABLED = True     # 统计请求耗时、SQL 语句数和文件系统调用次数，由 /metrics 导出
+PROFILE_HEADER = 'X-Profile'  # 管理员请求带上该请求头时返回该请求的 cProfile 报告
+# python app.py 启动时，内容索引进程池的子进程 (forkserver/spawn) 会以 __mp_main__ 的名称重新导入本文件；
+# 子进程只用来读取文件，不升级数据库，也不启动任何后台线程
+POOL_CHILD = __name__ == '__mp_main__'
+# 多进程部署时汇总各进程指标的共享目录 (gunicorn.conf.py 自动设置)；为空时 /metrics 只导出当前进程的数据
+METRICS_DIR = os.environ.get('FILE_MANAGER_METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = 5  # 秒；各进程把指标快照写入共享目录的间隔，其他进程的数据在 /metrics 中最多滞后这么久
+# 大文件交给前端服务器发送，不占用 Python 工作进程 (Range 和条件请求也由前端服务器处理)：
+# 空 - 由应用自己发送，gunicorn 下通过 wsgi.file_wrapper 使用零拷贝的 sendfile；
+# 'x-sendfile' - Apache mod_xsendfile / lighttpd；
+# 'x-accel' - nginx，需要一个 internal location 把 X_ACCEL_PREFIX 映射到 UPLOADS_DIR (见 README)
+SENDFILE_MODE = os.environ.get('FILE_MANAGER_SENDFILE', '')
+SENDFILE_MIN_SIZE = 1024 * 1024
+X_ACCEL_PREFIX = '/_uploads/'
+# 应用前面的反向代理层数；大于 0 时信任 X-Forwarded-For/Proto/Host，以获得真实的客户端地址和协议
+PROXY_COUNT = int(os.environ.get('FILE_MANAGER_PROXY_COUNT', 0))
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
 csrf = CSRFProtect(app)
+if PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_COUNT, x_proto=PROXY_COUNT, x_host=PROXY_COUNT)
+
+# 必须在创建任何数据库连接之前安装，之后创建的连接才会统计语句数
+if METRICS_ENABLED:
+    database.statement_callback = metrics.count_db_statement
+metrics_collector = None
+if METRICS_ENABLED and METRICS_DIR and not POOL_CHILD:
+    metrics_collector = metrics.MultiProcessCollector(metrics.registry, METRICS_DIR)
+    metrics_collector.start(METRICS_FLUSH_INTERVAL)
+
+# 文件名索引：首次启动时在后台线程中全量构建，之后由各个修改文件的路由增量维护
+name_index = FileNameIndex(INDEX_DB_PATH, UPLOADS_DIR)
+if not POOL_CHILD and not name_index.is_ready():
+    name_index.rebuild_async()
+metrics.registry.register(metrics.Gauge('file_manager_name_index_ready', '文件名索引是否可用', lambda: int(name_index.is_ready())))
+dir_size_cache = DirSizeCache()
+dir_listing_cache = DirListingCache()
+dir_tree_cache = DirTreeCache()
+chunked_uploads = ChunkedUploadStore(UPLOAD_STAGING_DIR)
+thumbnails = ThumbnailService(THUMBNAIL_CACHE_DIR)
+static_assets = StaticAssets(app.static_folder, STATIC_CACHE_DIR)
+if not POOL_CHILD: static_assets.compress_async()
+# 模板和静态资源的签名：部署新版本后页面的 ETag 随之变化
+ASSET_SIGNATURE = tree_signature(os.path.join(app.root_path, app.template_folder), app.static_folder)
+# 批量删除/移动在后台线程中执行，任务进度写入主数据库的 jobs 表
+jobs = JobManager(DB_PATH, logger=app.logger)
+
+# 已有数据库在启动时自动升级表结构 (不会删除数据)；全新安装仍需先运行 database.py。
+# gunicorn 下由主进程在启动工作进程之前升级一次 (见 gunicorn.conf.py)
+if not POOL_CHILD and os.path.exists(DB_PATH) and not os.environ.get('FILE_MANAGER_MIGRATED'):
+    database.migrate(DB_PATH)
+if not POOL_CHILD and os.path.exists(DB_PATH):
+    jobs.fail_stale()
+blob_store = None
+if STORAGE_MODE == 'dedup':
+    if BlobStore.same_filesystem(BLOB_STORE_DIR, UPLOADS_DIR):
+        blob_store = BlobStore(BLOB_STORE_DIR, DB_PATH)
+    else:
+        app.logger.warning('%s 与 %s 不在同一文件系统，无法使用去重存储，已改为 plain 模式', BLOB_STORE_DIR, UPLOADS_DIR)
+quota = QuotaManager(DB_PATH, UPLOADS_DIR, dir_size_cache.get_size)
+if not POOL_CHILD and os.path.exists(DB_PATH):
+    quota.start_reconciler(QUOTA_RECONCILE_INTERVAL)
+# 同步接口的变更记录，由下面的 notify_* 钩子和文件系统监视器写入；各进程也通过它得知其他进程做的修改
+change_journal = ChangeJournal(DB_PATH, UPLOADS_DIR, SYNC_JOURNAL_RETENTION)
+if not POOL_CHILD and os.path.exists(DB_PATH):
+    change_journal.start_pruner(SYNC_JOURNAL_PRUNE_INTERVAL)
 
 # ... 省略其他未改动的函数 ...
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def get_db():
+    return database.get_connection(DB_PATH)
+
+def check_upload_quota():
+    """
+    普通用户通过 /upload/ 上传时，按 Content-Length 在读取请求体之前检查配额。
+    CSRFProtect 校验令牌时会解析表单 (把上传的文件写入临时文件)，因此该钩子被插入到最前面。
+    """
+    if request.endpoint != 'upload_files' or session.get('role') != 'user': return None
+    if request.content_length and quota.would_exceed(session.get('username'), request.content_length):
+        return jsonify({'error': '超出存储配额，无法上传'}), 413
+    return None
+app.before_request_funcs.setdefault(None, []).insert(0, check_upload_quota)
+
+@app.teardown_appcontext
+def release_db(exc):
+    database.release_connections()
+
+# --- 运行指标 ---
+@app.before_request
+def start_request_metrics():
+    if not METRICS_ENABLED: return
+    g.request_start = time.perf_counter()
+    if request.headers.get(PROFILE_HEADER) and session.get('role') == 'admin':
+        g.profiler = metrics.RequestProfiler()
+        g.profiler.start()
+
+@app.after_request
+def record_request_metrics(response):
+    if not METRICS_ENABLED or 'request_start' not in g: return response
+    # 流式响应 (预览、ZIP) 只统计到开始发送为止的耗时，发送的字节数在发送过程中累计
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.request_latency.observe(time.perf_counter() - g.request_start, request.method, route, response.status_code)
+    metrics.bytes_received.inc(request.content_length or 0)
+    if response.content_length is not None:
+        metrics.bytes_sent.inc(response.content_length)
+    elif response.is_streamed:
+        response.response = metrics.iter_counted(response.response, metrics.bytes_sent)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        status = response.status_code
+        response.close()
+        return Response(profiler.report(), mimetype='text/plain', headers={'X-Profiled-Status': str(status)})
+    return response
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template_timer(sender, template, context, **extra):
+    if 'template_start' in g:
+        metrics.template_latency.observe(time.perf_counter() - g.pop('template_start'), template.name or '-')
 
 def login_required(f):
     @wraps(f)
@@ -49,9 +245,7 @@ def permission_required(permission_name):
         def decorated_function(*args, **kwargs):
             if session.get('role') == 'admin':
                 return f(*args, **kwargs)
-            conn = get_db_connection()
-            user = conn.execute('SELECT * FROM users WHERE username = ?', (session['username'],)).fetchone()
-            conn.close()
+            user = get_user_row(session['username'])
             if user and user[permission_name]:
                 return f(*args, **kwargs)
             else:
@@ -59,13 +253,57 @@ def permission_required(permission_name):
         return decorated_function
     return decorator
 
+# --- 用户与设置缓存 ---
+# 同一请求内通过 flask.g 复用查询结果，跨请求使用短 TTL 的进程内缓存；
+# 修改用户或设置的路由会主动清空对应缓存。
+_user_cache, _settings_cache = {}, {}
+
+def get_user_row(username):
+    rows = g.setdefault('user_rows', {})
+    if username in rows: return rows[username]
+    now = time.monotonic()
+    cached = _user_cache.get(username)
+    if cached and cached[0] > now:
+        user = cached[1]
+    else:
+        conn = get_db()
+        row = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        user = dict(row) if row else None
+        _user_cache[username] = (now + USER_CACHE_TTL, user)
+    rows[username] = user
+    return user
+
+def get_setting(key, default=None):
+    settings = g.setdefault('settings', {})
+    if key in settings: return settings[key]
+    now = time.monotonic()
+    cached = _settings_cache.get(key)
+    if cached and cached[0] > now:
+        value = cached[1]
+    else:
+        conn = get_db()
+        row = conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        value = row['value'] if row else default
+        _settings_cache[key] = (now + USER_CACHE_TTL, value)
+    settings[key] = value
+    return value
+
+def is_registration_enabled():
+    return get_setting('registration_enabled') == 'true'
+
+def invalidate_user_cache():
+    _user_cache.clear()
+    g.pop('user_rows', None)
+
+def invalidate_settings_cache():
+    _settings_cache.clear()
+    g.pop('settings', None)
+
 def get_current_user_permissions():
     if 'username' not in session: return {}
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE username = ?', (session['username'],)).fetchone()
-    conn.close()
+    user = get_user_row(session['username'])
     if not user: return {}
-    return {key: user[key] for key in user.keys()}
+    return {key: value for key, value in user.items() if key != 'password'}
 
 def get_user_base_dir():
     if session.get('role') == 'admin':
@@ -94,22 +332,140 @@ def human_readable_size(size, decimal_places=2):
         size /= 1024.0
     return f"{size:.{decimal_places}f} {unit}"
 
+TEXT_PREVIEW_EXTENSIONS = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml'}
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp'}
+
 def is_previewable(filename):
-    previewable_extensions = {'.txt', '.md', '.py', '.js', '.html', '.css', '.json', '.xml'}
-    image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.webp'}
     _, ext = os.path.splitext(filename.lower())
-    return ext in previewable_extensions or ext in image_extensions
+    return ext in TEXT_PREVIEW_EXTENSIONS or ext in IMAGE_EXTENSIONS
+
+def is_image(filename):
+    return os.path.splitext(filename.lower())[1] in IMAGE_EXTENSIONS
+
+# 文件内容索引：覆盖可以预览的文本文件，由后台线程维护
+content_index = ContentIndex(CONTENT_INDEX_DB_PATH, UPLOADS_DIR, TEXT_PREVIEW_EXTENSIONS,
+                             max_file_bytes=CONTENT_INDEX_MAX_BYTES, interval=CONTENT_INDEX_INTERVAL)
 
 def get_directory_size(directory):
-    total_size = 0
+    try: return dir_size_cache.get_size(directory)
+    except PermissionError: return -1
+
+def get_path_size(abs_path):
+    """文件或整个目录占用的字节数 (用于配额记账)，无法获取时返回 0，由定期校正修正。"""
     try:
-        for dirpath, _, filenames in os.walk(directory):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                if not os.path.islink(fp):
-                    total_size += os.path.getsize(fp)
-    except PermissionError: return -1 
-    return total_size
+        st = metrics.lstat(abs_path)
+    except OSError:
+        return 0
+    if os.path.isdir(abs_path) and not os.path.islink(abs_path):
+        return max(get_directory_size(abs_path), 0)
+    return st.st_size
+
+# --- 文件变更通知 (保持索引和缓存与文件系统同步) ---
+def notify_created(abs_path, is_dir=False):
+    dir_size_cache.invalidate(os.path.dirname(abs_path))
+    dir_listing_cache.invalidate(os.path.dirname(abs_path))
+    dir_tree_cache.invalidate(os.path.dirname(abs_path))
+    try: name_index.add(abs_path, is_dir)
+    except sqlite3.Error as e: app.logger.warning('更新文件索引失败: %s', e)
+    content_index.mark_dirty(abs_path, recursive=is_dir)
+    try: change_journal.record('put', abs_path, is_dir)
+    except sqlite3.Error as e: app.logger.warning('写入变更记录失败: %s', e)
+
+def notify_removed(abs_path, is_dir=False):
+    dir_size_cache.invalidate(os.path.dirname(abs_path))
+    dir_listing_cache.invalidate(os.path.dirname(abs_path))
+    dir_tree_cache.invalidate(os.path.dirname(abs_path))
+    try:
+        name_index.remove(abs_path)
+        content_index.remove(abs_path)
+    except sqlite3.Error as e: app.logger.warning('更新文件索引失败: %s', e)
+    try: change_journal.record('delete', abs_path, is_dir)
+    except sqlite3.Error as e: app.logger.warning('写入变更记录失败: %s', e)
+
+def notify_moved(old_abs_path, new_abs_path):
+    dir_size_cache.invalidate(os.path.dirname(old_abs_path))
+    dir_size_cache.invalidate(os.path.dirname(new_abs_path))
+    dir_listing_cache.invalidate(os.path.dirname(old_abs_path))
+    dir_listing_cache.invalidate(os.path.dirname(new_abs_path))
+    dir_tree_cache.invalidate(os.path.dirname(old_abs_path))
+    dir_tree_cache.invalidate(os.path.dirname(new_abs_path))
+    try:
+        name_index.move(old_abs_path, new_abs_path)
+        content_index.move(old_abs_path, new_abs_path)
+    except sqlite3.Error as e: app.logger.warning('更新文件索引失败: %s', e)
+    try: change_journal.record('move', new_abs_path, os.path.isdir(new_abs_path), old_abs_path)
+    except sqlite3.Error as e: app.logger.warning('写入变更记录失败: %s', e)
+
+def invalidate_caches(dirs):
+    """失效本进程内存中的目录缓存；dirs 为 None 时全部清空。"""
+    if dirs is None:
+        dir_size_cache.clear()
+        dir_listing_cache.clear()
+        dir_tree_cache.clear()
+        return
+    for directory in dirs:
+        dir_size_cache.invalidate(directory)
+        dir_listing_cache.invalidate(directory)
+        dir_tree_cache.invalidate(directory)
+
+def on_external_changes(dirs):
+    """文件系统监视器的回调 (只在负责后台维护的进程中运行)：dirs 为直接子项发生变化的目录集合，None 表示需要全部失效。"""
+    if dirs is not None:
+        try: dirs = change_journal.without_own_changes(dirs, WATCH_OWN_CHANGE_WINDOW)
+        except sqlite3.Error as e: app.logger.warning('读取变更记录失败: %s', e)
+        if not dirs: return
+    try: change_journal.record_external(dirs)
+    except sqlite3.Error as e: app.logger.warning('写入变更记录失败: %s', e)
+    invalidate_caches(dirs)
+    if dirs is None:
+        name_index.rebuild_async()
+        content_index.mark_dirty(UPLOADS_DIR, recursive=True)
+        return
+    for directory in dirs:
+        content_index.mark_dirty(directory)
+        if name_index.is_rebuilding(): continue
+        try: name_index.sync_dir(directory)
+        except sqlite3.Error as e: app.logger.warning('更新文件索引失败: %s', e)
+
+def on_journal_changes(rows):
+    """
+    每个进程定期读取新的变更记录 (包括其他进程的路由和监视器写入的)，失效受影响目录的内存缓存；
+    负责后台维护的进程还把其他进程新建/覆盖的文件交给内容索引。
+    """
+    dirs = set()
+    for row in rows:
+        if row['op'] == 'reset':
+            invalidate_caches(None)
+            return
+        path = change_journal.to_abs(row['path'])
+        dirs.add(path if row['op'] == 'rescan' else os.path.dirname(path))
+        if row['old_path']: dirs.add(os.path.dirname(change_journal.to_abs(row['old_path'])))
+        if row['op'] in ('put', 'move'): dirs.add(path)  # 目录中已有文件被覆盖时目录 mtime 不变
+        if row['op'] == 'put' and background_lock.held: content_index.mark_dirty(path, recursive=bool(row['is_dir']))
+    invalidate_caches(dirs)
+
+# --- 后台维护 ---
+# 多进程部署时每个工作进程都会导入应用。目录监视 (每个进程各自递归监视会耗尽 inotify 配额) 和内容索引
+# 只由取得文件锁的一个进程负责，锁的持有者退出后 (如 gunicorn 按 max_requests 重启进程) 由其他进程接手；
+# 其他进程通过变更记录得知修改，只失效自己的内存缓存。
+background_lock = ProcessLock(DB_PATH + '-background.lock')
+fs_watcher = None
+
+def start_background_services():
+    def run():
+        global fs_watcher
+        while not background_lock.acquire():
+            time.sleep(BACKGROUND_ELECTION_INTERVAL)
+        app.logger.info('进程 %s 负责目录监视和内容索引', os.getpid())
+        content_index.start()
+        if WATCH_UPLOADS:
+            fs_watcher = FileSystemWatcher(UPLOADS_DIR, on_external_changes, scan_interval=WATCH_SCAN_INTERVAL)
+            fs_watcher.start()
+    threading.Thread(target=run, name='background-election', daemon=True).start()
+
+if not POOL_CHILD and os.path.exists(DB_PATH):
+    change_journal.follow(on_journal_changes, JOURNAL_FOLLOW_INTERVAL)
+    start_background_services()
 
 @app.context_processor
 def inject_user_permissions():
@@ -138,19 +494,103 @@ def upload_files():
             # 基础安全检查，防止路径穿越
             if ".." in filename or filename.startswith("/"):
                 return jsonify({'error': f"文件名 '{filename}' 包含非法字符。"}), 400
-            file.save(os.path.join(upload_path, filename))
+            file_path = os.path.join(upload_path, filename)
+            old_size = get_path_size(file_path) if os.path.isfile(file_path) else 0
+            if blob_store is not None:
+                blob_store.save_stream(file.stream, file_path)
+            else:
+                # 已有文件可能是去重存储中的硬链接，原地覆盖会改掉其他用户的同一份内容
+                if os.path.isfile(file_path) and metrics.stat(file_path).st_nlink > 1: os.remove(file_path)
+                file.save(file_path)
+            quota.adjust(quota.owner_of(file_path), get_path_size(file_path) - old_size)
+            notify_created(file_path)
             
     return jsonify({'message': '上传成功'}), 200
 
+# --- 分块上传 (断点续传) ---
+# 流程：POST /upload/chunked 创建会话 -> 并发 PUT 各分块 -> POST finalize 原子移动到目标位置。
+# 中断后可通过 GET 会话状态得到缺失的分块并继续上传。
+def get_chunked_upload_or_404(upload_id, include_done=False):
+    meta = chunked_uploads.load(upload_id)
+    if meta is None or meta['owner'] != session.get('username'): abort(404)
+    if meta.get('state') == 'done' and not include_done: abort(404)
+    return meta
+
+@app.route('/upload/chunked', methods=['POST'])
+@permission_required('can_upload')
+def chunked_upload_init():
+    upload_path = get_safe_path(request.form.get('destination_path', ''))
+    filename, size = request.form.get('filename', ''), request.form.get('size', type=int)
+    if not filename or size is None or size < 0: return jsonify({'error': '缺少文件名或文件大小'}), 400
+    if ".." in filename or filename.startswith("/") or '/' in filename or '\\' in filename:
+        return jsonify({'error': f"文件名 '{filename}' 包含非法字符。"}), 400
+    if not os.path.isdir(upload_path): return jsonify({'error': '目标路径不是一个有效的文件夹'}), 400
+    if session.get('role') != 'admin' and quota.would_exceed(quota.owner_of(upload_path), size):
+        return jsonify({'error': '超出存储配额，无法上传'}), 413
+    meta = chunked_uploads.create(session['username'], os.path.join(upload_path, filename), size)
+    return jsonify({'upload_id': meta['id'], 'chunk_size': meta['chunk_size'],
+                    'missing': chunked_uploads.missing_chunks(meta)}), 201
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET'])
+@permission_required('can_upload')
+def chunked_upload_status(upload_id):
+    meta = get_chunked_upload_or_404(upload_id)
+    try:
+        missing = chunked_uploads.missing_chunks(meta)
+    except FileNotFoundError:
+        # 会话恰好被完成或取消，暂存文件已移走
+        abort(404)
+    return jsonify({'upload_id': meta['id'], 'size': meta['size'], 'chunk_size': meta['chunk_size'],
+                    'missing': missing})
+
+@app.route('/upload/chunked/<upload_id>/<int:index>', methods=['PUT'])
+@permission_required('can_upload')
+def chunked_upload_put(upload_id, index):
+    meta = get_chunked_upload_or_404(upload_id)
+    if request.content_length is None: return jsonify({'error': '缺少 Content-Length'}), 411
+    try:
+        chunked_uploads.write_chunk(meta, index, request.stream, request.content_length)
+    except ChunkedUploadError as e: return jsonify({'error': str(e)}), 400
+    # 与 finalize/取消并发时暂存文件可能已被移走
+    except FileNotFoundError: return jsonify({'error': '上传会话不存在或已完成'}), 409
+    return jsonify({'index': index}), 200
+
+@app.route('/upload/chunked/<upload_id>/finalize', methods=['POST'])
+@permission_required('can_upload')
+def chunked_upload_finalize(upload_id):
+    get_chunked_upload_or_404(upload_id, include_done=True)
+    # 客户端超时重试的 finalize 可能同时到达多个进程：持有会话的文件锁后重新读取状态，已完成的直接返回成功
+    with chunked_uploads.locked(upload_id) as meta:
+        if meta is None: return jsonify({'error': '上传会话不存在或已取消'}), 404
+        if meta.get('state') == 'done': return jsonify({'message': '上传成功'}), 200
+        dest_path = meta['dest_path']
+        old_size = get_path_size(dest_path) if os.path.isfile(dest_path) else 0
+        owner = quota.owner_of(dest_path)
+        # 创建会话之后其他上传可能已经占用了配额，完成前重新检查
+        if session.get('role') != 'admin' and quota.would_exceed(owner, meta['size'] - old_size):
+            return jsonify({'error': '超出存储配额，无法上传'}), 413
+        try:
+            chunked_uploads.finalize(meta, blob_store)
+        except ChunkedUploadError as e: return jsonify({'error': str(e)}), 409
+        except OSError as e: return jsonify({'error': f"保存文件失败: {e}"}), 500
+        quota.adjust(owner, meta['size'] - old_size)
+    notify_created(dest_path)
+    return jsonify({'message': '上传成功'}), 200
+
+@app.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+@permission_required('can_upload')
+def chunked_upload_abort(upload_id):
+    chunked_uploads.abort(get_chunked_upload_or_404(upload_id))
+    return jsonify({'message': '上传已取消'}), 200
+
 # ... 其余所有路由保持不变 ...
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        conn = get_db_connection()
+        conn = get_db()
         user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         if user and check_password_hash(user['password'], password):
             session.permanent = True
             session['logged_in'] = True
@@ -163,36 +603,29 @@ def login():
             return redirect(url_for('index'))
         else:
             flash('用户名或密码错误', 'danger')
-    conn = get_db_connection()
-    reg_setting = conn.execute("SELECT value FROM settings WHERE key = 'registration_enabled'").fetchone()
-    conn.close()
-    registration_enabled = reg_setting['value'] == 'true' if reg_setting else False
-    return render_template('login.html', registration_enabled=registration_enabled)
+    return render_template('login.html', registration_enabled=is_registration_enabled())
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
-    conn = get_db_connection()
-    reg_setting = conn.execute("SELECT value FROM settings WHERE key = 'registration_enabled'").fetchone()
-    conn.close()
-    registration_enabled = reg_setting['value'] == 'true' if reg_setting else False
-    if not registration_enabled:
+    if not is_registration_enabled():
         flash('管理员已关闭新用户注册功能。', 'warning')
         return redirect(url_for('login'))
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        conn = get_db_connection()
+        conn = get_db()
         try:
             conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, generate_password_hash(password), 'user'))
             conn.commit()
+            invalidate_user_cache()
             os.makedirs(os.path.join(UPLOADS_DIR, username), exist_ok=True)
+            notify_created(os.path.join(UPLOADS_DIR, username), is_dir=True)
             flash('注册成功！请登录。', 'success')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
+            conn.rollback()
             flash('该用户名已被注册。', 'danger')
             return redirect(url_for('register'))
-        finally:
-            conn.close()
     return render_template('register.html')
 
 @app.route('/logout')
@@ -201,42 +634,206 @@ def logout():
     flash('您已登出', 'info')
     return redirect(url_for('login'))
 
+# --- 目录列表 ---
+def encode_listing_cursor(offset, last_name):
+    raw = json.dumps([offset, last_name], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_listing_cursor(cursor):
+    try:
+        offset, last_name = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(offset), str(last_name)
+    except (ValueError, TypeError): abort(400, "无效的分页游标。")
+
+def format_mtime(mtime):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime)) if mtime else ''
+
+def get_listing_page(dir_abs, sort='name', order='asc', cursor=None, limit=LISTING_PAGE_SIZE):
+    """
+    返回 (本页条目, 下一页游标, 条目总数)。游标记录上一页最后一个条目的名称，
+    目录在翻页期间发生变化时从该名称之后继续；名称已不存在时退回到按位置继续。
+    """
+    entries, positions = dir_listing_cache.list_dir(dir_abs, sort, order == 'desc')
+    start = 0
+    if cursor:
+        offset, last_name = decode_listing_cursor(cursor)
+        start = positions[last_name] + 1 if last_name in positions else offset
+    page = entries[start:start + limit]
+    rel_dir = get_relative_path(dir_abs)
+    rel_prefix = '' if rel_dir == '.' else rel_dir + '/'
+    items = [{
+        'name': e.name, 'is_dir': e.is_dir, 'path': rel_prefix + e.name,
+        'size': human_readable_size(e.size), 'bytes': e.size, 'mtime': format_mtime(e.mtime),
+        'previewable': not e.is_dir and is_previewable(e.name),
+        # 缩略图 URL 带上 mtime 和大小作为版本号，内容不变时浏览器可以长期缓存
+        'thumb': url_for('thumbnail', filepath=rel_prefix + e.name, v=f'{int(e.mtime or 0)}-{e.size}')
+                 if not e.is_dir and is_image(e.name) else None
+    } for e in page]
+    end = start + len(page)
+    next_cursor = encode_listing_cursor(end, page[-1].name) if page and end < len(entries) else None
+    return items, next_cursor, len(entries)
+
+def get_listing_args():
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    if sort not in LISTING_SORT_KEYS: sort = 'name'
+    if order not in ('asc', 'desc'): order = 'asc'
+    return sort, order
+
+# --- 条件请求 ---
+# 列表和预览带上由目录/文件 mtime 计算的 ETag，内容未变化时直接返回 304，省去渲染和传输。
+# Cache-Control: private, no-cache 让浏览器保存副本但每次使用前都向服务器确认。
+def listing_etag(dir_abs, *parts):
+    """由目录中每个直接子项的名称、大小和 mtime 计算 ETag，parts 为影响响应内容的其他因素。"""
+    entries, _ = dir_listing_cache.list_dir(dir_abs)
+    digest = hashlib.sha1(ASSET_SIGNATURE.encode())
+    for e in entries:
+        digest.update(f'{e.name}\0{e.size}\0{e.mtime}\n'.encode('utf-8', 'surrogateescape'))
+    digest.update(json.dumps(parts, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def set_revalidate_headers(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None: response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+def not_modified(etag, last_modified=None):
+    return set_revalidate_headers(Response(status=304), etag, last_modified)
+
+@app.url_defaults
+def add_static_version(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = static_assets.version(values['filename'])
+        if version: values['v'] = version
+
+def serve_static(filename):
+    """替换 Flask 默认的静态文件视图：优先发送预压缩版本，带版本参数的 URL 允许长期缓存。"""
+    variant = static_assets.variant(filename, request.accept_encodings)
+    if variant is None:
+        response = app.send_static_file(filename)
+    else:
+        path, encoding = variant
+        mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_file(path, mimetype=mime_type, conditional=True)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # 模板生成的 URL 带 ?v=内容哈希，只有与文件当前的哈希一致时才允许长期缓存；
+    # 过期或随意构造的参数 (以及第三方 CSS 中引用字体的参数) 按普通静态文件处理，由 ETag 验证
+    if request.args.get('v') and request.args.get('v') == static_assets.version(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+app.view_functions['static'] = serve_static
+
 @app.route('/')
 @app.route('/<path:subpath>')
 @login_required
 def index(subpath=''):
     current_path_abs = get_safe_path(subpath)
-    if not os.path.exists(current_path_abs) or not os.path.isdir(current_path_abs):
+    if not os.path.isdir(current_path_abs):
         flash('路径不存在或不是一个目录', 'danger')
         return redirect(url_for('index'))
     breadcrumbs, path_parts = [], subpath.split('/') if subpath else []
     for i, part in enumerate(path_parts):
         if part:
             breadcrumbs.append({'name': part, 'path': '/'.join(path_parts[:i+1])})
-    items = []
+    sort, order = get_listing_args()
+    items, next_cursor, total, etag = [], None, 0, None
     try:
-        for item_name in sorted(os.listdir(current_path_abs)):
-            item_path_abs = os.path.join(current_path_abs, item_name)
-            is_dir = os.path.isdir(item_path_abs)
-            size = None
-            if not is_dir:
-                try: size = os.path.getsize(item_path_abs)
-                except (OSError, FileNotFoundError): pass
-            items.append({
-                'name': item_name, 'is_dir': is_dir, 'path': get_relative_path(item_path_abs),
-                'size': human_readable_size(size), 'previewable': not is_dir and is_previewable(item_name)
-            })
+        # 有待显示的提示消息时页面内容与目录无关，不做条件响应
+        if not session.get('_flashes'):
+            etag = listing_etag(current_path_abs, 'html', sort, order, session['username'],
+                                get_current_user_permissions(), int(time.time() // HTML_ETAG_WINDOW))
+            if request.if_none_match.contains(etag): return not_modified(etag)
+        items, next_cursor, total = get_listing_page(current_path_abs, sort, order)
     except PermissionError:
         flash('没有权限访问该目录', 'danger')
-    items.sort(key=lambda x: (not x['is_dir'], x['name'].lower()))
-    return render_template('index.html', items=items, current_path=subpath, breadcrumbs=breadcrumbs)
+        etag = None
+    response = make_response(render_template('index.html', items=items, current_path=subpath, breadcrumbs=breadcrumbs,
+                                             sort=sort, order=order, next_cursor=next_cursor, total=total))
+    return set_revalidate_headers(response, etag) if etag else response
+
+@app.route('/api/list/')
+@app.route('/api/list/<path:subpath>')
+@login_required
+def api_list_dir(subpath=''):
+    dir_path = get_safe_path(subpath)
+    if not os.path.isdir(dir_path): return jsonify({'error': 'Not a directory'}), 400
+    sort, order = get_listing_args()
+    limit = min(max(request.args.get('limit', LISTING_PAGE_SIZE, type=int), 1), LISTING_MAX_PAGE_SIZE)
+    try:
+        etag = listing_etag(dir_path, 'json', sort, order, request.args.get('cursor'), limit)
+        if request.if_none_match.contains(etag): return not_modified(etag)
+        items, next_cursor, total = get_listing_page(dir_path, sort, order, request.args.get('cursor'), limit)
+    except PermissionError: return jsonify({'error': '没有权限访问该目录'}), 403
+    return set_revalidate_headers(jsonify({'items': items, 'next_cursor': next_cursor, 'total': total}), etag)
 
 @app.route('/search')
 @login_required
 def search():
     query = request.args.get('q', '').strip()
     if not query: return redirect(url_for('index'))
-    results, search_root = [], get_user_base_dir()
+    page = max(request.args.get('page', 1, type=int), 1)
+    search_root = get_user_base_dir()
+    if request.args.get('mode') == 'content':
+        return search_content(query, page, search_root)
+    if not name_index.is_ready():
+        # 索引尚未构建完成时退回到逐目录遍历
+        return render_template('search.html', query=query, results=walk_search(query, search_root), mode='name',
+                               page=1, prev_url=None, next_url=None, index_building=True)
+    # 按索引 id 游标翻页：after/before 为上一页最后/下一页第一个结果的 id，page 只用于显示和限制总数
+    after, before = request.args.get('after', type=int), request.args.get('before', type=int)
+    rows = name_index.search(query, search_root, SEARCH_PER_PAGE + 1, after=after, before=before)
+    if before is not None:
+        has_prev, has_next = len(rows) > SEARCH_PER_PAGE, True
+        rows = rows[-SEARCH_PER_PAGE:]
+    else:
+        has_prev, has_next = after is not None, len(rows) > SEARCH_PER_PAGE
+        rows = rows[:SEARCH_PER_PAGE]
+    if not has_prev: page = 1
+    has_next = has_next and page * SEARCH_PER_PAGE < SEARCH_RESULT_LIMIT
+    base_key = name_index.to_key(search_root)
+    results = []
+    for _, path, name, is_dir in rows:
+        rel_path = path if base_key == '.' else path[len(base_key) + 1:]
+        results.append({'name': name, 'is_dir': bool(is_dir), 'path': rel_path,
+                        'parent': rel_path.rpartition('/')[0]})
+    prev_url = url_for('search', q=query, mode='name', page=page - 1, before=rows[0][0]) if has_prev and rows else None
+    next_url = url_for('search', q=query, mode='name', page=page + 1, after=rows[-1][0]) if has_next and rows else None
+    return render_template('search.html', query=query, results=results, mode='name',
+                           page=page, prev_url=prev_url, next_url=next_url, index_building=False)
+
+def search_content(query, page, search_root):
+    """在当前用户可访问的范围内搜索文本文件内容，结果附带高亮的匹配片段。"""
+    if content_index.query_too_short(query):
+        return render_template('search.html', query=query, results=[], mode='content', page=1, prev_url=None,
+                               next_url=None, index_building=False, min_query_length=MIN_CONTENT_QUERY_LENGTH)
+    offset = (page - 1) * SEARCH_PER_PAGE
+    limit = min(SEARCH_PER_PAGE + 1, max(SEARCH_RESULT_LIMIT - offset, 0))
+    try:
+        rows = content_index.search(query, search_root, limit, offset) if limit else []
+    except sqlite3.OperationalError as e:
+        app.logger.warning('内容搜索失败: %s', e)
+        rows = []
+    base_key = content_index.to_key(search_root)
+    results = []
+    for path, snippet in rows[:SEARCH_PER_PAGE]:
+        rel_path = path if base_key == '.' else path[len(base_key) + 1:]
+        snippet = html.escape(' '.join(snippet.split())).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+        results.append({'name': rel_path.rpartition('/')[2], 'is_dir': False, 'path': rel_path,
+                        'parent': rel_path.rpartition('/')[0], 'snippet': snippet})
+    prev_url = url_for('search', q=query, mode='content', page=page - 1) if page > 1 else None
+    next_url = url_for('search', q=query, mode='content', page=page + 1) if len(rows) > SEARCH_PER_PAGE else None
+    return render_template('search.html', query=query, results=results, mode='content',
+                           page=page, prev_url=prev_url, next_url=next_url, index_building=not content_index.is_ready())
+
+def walk_search(query, search_root):
+    results = []
     for root, dirs, files in os.walk(search_root):
         for name in dirs + files:
             if query.lower() in name.lower():
@@ -246,7 +843,42 @@ def search():
                     'path': get_relative_path(full_path),
                     'parent': get_relative_path(os.path.dirname(full_path))
                 })
-    return render_template('search.html', query=query, results=results)
+                if len(results) >= SEARCH_RESULT_LIMIT: return results
+    return results
+
+def iter_escaped_text(abs_path, start, end):
+    """按块读取 [start, end) 字节，增量解码并转义为 HTML，内存占用与文件大小无关。"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    with open(abs_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(PREVIEW_READ_SIZE, remaining))
+            if not data: break
+            remaining -= len(data)
+            text = decoder.decode(data)
+            if text: yield html.escape(text, quote=False)
+    text = decoder.decode(b'', final=True)
+    if text: yield html.escape(text, quote=False)
+
+def stream_text_preview(abs_path, start, end, nav_html=''):
+    def generate():
+        yield '<!DOCTYPE html><html><head><meta charset="utf-8"></head><body>'
+        yield nav_html
+        yield '<pre style="white-space: pre-wrap;">'
+        yield from iter_escaped_text(abs_path, start, end)
+        yield '</pre></body></html>'
+    return Response(generate(), mimetype='text/html')
+
+def text_preview_nav(filepath, size, start, end, page=None, page_count=None):
+    link = lambda label, **args: f'<a href="{html.escape(url_for("view_file", filepath=filepath, **args))}">{label}</a>'
+    parts = [f'显示第 {start} - {end} 字节，共 {size} 字节']
+    if page is not None:
+        parts.append(f'第 {page} / {page_count} 页')
+        if page > 1: parts += [link('首页', page=1), link('上一页', page=page - 1)]
+        if page < page_count: parts += [link('下一页', page=page + 1), link('末页', page=page_count)]
+    parts += [link('开头 256 KB', mode='head', kb=256), link('末尾 256 KB', mode='tail', kb=256), link('原始文件', raw=1)]
+    return '<div style="font-family: sans-serif; font-size: 0.9em; padding: 4px 0;">' + ' | '.join(parts) + '</div>'
 
 @app.route('/view/<path:filepath>')
 @login_required
@@ -255,67 +887,163 @@ def view_file(filepath):
     if not os.path.exists(abs_path): abort(404)
     mime_type, _ = mimetypes.guess_type(abs_path)
     if mime_type and mime_type.startswith('image/'):
-        return send_from_directory(os.path.dirname(abs_path), os.path.basename(abs_path))
+        return send_user_file(abs_path)
     elif mime_type and (mime_type.startswith('text/') or _ == 'gzip'):
-        try:
-            with open(abs_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            return Response(f"<pre>{content}</pre>", mimetype='text/html')
-        except Exception: return "无法读取文件内容。", 500
+        if not os.path.isfile(abs_path): abort(404)
+        if request.args.get('raw'):
+            # 原始文本，支持 HTTP Range 请求，由客户端自行按区间读取
+            return send_user_file(abs_path, mimetype='text/plain; charset=utf-8')
+        try: st = metrics.stat(abs_path)
+        except OSError: return "无法读取文件内容。", 500
+        size = st.st_size
+        # 预览内容只取决于文件本身和查询参数
+        etag = hashlib.sha1(f'{st.st_mtime_ns}-{size}-{request.query_string.decode("latin-1")}'.encode()).hexdigest()
+        last_modified = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return not_modified(etag, last_modified)
+        mode = request.args.get('mode')
+        if mode in ('head', 'tail'):
+            length = min(max(request.args.get('kb', 256, type=int), 1), PREVIEW_MAX_KB) * 1024
+            start, end = (0, min(length, size)) if mode == 'head' else (max(size - length, 0), size)
+            response = stream_text_preview(abs_path, start, end, text_preview_nav(filepath, size, start, end))
+        elif size <= PREVIEW_FULL_LIMIT and 'page' not in request.args:
+            response = stream_text_preview(abs_path, 0, size)
+        else:
+            page_count = max((size + PREVIEW_PAGE_SIZE - 1) // PREVIEW_PAGE_SIZE, 1)
+            page = min(max(request.args.get('page', 1, type=int), 1), page_count)
+            start = (page - 1) * PREVIEW_PAGE_SIZE
+            end = min(start + PREVIEW_PAGE_SIZE, size)
+            response = stream_text_preview(abs_path, start, end, text_preview_nav(filepath, size, start, end, page, page_count))
+        return set_revalidate_headers(response, etag, last_modified)
     else: return "此文件类型无法预览。", 415
 
+@app.route('/thumb/<path:filepath>')
+@login_required
+def thumbnail(filepath):
+    abs_path = get_safe_path(filepath)
+    if not os.path.isfile(abs_path): abort(404)
+    if not is_image(abs_path): return "此文件类型没有缩略图。", 415
+    thumb_path = None
+    if thumbnails.available and not abs_path.lower().endswith('.svg'):
+        try:
+            thumb_path = thumbnails.get(abs_path)
+        except ThumbnailPending:
+            # 缓存冷启动时生成排队较久：让浏览器稍后重试，不能把原图当作缩略图发送
+            response = make_response('缩略图正在生成，请稍后重试。', 503)
+            response.headers['Retry-After'] = str(THUMBNAIL_RETRY_AFTER)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+    if thumb_path is None:
+        # SVG、未安装 Pillow 或无法解码时退回原图，按普通文件重新验证，不长期缓存
+        return send_user_file(abs_path)
+    response = send_from_directory(*os.path.split(thumb_path))
+    if request.args.get('v'):
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+def send_user_file(abs_path, mimetype=None, as_attachment=False):
+    """发送用户文件；开启 SENDFILE_MODE 且文件足够大时只返回响应头，文件内容由前端服务器发送。"""
+    directory, name = os.path.split(abs_path)
+    if not SENDFILE_MODE or os.path.getsize(abs_path) < SENDFILE_MIN_SIZE:
+        return send_from_directory(directory, name, mimetype=mimetype, as_attachment=as_attachment)
+    response = send_file_offloaded(abs_path, request.environ, mimetype=mimetype, as_attachment=as_attachment,
+                                   use_x_sendfile=True, conditional=False)
+    # 响应体为空，Content-Length 由前端服务器按实际发送的内容设置
+    del response.headers['Content-Length']
+    if SENDFILE_MODE == 'x-accel':
+        del response.headers['X-Sendfile']
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + quote(os.path.relpath(abs_path, UPLOADS_DIR).replace(os.sep, '/'))
+    else:
+        # WSGI 响应头只能是 latin-1 字符串，非 ASCII 路径按原始字节传递给前端服务器
+        response.headers['X-Sendfile'] = os.fsencode(abs_path).decode('latin-1')
+    return response
+
+def zip_response(roots, archive_name):
+    response = Response(iter_zip(roots), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f"attachment; filename=\"download.zip\"; filename*=UTF-8''{quote(archive_name)}"
+    # 禁止反向代理缓冲，使打包数据边生成边发送
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/download/<path:filepath>')
 @login_required
 def download_file(filepath):
     abs_path = get_safe_path(filepath)
+    if os.path.isdir(abs_path):
+        name = os.path.basename(abs_path.rstrip(os.sep)) or 'download'
+        return zip_response([(abs_path, name)], f'{name}.zip')
     if not os.path.isfile(abs_path): abort(404)
-    return send_from_directory(os.path.dirname(abs_path), os.path.basename(abs_path), as_attachment=True)
+    return send_user_file(abs_path, as_attachment=True)
+
+@app.route('/download_zip', methods=['POST'])
+@login_required
+def download_zip():
+    subpath, items = request.form.get('current_path', ''), request.form.getlist('items[]')
+    if not items: return jsonify({'error': '没有选择要下载的项目'}), 400
+    roots = []
+    for item_name in items:
+        item_path = get_safe_path(os.path.join(subpath, item_name))
+        if not os.path.exists(item_path): return jsonify({'error': f"'{item_name}' 不存在"}), 404
+        roots.append((item_path, os.path.basename(item_path)))
+    folder_name = os.path.basename(get_safe_path(subpath).rstrip(os.sep)) if subpath else 'download'
+    return zip_response(roots, f'{folder_name or "download"}.zip')
 
 @app.route('/admin')
 @admin_required
 def admin_panel():
-    conn = get_db_connection()
+    conn = get_db()
+    # 已用空间由各路由增量维护，直接从 users 表读取，无需遍历用户目录
     users = conn.execute('SELECT * FROM users').fetchall()
-    reg_setting = conn.execute("SELECT value FROM settings WHERE key = 'registration_enabled'").fetchone()
-    conn.close()
-    registration_enabled = reg_setting['value'] == 'true' if reg_setting else False
-    return render_template('admin.html', users=users, registration_enabled=registration_enabled)
+    return render_template('admin.html', users=users, registration_enabled=is_registration_enabled(),
+                           format_size=human_readable_size)
 
 @app.route('/admin/toggle_registration', methods=['POST'])
 @admin_required
 def toggle_registration():
     is_enabled = request.form.get('enabled') == 'true'
-    conn = get_db_connection()
+    conn = get_db()
     conn.execute("UPDATE settings SET value = ? WHERE key = 'registration_enabled'", (str(is_enabled).lower(),))
     conn.commit()
-    conn.close()
+    invalidate_settings_cache()
     return jsonify({'message': '注册设置已更新'})
 
+@app.route('/admin/rebuild_index', methods=['POST'])
+@admin_required
+def rebuild_index():
+    if not name_index.rebuild_async(): return jsonify({'error': '索引正在重建中，请稍后再试'}), 409
+    return jsonify({'message': '已开始在后台重建文件索引'}), 202
+
 @app.route('/admin/add_user', methods=['POST'])
 @admin_required
 def add_user():
     username, password, role = request.form.get('username'), request.form.get('password'), request.form.get('role', 'user')
     if not username or not password: return jsonify({'error': '用户名和密码不能为空'}), 400
     if role not in ['admin', 'user']: return jsonify({'error': '无效的角色'}), 400
-    conn = get_db_connection()
+    conn = get_db()
     try:
-        conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, generate_password_hash(password), role))
+        user_id = conn.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, generate_password_hash(password), role)).lastrowid
         conn.commit()
-        if role == 'user': os.makedirs(os.path.join(UPLOADS_DIR, username), exist_ok=True)
-        user_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        invalidate_user_cache()
+        if role == 'user':
+            os.makedirs(os.path.join(UPLOADS_DIR, username), exist_ok=True)
+            notify_created(os.path.join(UPLOADS_DIR, username), is_dir=True)
         return jsonify({'message': '用户添加成功', 'user': {'id': user_id, 'username': username, 'role': role}}), 201
-    except sqlite3.IntegrityError: return jsonify({'error': '用户名已存在'}), 409
-    finally: conn.close()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify({'error': '用户名已存在'}), 409
 
 @app.route('/admin/edit_user/<int:user_id>', methods=['POST'])
 @admin_required
 def edit_user(user_id):
     username, password, role = request.form.get('username'), request.form.get('password'), request.form.get('role', 'user')
     if not username or role not in ['admin', 'user']: return jsonify({'error': '无效的用户名或角色'}), 400
-    conn = get_db_connection()
+    current_user_id = get_user_row(session['username'])['id']
+    if user_id == current_user_id and role == 'user': return jsonify({'error': '不能将自己的角色从管理员降级'}), 403
+    quota_mb = request.form.get('quota_mb', type=float)
+    if request.form.get('quota_mb') and (quota_mb is None or not math.isfinite(quota_mb) or not 0 <= quota_mb <= MAX_QUOTA_MB):
+        return jsonify({'error': f'存储配额必须是 0 到 {MAX_QUOTA_MB} 之间的数字 (MB)'}), 400
+    conn = get_db()
     try:
-        current_user_id = conn.execute('SELECT id FROM users WHERE username = ?', (session['username'],)).fetchone()['id']
-        if user_id == current_user_id and role == 'user': return jsonify({'error': '不能将自己的角色从管理员降级'}), 403
         sql = "UPDATE users SET username = ?, role = ?, can_upload = ?, can_delete = ?, can_rename = ?, can_move = ?, can_create_folder = ?"
         params = [
             username, role, request.form.get('can_upload') == 'true', request.form.get('can_delete') == 'true',
@@ -324,30 +1052,37 @@ def edit_user(user_id):
         if password:
             sql += ", password = ?"
             params.append(generate_password_hash(password))
+        if quota_mb is not None:
+            sql += ", quota_bytes = ?"
+            params.append(int(quota_mb * 1024 * 1024))
         sql += " WHERE id = ?"
         params.append(user_id)
         conn.execute(sql, tuple(params))
         conn.commit()
+        invalidate_user_cache()
         return jsonify({'message': '用户更新成功'}), 200
-    except sqlite3.IntegrityError: return jsonify({'error': '用户名已存在'}), 409
-    finally: conn.close()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify({'error': '用户名已存在'}), 409
 
 @app.route('/admin/delete_user/<int:user_id>', methods=['POST'])
 @admin_required
 def delete_user(user_id):
-    conn = get_db_connection()
-    user_to_delete = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    current_user_id = conn.execute('SELECT id FROM users WHERE username = ?', (session['username'],)).fetchone()['id']
-    if user_id == current_user_id:
-        conn.close()
+    if user_id == get_user_row(session['username'])['id']:
         return jsonify({'error': '不能删除自己'}), 403
+    conn = get_db()
+    user_to_delete = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
     if user_to_delete:
         conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
         conn.commit()
+        invalidate_user_cache()
         if user_to_delete['role'] == 'user':
             user_dir = os.path.join(UPLOADS_DIR, user_to_delete['username'])
-            if os.path.exists(user_dir): shutil.rmtree(user_dir)
-    conn.close()
+            if os.path.exists(user_dir):
+                # 用户目录可能很大，在后台删除
+                job_id = jobs.submit(session['username'], 'delete_user', [(user_to_delete['username'], user_dir)],
+                                     remove_path, lambda ok, errors: summarize_job(ok, errors, 'deleted', '用户文件已删除', '用户文件删除失败'))
+                return jsonify({'message': '用户删除成功，其文件正在后台清理', 'job_id': job_id}), 202
     return jsonify({'message': '用户删除成功'}), 200
 
 @app.route('/create_folder', methods=['POST'])
@@ -360,25 +1095,58 @@ def create_folder():
     if os.path.exists(new_folder_path_abs): return jsonify({'error': f"创建失败： '{folder_name}' 已存在"}), 409
     try:
         os.makedirs(new_folder_path_abs)
+        notify_created(new_folder_path_abs, is_dir=True)
         new_folder_path_rel = get_relative_path(new_folder_path_abs)
-        return jsonify({'message': f"文件夹 '{folder_name}' 创建成功", 'item': {'name': folder_name, 'is_dir': True, 'path': new_folder_path_rel, 'size': '-', 'previewable': False}}), 201
+        return jsonify({'message': f"文件夹 '{folder_name}' 创建成功", 'item': {'name': folder_name, 'is_dir': True, 'path': new_folder_path_rel, 'size': '-', 'mtime': format_mtime(time.time()), 'previewable': False}}), 201
     except OSError as e: return jsonify({'error': f"创建文件夹失败: {e}"}), 500
 
+# --- 后台批量操作 ---
+# 路径在请求中解析和校验 (get_safe_path 依赖当前用户)，实际的文件操作在后台任务中逐项执行。
+def summarize_job(success_list, error_list, key, message, partial_error):
+    if not error_list: return 200, {'message': message, key: success_list}
+    return 207, {'error': partial_error, key: success_list, 'errors': error_list}
+
+def remove_path(item_path):
+    size = get_path_size(item_path)
+    is_dir = False
+    if os.path.isfile(item_path) or os.path.islink(item_path):
+        st = metrics.lstat(item_path)
+        os.remove(item_path)
+        if blob_store is not None: blob_store.release(st)
+    elif os.path.isdir(item_path):
+        is_dir = True
+        linked = blob_store.linked_files(item_path) if blob_store is not None else []
+        try:
+            shutil.rmtree(item_path)
+        finally:
+            # 中途失败时已删除的文件也要释放；仍被引用的 blob 不会被删除
+            for st in linked: blob_store.release(st)
+    quota.adjust(quota.owner_of(item_path), -size)
+    notify_removed(item_path, is_dir)
+
+def move_path(args):
+    source_item_path, dest_path_abs = args
+    dest_item_path = os.path.join(dest_path_abs, os.path.basename(source_item_path))
+    if not os.path.exists(source_item_path): raise ValueError('源文件不存在')
+    if os.path.abspath(source_item_path) == os.path.abspath(dest_path_abs): raise ValueError('无法将文件夹移动到其自身')
+    if os.path.abspath(dest_path_abs).startswith(os.path.abspath(source_item_path) + os.sep): raise ValueError('无法移动到其子目录中')
+    if os.path.exists(dest_item_path): raise ValueError('目标位置已存在同名项目')
+    old_owner, new_owner = quota.owner_of(source_item_path), quota.owner_of(dest_path_abs)
+    size = get_path_size(source_item_path) if old_owner != new_owner else 0
+    shutil.move(source_item_path, dest_path_abs)
+    quota.adjust(old_owner, -size)
+    quota.adjust(new_owner, size)
+    notify_moved(source_item_path, dest_item_path)
+
 @app.route('/delete', methods=['POST'])
 @permission_required('can_delete')
 def delete_items():
     subpath, items_to_delete = request.form.get('current_path', ''), request.form.getlist('items[]')
     if not items_to_delete: return jsonify({'error': '没有选择要删除的项目'}), 400
-    success_list, error_list = [], []
-    for item_name in items_to_delete:
-        item_path = get_safe_path(os.path.join(subpath, item_name))
-        try:
-            if os.path.isfile(item_path) or os.path.islink(item_path): os.remove(item_path)
-            elif os.path.isdir(item_path): shutil.rmtree(item_path)
-            success_list.append(item_name)
-        except Exception as e: error_list.append({'name': item_name, 'error': str(e)})
-    if not error_list: return jsonify({'message': '所有选中项目已成功删除', 'deleted': success_list}), 200
-    else: return jsonify({'error': '部分项目删除失败', 'deleted': success_list, 'errors': error_list}), 207
+    items = [(item_name, get_safe_path(os.path.join(subpath, item_name))) for item_name in items_to_delete]
+    job_id = jobs.submit(session['username'], 'delete', items, remove_path,
+                         lambda ok, errors: summarize_job(ok, errors, 'deleted', '所有选中项目已成功删除', '部分项目删除失败'))
+    return jsonify({'message': '删除任务已开始', 'job_id': job_id}), 202
 
 @app.route('/rename', methods=['POST'])
 @permission_required('can_rename')
@@ -392,6 +1160,7 @@ def rename_item():
     if os.path.exists(new_path): return jsonify({'error': f"重命名失败：目标 '{new_name}' 已存在"}), 409
     try:
         os.rename(old_path, new_path)
+        notify_moved(old_path, new_path)
         return jsonify({'message': f"'{old_name}' 已成功重命名为 '{new_name}'"}), 200
     except OSError as e: return jsonify({'error': f"重命名时出错: {e}"}), 500
 
@@ -402,20 +1171,57 @@ def move_items():
     if not items_to_move or destination_folder is None: return jsonify({'error': '未选择项目或目标目录'}), 400
     dest_path_abs = get_safe_path(destination_folder)
     if not os.path.isdir(dest_path_abs): return jsonify({'error': '目标路径不是一个有效的文件夹'}), 400
-    success_list, error_list = [], []
-    for item_name in items_to_move:
-        source_item_path = get_safe_path(os.path.join(current_path, item_name))
-        dest_item_path = os.path.join(dest_path_abs, item_name)
-        if not os.path.exists(source_item_path): error_list.append({'name': item_name, 'error': '源文件不存在'}); continue
-        if os.path.abspath(source_item_path) == os.path.abspath(dest_path_abs): error_list.append({'name': item_name, 'error': '无法将文件夹移动到其自身'}); continue
-        if os.path.abspath(dest_path_abs).startswith(os.path.abspath(source_item_path) + os.sep): error_list.append({'name': item_name, 'error': '无法移动到其子目录中'}); continue
-        if os.path.exists(dest_item_path): error_list.append({'name': item_name, 'error': '目标位置已存在同名项目'}); continue
-        try:
-            shutil.move(source_item_path, dest_path_abs)
-            success_list.append(item_name)
-        except Exception as e: error_list.append({'name': item_name, 'error': str(e)})
-    if not error_list: return jsonify({'message': '所有选中项目已成功移动', 'moved': success_list}), 200
-    else: return jsonify({'error': '部分项目移动失败', 'moved': success_list, 'errors': error_list}), 207
+    items = [(item_name, (get_safe_path(os.path.join(current_path, item_name)), dest_path_abs)) for item_name in items_to_move]
+    job_id = jobs.submit(session['username'], 'move', items, move_path,
+                         lambda ok, errors: summarize_job(ok, errors, 'moved', '所有选中项目已成功移动', '部分项目移动失败'))
+    return jsonify({'message': '移动任务已开始', 'job_id': job_id}), 202
+
+# --- 同步接口 ---
+@app.route('/api/sync/manifest')
+@login_required
+def api_sync_manifest():
+    """
+    以 NDJSON 流式返回目录下所有条目的路径、大小和 mtime；hash=1 时附带文件的 sha256，recursive=0 时只列出直接子项。
+    响应头 X-Sync-Cursor 为生成清单之前的游标，之后用它调用 /api/sync/changes。
+    """
+    subpath = request.args.get('path', '').strip('/')
+    dir_path = get_safe_path(subpath)
+    if not os.path.isdir(dir_path): return jsonify({'error': 'Not a directory'}), 400
+    hash_db_path = DB_PATH if request.args.get('hash') == '1' else None
+    response = Response(iter_manifest(dir_path, request.args.get('recursive') != '0', hash_db_path),
+                        mimetype='application/x-ndjson')
+    response.headers['X-Sync-Cursor'] = str(change_journal.current_cursor())
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/sync/changes')
+@login_required
+def api_sync_changes():
+    """返回游标之后 path 范围内的变更；游标过期时返回 410，客户端应重新获取清单。"""
+    subpath = request.args.get('path', '').strip('/')
+    dir_path = get_safe_path(subpath)
+    cursor = request.args.get('cursor', type=int)
+    if cursor is None: return jsonify({'error': '缺少 cursor 参数'}), 400
+    limit = min(max(request.args.get('limit', SYNC_CHANGES_PAGE_SIZE, type=int), 1), SYNC_CHANGES_MAX_PAGE_SIZE)
+    try:
+        changes, next_cursor, has_more = change_journal.changes(dir_path, cursor, limit)
+    except CursorExpired:
+        return jsonify({'error': '游标已过期，请重新获取清单', 'cursor': change_journal.current_cursor()}), 410
+    return jsonify({'changes': changes, 'cursor': next_cursor, 'has_more': has_more})
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None or (job['owner'] != session['username'] and session.get('role') != 'admin'):
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({k: job[k] for k in ('id', 'kind', 'status', 'total', 'done', 'result')})
+
+@app.route('/metrics')
+@admin_required
+def metrics_endpoint():
+    body = metrics_collector.render() if metrics_collector is not None else metrics.registry.render()
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/get_dir_size/<path:subpath>')
 @login_required
@@ -426,25 +1232,41 @@ def api_get_dir_size(subpath):
     if size_in_bytes == -1: return jsonify({'size': '无权限'})
     return jsonify({'size': human_readable_size(size_in_bytes)})
 
+def build_dir_tree(dir_abs, rel_path, depth):
+    """从目录树缓存构建 dir_abs 下 depth 层的子目录节点，depth 为 None 时展开全部层级。"""
+    nodes = []
+    for name in dir_tree_cache.subdirs(dir_abs):
+        child_abs = os.path.join(dir_abs, name)
+        child_rel = f"{rel_path}/{name}" if rel_path else name
+        node = {'name': name, 'path': child_rel}
+        if depth is None or depth > 1:
+            node['children'] = build_dir_tree(child_abs, child_rel, None if depth is None else depth - 1)
+            node['has_children'] = bool(node['children'])
+        else:
+            node['has_children'] = bool(dir_tree_cache.subdirs(child_abs))
+        nodes.append(node)
+    return nodes
+
+@app.route('/api/dir_tree')
+@login_required
+def api_dir_tree():
+    subpath = request.args.get('path', '').strip('/')
+    dir_path = get_safe_path(subpath)
+    if not os.path.isdir(dir_path): return jsonify({'error': 'Not a directory'}), 400
+    depth = min(max(request.args.get('depth', 1, type=int), 1), DIR_TREE_MAX_DEPTH)
+    rel_path = get_relative_path(dir_path)
+    rel_path = '' if rel_path == '.' else rel_path
+    return jsonify({'path': rel_path, 'children': build_dir_tree(dir_path, rel_path, depth)})
+
 @app.route('/api/get_dirs')
 @login_required
 def api_get_dirs():
-    user_base_dir = get_user_base_dir()
-    def get_dir_tree_api(start_path):
-        tree, rel_start_path = [], os.path.relpath(start_path, user_base_dir)
-        try:
-            for item in sorted(os.listdir(start_path)):
-                abs_item_path = os.path.join(start_path, item)
-                if os.path.isdir(abs_item_path):
-                    relative_item_path = get_relative_path(abs_item_path)
-                    dir_node = {'name': item, 'path': relative_item_path, 'children': get_dir_tree_api(abs_item_path)}
-                    tree.append(dir_node)
-        except FileNotFoundError: pass
-        return tree
-    return jsonify(get_dir_tree_api(user_base_dir))
+    # 完整目录树，保留给依赖旧接口的脚本；页面中的目录选择器改用 /api/dir_tree 按需加载
+    return jsonify(build_dir_tree(get_user_base_dir(), '', None))
 
 if __name__ == '__main__':
     if not os.path.exists(DB_PATH):
         print("="*50); print("警告: 数据库 'file_manager.db' 不存在。"); print("请先运行 'python database.py' 来初始化数据库。"); print("="*50)
     else:
+        # 开发服务器，只用于调试；生产环境使用 gunicorn -c gunicorn.conf.py wsgi:app
         app.run(debug=True, host='0.0.0.0', port=80)
\ No newline at end of file
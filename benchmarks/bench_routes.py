@@ -0,0 +1,241 @@
+"""
+文件路由性能基准测试。
+
+在临时目录中生成几类合成目录树 (很宽的目录、很深的目录树、大量小文件、少量大文件)，
+通过环境变量让应用使用临时的 UPLOADS_DIR 和数据库，再用 Flask test client 并发请求各个路由，
+输出延迟百分位、吞吐量和峰值内存 (RSS)，结果写入 JSON 文件以便在不同提交之间对比。
+
+用法:
+    python benchmarks/bench_routes.py                       # 默认规模
+    python benchmarks/bench_routes.py --scale 0.1 -n 50     # 快速检查
+    python benchmarks/bench_routes.py -o before.json --scenarios wide deep
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('wide', 'deep', 'small', 'huge')
+SEED = 20240101
+
+
+# --- 合成目录树 ---
+def make_wide(root, scale):
+    """一个目录下直接放大量文件和子目录。"""
+    base = os.path.join(root, 'wide')
+    os.makedirs(base)
+    for i in range(int(20000 * scale)):
+        with open(os.path.join(base, f'file_{i:06d}.txt'), 'w') as f: f.write(f'wide {i}\n')
+    for i in range(int(500 * scale)):
+        os.makedirs(os.path.join(base, f'dir_{i:04d}'))
+    return base
+
+def make_deep(root, scale):
+    """分支为 3 的多层目录树，每个目录放两个文件。"""
+    base = os.path.join(root, 'deep')
+    depth = max(2, round(7 * min(scale, 1) ** 0.25))
+    stack = [(base, 0)]
+    while stack:
+        path, level = stack.pop()
+        os.makedirs(path, exist_ok=True)
+        for i in range(2):
+            with open(os.path.join(path, f'note_{level}_{i}.md'), 'w') as f: f.write('deep\n' * 20)
+        if level < depth:
+            stack.extend((os.path.join(path, f'level{level}_{b}'), level + 1) for b in range(3))
+    return base
+
+def make_small(root, scale):
+    """大量小文件分散在多个目录中。"""
+    base = os.path.join(root, 'small')
+    rng = random.Random(SEED)
+    dirs = max(1, int(100 * scale))
+    for d in range(dirs):
+        path = os.path.join(base, f'batch_{d:03d}')
+        os.makedirs(path)
+        for i in range(500):
+            with open(os.path.join(path, f'item_{d:03d}_{i:04d}.txt'), 'w') as f:
+                f.write('x' * rng.randint(10, 4000))
+    return base
+
+def make_huge(root, scale):
+    """少量大文本文件 (用于预览) 以及一个稀疏的超大文件。"""
+    base = os.path.join(root, 'huge')
+    os.makedirs(base)
+    line = ('0123456789 abcdefghijklmnopqrstuvwxyz 中文内容 <tag> & ' * 2 + '\n').encode('utf-8')
+    block = line * (1024 * 1024 // len(line))
+    for i in range(2):
+        with open(os.path.join(base, f'big_{i}.txt'), 'wb') as f:
+            for _ in range(max(1, int(32 * scale))): f.write(block)
+    with open(os.path.join(base, 'sparse.bin'), 'wb') as f:
+        f.truncate(int(4 * 1024 ** 3 * scale))
+    return base
+
+MAKERS = {'wide': make_wide, 'deep': make_deep, 'small': make_small, 'huge': make_huge}
+
+
+# --- 每个场景要测量的请求 ---
+def scenario_requests(name, base, uploads_dir):
+    rel = os.path.relpath(base, uploads_dir).replace(os.sep, '/')
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def upload():
+        with lock: n = next(counter)
+        data = {'destination_path': rel, 'files[]': (io.BytesIO(b'u' * 16384), f'bench_upload_{n}.bin')}
+        return 'POST', '/upload/', {'data': data, 'content_type': 'multipart/form-data'}
+
+    routes = {
+        'index': lambda: ('GET', f'/{rel}', {}),
+        'search': lambda: ('GET', '/search?q=' + {'wide': 'file_0001', 'deep': 'note_3', 'small': 'item_042', 'huge': 'big'}[name], {}),
+        'api_get_dirs': lambda: ('GET', '/api/get_dirs', {}),
+        'api_get_dir_size': lambda: ('GET', f'/api/get_dir_size/{rel}', {}),
+        'upload_files': upload,
+    }
+    preview = {'wide': 'file_000001.txt', 'deep': 'note_0_0.md', 'small': 'batch_000/item_000_0000.txt', 'huge': 'big_0.txt'}[name]
+    routes['view_file'] = lambda: ('GET', f'/view/{rel}/{preview}', {})
+    return routes
+
+
+# --- 负载生成 ---
+def percentile(sorted_values, pct):
+    if not sorted_values: return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def login(app_module):
+    client = app_module.app.test_client()
+    r = client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    if r.status_code != 302: raise RuntimeError('基准测试登录失败')
+    return client
+
+def run_route(app_module, make_request, total, concurrency):
+    local = threading.local()
+
+    def one(_):
+        client = getattr(local, 'client', None)
+        if client is None: client = local.client = login(app_module)
+        method, url, kwargs = make_request()
+        start = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        for _ in response.response: pass  # 读完流式响应体
+        elapsed = time.perf_counter() - start
+        response.close()
+        return elapsed, response.status_code < 400
+
+    # 第一次请求单独计时 (冷缓存)，随后并发压测
+    cold, ok = one(None)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    latencies = sorted(r[0] * 1000 for r in results)
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': sum(1 for r in results if not r[1]) + (0 if ok else 1),
+        'cold_ms': round(cold * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'throughput_rps': round(total / wall, 2),
+    }
+
+def peak_rss_kb():
+    if resource is None: return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss  # macOS 以字节为单位，Linux 为 KB
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文件路由性能基准测试')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--scale', type=float, default=1.0, help='目录树规模系数')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='每个路由的请求数')
+    parser.add_argument('-c', '--concurrency', type=int, default=8)
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--keep', action='store_true', help='保留临时目录')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='file-manager-bench-')
+    uploads_dir = os.path.join(workdir, 'uploads')
+    os.makedirs(uploads_dir)
+    # 必须在导入应用之前设置，应用和数据库模块在导入时读取这些路径
+    os.environ['FILE_MANAGER_DATA_DIR'] = workdir
+    os.environ['FILE_MANAGER_UPLOADS_DIR'] = uploads_dir
+    os.environ['FILE_MANAGER_DB_PATH'] = os.path.join(workdir, 'file_manager.db')
+    sys.path.insert(0, REPO_DIR)
+    try:
+        bases, setup = {}, {}
+        for name in args.scenarios:
+            start = time.perf_counter()
+            bases[name] = MAKERS[name](uploads_dir, args.scale)
+            setup[name] = round(time.perf_counter() - start, 3)
+            print(f'生成 {name} 目录树用时 {setup[name]}s', file=sys.stderr)
+
+        import database
+        database.migrate(database.DB_PATH)
+        database.close_connections()
+        import app as app_module
+        app_module.app.config['WTF_CSRF_ENABLED'] = False
+        start = time.perf_counter()
+        while not app_module.name_index.is_ready(): time.sleep(0.1)
+        index_seconds = round(time.perf_counter() - start, 3)
+
+        results = []
+        for name in args.scenarios:
+            for route, make_request in scenario_requests(name, bases[name], uploads_dir).items():
+                stats = run_route(app_module, make_request, args.requests, args.concurrency)
+                results.append({'scenario': name, 'route': route, **stats})
+                print(f"{name:6} {route:17} p50={stats['p50_ms']:9.2f}ms p95={stats['p95_ms']:9.2f}ms "
+                      f"p99={stats['p99_ms']:9.2f}ms {stats['throughput_rps']:8.1f} req/s errors={stats['errors']}", file=sys.stderr)
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'scale': args.scale,
+                'requests': args.requests,
+                'concurrency': args.concurrency,
+            },
+            'setup_seconds': setup,
+            'index_build_seconds': index_seconds,
+            'peak_rss_kb': peak_rss_kb(),
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'结果已写入 {args.output}', file=sys.stderr)
+    finally:
+        if args.keep: print(f'临时目录: {workdir}', file=sys.stderr)
+        else: shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
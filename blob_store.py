@@ -0,0 +1,153 @@
+import os
+import errno
+import shutil
+import hashlib
+import threading
+import uuid
+import database
+
+# --- 内容寻址存储 (去重) ---
+# 上传的文件按 SHA-256 保存在 store_dir/ab/cd/<digest> 中，用户目录里的文件是指向它的硬链接，
+# 因此相同内容只占一份磁盘空间。引用计数直接使用 inode 的链接数：blob 自身占一个链接，
+# st_nlink == 1 表示已没有用户文件引用它，可以回收。移动/重命名不改变 inode，无需额外处理。
+# 注意：硬链接共享同一份数据，写入用户路径时必须先写临时文件再 os.replace，不能原地截断。
+
+READ_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    def __init__(self, store_dir, db_path):
+        self.store_dir = store_dir
+        self.tmp_dir = os.path.join(store_dir, 'tmp')
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    @staticmethod
+    def same_filesystem(store_dir, target_dir):
+        """store_dir 与用户目录 target_dir 是否位于同一文件系统 (只有这样才能建立硬链接)。"""
+        os.makedirs(store_dir, exist_ok=True)
+        return os.stat(store_dir).st_dev == os.stat(target_dir).st_dev
+
+    def _db(self):
+        return database.get_connection(self.db_path)
+
+    def blob_path(self, digest):
+        return os.path.join(self.store_dir, digest[:2], digest[2:4], digest)
+
+    def _tmp_path(self, directory):
+        return os.path.join(directory, f'.{uuid.uuid4().hex}.tmp')
+
+    # --- 写入 ---
+    def save_stream(self, stream, dest_path):
+        """边读取边计算哈希，把上传流保存为 blob 并链接到 dest_path。"""
+        tmp_path, digest = self._tmp_path(self.tmp_dir), hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                while True:
+                    data = stream.read(READ_SIZE)
+                    if not data: break
+                    digest.update(data)
+                    f.write(data)
+            self._store(tmp_path, digest.hexdigest(), dest_path)
+        finally:
+            try: os.remove(tmp_path)
+            except FileNotFoundError: pass
+
+    def save_file(self, src_path, dest_path):
+        """把已经写完的文件 (如分块上传的暂存文件) 存入 blob 并链接到 dest_path，src_path 会被移走或删除。"""
+        digest = hashlib.sha256()
+        with open(src_path, 'rb') as f:
+            while True:
+                data = f.read(READ_SIZE)
+                if not data: break
+                digest.update(data)
+        try:
+            self._store(src_path, digest.hexdigest(), dest_path)
+        finally:
+            try: os.remove(src_path)
+            except FileNotFoundError: pass
+
+    def _store(self, src_path, digest, dest_path):
+        blob = self.blob_path(digest)
+        for _ in range(2):
+            with self._lock:
+                if not os.path.exists(blob):
+                    os.makedirs(os.path.dirname(blob), exist_ok=True)
+                    try:
+                        os.replace(src_path, blob)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV: raise
+                        shutil.copyfile(src_path, blob)
+                    st = os.stat(blob)
+                    conn = self._db()
+                    with conn:
+                        conn.execute('INSERT OR REPLACE INTO blobs (digest, dev, ino, size) VALUES (?, ?, ?, ?)',
+                                     (digest, st.st_dev, st.st_ino, st.st_size))
+                try:
+                    replaced, linked = self._link(blob, dest_path)
+                    break
+                except FileNotFoundError:
+                    # blob 恰好被其他进程回收，重新存入一次
+                    if not os.path.exists(src_path): raise
+        else:
+            raise OSError(f'无法保存文件: {dest_path}')
+        if replaced is not None: self.release(replaced)
+        # 退化为复制时用户文件不引用 blob，新存入的 blob 没有其他链接，立即回收
+        if not linked: self._collect(digest)
+
+    def _link(self, blob, dest_path):
+        # 先链接到同目录下的临时名称再 os.replace，已存在的目标文件 (可能也是某个 blob) 不会被截断。
+        # 返回 (被覆盖的旧文件的 os.lstat 结果, 是否为硬链接)，由调用方在释放锁之后传给 release / 回收 blob
+        tmp_link, linked = self._tmp_path(os.path.dirname(dest_path)), True
+        try:
+            os.link(blob, tmp_link)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP): raise
+            # 不支持硬链接 (跨文件系统、链接数达到上限等) 时退化为复制
+            shutil.copyfile(blob, tmp_link)
+            linked = False
+        try:
+            old_st = os.lstat(dest_path)
+        except FileNotFoundError:
+            old_st = None
+        # 目标已经是同一个 blob 的链接时 rename 不做任何事，临时链接会残留
+        if old_st is not None and os.path.samestat(old_st, os.lstat(tmp_link)):
+            os.remove(tmp_link)
+            return None, linked
+        try:
+            os.replace(tmp_link, dest_path)
+        except OSError:
+            os.remove(tmp_link)
+            raise
+        return old_st, linked
+
+    # --- 回收 ---
+    def release(self, st):
+        """用户文件被删除后调用，st 为删除前的 os.lstat 结果；不再被引用的 blob 会被删除。"""
+        if st.st_nlink < 2: return
+        row = self._db().execute('SELECT digest FROM blobs WHERE dev = ? AND ino = ?', (st.st_dev, st.st_ino)).fetchone()
+        if row: self._collect(row['digest'])
+
+    def _collect(self, digest):
+        blob = self.blob_path(digest)
+        with self._lock:
+            try:
+                if os.stat(blob).st_nlink > 1: return
+                os.remove(blob)
+            except FileNotFoundError:
+                pass
+            conn = self._db()
+            with conn:
+                conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+
+    @staticmethod
+    def linked_files(abs_dir):
+        """删除整个目录前调用，返回其中有多个链接的文件的 os.lstat 结果，删除后逐个传给 release。"""
+        stats = []
+        for root, _, files in os.walk(abs_dir):
+            for name in files:
+                try: st = os.lstat(os.path.join(root, name))
+                except OSError: continue
+                if st.st_nlink > 1: stats.append(st)
+        return stats
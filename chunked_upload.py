@@ -0,0 +1,155 @@
+import os
+import re
+import errno
+import json
+import time
+import uuid
+import shutil
+from contextlib import contextmanager
+from process_lock import ProcessLock
+
+# --- 分块断点续传上传 ---
+# 每个上传会话在暂存目录中对应以下文件：
+#   <id>.json   会话元数据 (所有者、目标路径、文件大小、分块大小，完成后 state 为 'done')
+#   <id>.part   预先分配好大小的暂存文件，各分块直接写入对应偏移，没有中间副本
+#   <id>.chunks 每个分块一个字节的完成标记，可被多个线程/进程并发写入而无需加锁
+#   <id>.lock   完成上传时的文件锁；客户端重试的 finalize 可能同时到达不同的工作进程
+# 所有分块到齐后，暂存文件通过 os.replace 原子地移动到目标位置。完成的会话保留元数据直到过期，
+# 重复的 finalize 据此直接返回成功。
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ChunkedUploadError(Exception):
+    pass
+
+
+class ChunkedUploadStore:
+    def __init__(self, staging_dir, chunk_size=DEFAULT_CHUNK_SIZE, max_age=24 * 3600):
+        self.staging_dir = staging_dir
+        self.chunk_size = chunk_size
+        self.max_age = max_age
+        os.makedirs(staging_dir, exist_ok=True)
+
+    def _file(self, upload_id, suffix):
+        return os.path.join(self.staging_dir, upload_id + suffix)
+
+    @staticmethod
+    def chunk_count(meta):
+        return (meta['size'] + meta['chunk_size'] - 1) // meta['chunk_size']
+
+    @staticmethod
+    def chunk_length(meta, index):
+        start = index * meta['chunk_size']
+        return min(meta['chunk_size'], meta['size'] - start)
+
+    # --- 会话管理 ---
+    def create(self, owner, dest_path, size):
+        self.cleanup_expired()
+        upload_id = uuid.uuid4().hex
+        meta = {'id': upload_id, 'owner': owner, 'dest_path': dest_path, 'size': size,
+                'chunk_size': self.chunk_size, 'created': time.time()}
+        with open(self._file(upload_id, '.part'), 'wb') as f:
+            f.truncate(size)
+        with open(self._file(upload_id, '.chunks'), 'wb') as f:
+            f.write(b'\0' * self.chunk_count(meta))
+        self._save(meta)
+        return meta
+
+    def _save(self, meta):
+        tmp_meta = self._file(meta['id'], '.json.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_meta, self._file(meta['id'], '.json'))
+
+    def load(self, upload_id):
+        if not UPLOAD_ID_RE.match(upload_id or ''): return None
+        try:
+            with open(self._file(upload_id, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def missing_chunks(self, meta):
+        with open(self._file(meta['id'], '.chunks'), 'rb') as f:
+            bitmap = f.read()
+        return [i for i, done in enumerate(bitmap) if not done]
+
+    def abort(self, meta):
+        for suffix in ('.json', '.chunks', '.part', '.lock'):
+            try: os.remove(self._file(meta['id'], suffix))
+            except FileNotFoundError: pass
+
+    def cleanup_expired(self):
+        now = time.time()
+        for name in os.listdir(self.staging_dir):
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.json': continue
+            meta = self.load(upload_id)
+            if meta and now - meta['created'] > self.max_age:
+                self.abort(meta)
+
+    # --- 数据写入 ---
+    def write_chunk(self, meta, index, stream, length):
+        """把 stream 中的 length 字节写入第 index 个分块，长度必须与该分块完全一致。"""
+        if not 0 <= index < self.chunk_count(meta):
+            raise ChunkedUploadError('分块序号超出范围')
+        if length != self.chunk_length(meta, index):
+            raise ChunkedUploadError('分块大小与预期不符')
+        remaining = length
+        # 每个请求使用独立的文件描述符，各自 lseek 到分块起点后顺序写入，多个分块可并发写同一文件
+        fd = os.open(self._file(meta['id'], '.part'), os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            os.lseek(fd, index * meta['chunk_size'], os.SEEK_SET)
+            while remaining > 0:
+                data = stream.read(min(COPY_BUFFER_SIZE, remaining))
+                if not data: raise ChunkedUploadError('分块数据不完整')
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+                remaining -= len(data)
+        finally:
+            os.close(fd)
+        fd = os.open(self._file(meta['id'], '.chunks'), os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            os.lseek(fd, index, os.SEEK_SET)
+            os.write(fd, b'\1')
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def locked(self, upload_id):
+        """
+        独占一个上传会话，产生加锁后重新读取的元数据 (会话不存在时为 None)。
+        flock 锁属于各自打开的文件，同一进程的不同线程之间同样互斥；不同会话互不影响。
+        """
+        lock = ProcessLock(self._file(upload_id, '.lock'))
+        lock.acquire(blocking=True)
+        try:
+            yield self.load(upload_id)
+        finally:
+            lock.close()
+
+    def finalize(self, meta, blob_store=None):
+        """
+        所有分块到齐后把暂存文件移动到目标位置 (或存入去重存储并链接过去)，返回目标路径。
+        调用方需要在 locked() 中调用，并确认会话尚未完成。
+        """
+        if self.missing_chunks(meta): raise ChunkedUploadError('仍有分块未上传')
+        part_path, dest_path = self._file(meta['id'], '.part'), meta['dest_path']
+        if blob_store is not None:
+            blob_store.save_file(part_path, dest_path)
+        else:
+            try:
+                os.replace(part_path, dest_path)
+            except OSError as e:
+                # 暂存目录与目标不在同一文件系统时退化为复制
+                if e.errno != errno.EXDEV: raise
+                shutil.move(part_path, dest_path)
+        self._save(dict(meta, state='done'))
+        for suffix in ('.chunks', '.part'):
+            try: os.remove(self._file(meta['id'], suffix))
+            except FileNotFoundError: pass
+        return dest_path
@@ -0,0 +1,289 @@
+import os
+import atexit
+import logging
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import database
+from process_lock import ProcessLock
+
+# --- 文件内容索引 ---
+# 把文本文件的内容写入独立 SQLite 文件中的 FTS5 表 (trigram 分词，中文同样可以按子串搜索)。
+# 后台线程负责维护：启动时和之后每隔一段时间全量核对一次，路由和文件系统监视器报告的变化则按目录增量处理；
+# 只有大小或 mtime 变化的文件会被重新读取，读取和解码在进程池中完成，每个文件只索引开头的 max_file_bytes 字节。
+# 多进程部署时通过文件锁保证同一时间只有一个进程在写索引。
+
+logger = logging.getLogger(__name__)
+
+MAX_FILE_BYTES = 1024 * 1024
+BATCH_SIZE = 64
+SNIPPET_TOKENS = 16
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'  # 调用方在转义 HTML 之后再替换为高亮标签
+MIN_QUERY_LENGTH = 3  # trigram 分词无法用索引匹配更短的查询，逐个扫描文件内容的代价太高，直接拒绝
+
+
+def read_text(path, max_bytes):
+    """在子进程中执行：读取文件开头 max_bytes 字节并解码；包含 NUL 字节 (二进制文件) 或无法读取时返回空字符串。"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(max_bytes)
+    except OSError:
+        return ''
+    if b'\0' in data: return ''
+    return data.decode('utf-8', errors='ignore')
+
+
+class ContentIndex:
+    def __init__(self, db_path, root_dir, extensions, max_file_bytes=MAX_FILE_BYTES, workers=2, interval=600):
+        self.db_path = db_path
+        self.root_dir = os.path.abspath(root_dir)
+        self.extensions = frozenset(extensions)
+        self.max_file_bytes = max_file_bytes
+        self.workers = workers
+        self.interval = interval
+        self.available = True
+        self.use_trigram = True
+        self._pool = None
+        self._exiting = False
+        self._dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._writer_lock = ProcessLock(db_path + '.lock')
+        # 解释器退出时停止进程池，否则退出过程中才启动的子进程会因信号量已被清理而报错
+        atexit.register(self._shutdown_at_exit)
+        self._init_schema()
+
+    # --- 连接与表结构 ---
+    def _connect(self):
+        return database.get_connection(self.db_path)
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        ''')
+        for tokenizer in ('trigram', 'unicode61'):
+            try:
+                conn.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(body, tokenize='{tokenizer}')")
+                break
+            except sqlite3.OperationalError:
+                self.use_trigram = False
+        else:
+            self.available = False  # 当前 SQLite 未编译 FTS5，不提供内容搜索
+        conn.commit()
+        if self.available:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'content_fts'").fetchone()
+            self.use_trigram = 'trigram' in row[0]
+
+    # --- 路径换算 ---
+    def to_key(self, abs_path):
+        return os.path.relpath(os.path.abspath(abs_path), self.root_dir).replace('\\', '/')
+
+    @staticmethod
+    def _prefix_range(key):
+        return key + '/', key + '0'
+
+    def is_ready(self):
+        if not self.available: return False
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'ready'").fetchone()
+        return bool(row and row[0] == '1')
+
+    # --- 路由和监视器的通知 ---
+    def mark_dirty(self, abs_path, recursive=False):
+        """记录需要重新核对的文件或目录，由后台线程处理；本进程没有启动后台线程时忽略 (由负责的进程处理)。"""
+        if not self.available or self._thread is None: return
+        with self._dirty_lock:
+            self._dirty[abs_path] = self._dirty.get(abs_path, False) or recursive
+        self._wake.set()
+
+    def remove(self, abs_path):
+        key = self.to_key(abs_path)
+        if not self.available or key.startswith('..'): return
+        conn = self._connect()
+        with conn:
+            if key == '.':
+                ids = conn.execute('SELECT id FROM files').fetchall()
+            else:
+                lo, hi = self._prefix_range(key)
+                ids = conn.execute('SELECT id FROM files WHERE path = ? OR (path >= ? AND path < ?)', (key, lo, hi)).fetchall()
+            self._delete_ids(conn, [row[0] for row in ids])
+
+    def move(self, old_abs_path, new_abs_path):
+        old_key, new_key = self.to_key(old_abs_path), self.to_key(new_abs_path)
+        if not self.available or old_key.startswith('..') or new_key.startswith('..'): return
+        old_lo, old_hi = self._prefix_range(old_key)
+        new_lo, new_hi = self._prefix_range(new_key)
+        conn = self._connect()
+        with conn:
+            ids = conn.execute('SELECT id FROM files WHERE path = ? OR (path >= ? AND path < ?)', (new_key, new_lo, new_hi)).fetchall()
+            self._delete_ids(conn, [row[0] for row in ids])
+            conn.execute('UPDATE files SET path = ? WHERE path = ?', (new_key, old_key))
+            conn.execute('UPDATE files SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?',
+                         (new_key, len(old_key) + 1, old_lo, old_hi))
+
+    @staticmethod
+    def _delete_ids(conn, ids):
+        conn.executemany('DELETE FROM content_fts WHERE rowid = ?', [(i,) for i in ids])
+        conn.executemany('DELETE FROM files WHERE id = ?', [(i,) for i in ids])
+
+    # --- 后台维护 ---
+    def start(self):
+        if not self.available or self._thread is not None: return
+        self._thread = threading.Thread(target=self._run, name='content-index', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        full_sync = True
+        while True:
+            try:
+                if self._writer_lock.acquire():
+                    if full_sync:
+                        self.sync(self.root_dir, recursive=True)
+                        conn = self._connect()
+                        with conn:
+                            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ready', '1')")
+                    with self._dirty_lock:
+                        dirty, self._dirty = self._dirty, {}
+                    for path, recursive in dirty.items():
+                        self.sync(path, recursive)
+                else:
+                    # 其他进程正在维护索引，本进程记录的变化由它的全量核对或监视器覆盖
+                    with self._dirty_lock:
+                        self._dirty.clear()
+            except Exception:
+                logger.exception('更新内容索引失败')
+            finally:
+                database.release_connections()
+            full_sync = not self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _get_pool(self):
+        if self._pool is None:
+            # 工作进程中有多个线程，fork 可能复制其他线程持有的锁，因此从单线程的 forkserver 派生子进程
+            # (不支持时使用 spawn)。子进程只需要本模块中的 read_text，预先导入到 forkserver 中
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context('spawn')
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self._pool
+
+    def _shutdown_pool(self):
+        pool, self._pool = self._pool, None
+        if pool is not None: pool.shutdown(wait=False, cancel_futures=True)
+
+    def _shutdown_at_exit(self):
+        self._exiting = True
+        self._shutdown_pool()
+
+    def _read_batch(self, paths):
+        if self._exiting: return [read_text(path, self.max_file_bytes) for path in paths]
+        try:
+            return list(self._get_pool().map(read_text, paths, [self.max_file_bytes] * len(paths)))
+        except Exception as e:
+            # 无法使用进程池 (受限环境等) 时在当前线程中读取；退出过程中进程池已被关闭，不是错误
+            if not self._exiting: logger.warning('内容索引进程池不可用 (%s)，改为在线程中读取', e)
+            self._shutdown_pool()
+            return [read_text(path, self.max_file_bytes) for path in paths]
+
+    def _scan(self, abs_dir, recursive):
+        """产生 abs_dir 下 (递归或仅直接子项) 需要索引的文件 (键, 绝对路径, 大小, mtime_ns)。"""
+        stack = [abs_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if recursive: stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False): continue
+                            if os.path.splitext(entry.name)[1].lower() not in self.extensions: continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        yield self.to_key(entry.path), entry.path, st.st_size, st.st_mtime_ns
+            except OSError:
+                continue
+
+    def sync(self, abs_path, recursive=False):
+        """核对一个文件或目录：重新索引新增或大小/mtime 变化的文件，删除已不存在的条目。"""
+        key = self.to_key(abs_path)
+        if key.startswith('..'): return
+        if not os.path.isdir(abs_path):
+            if not os.path.isfile(abs_path):
+                self.remove(abs_path)
+                return
+            st = os.stat(abs_path)
+            if os.path.splitext(abs_path)[1].lower() in self.extensions:
+                self._index_files([(key, abs_path, st.st_size, st.st_mtime_ns)])
+            return
+        conn = self._connect()
+        if key == '.':
+            rows = conn.execute('SELECT id, path, size, mtime_ns FROM files').fetchall()
+        else:
+            lo, hi = self._prefix_range(key)
+            rows = conn.execute('SELECT id, path, size, mtime_ns FROM files WHERE path >= ? AND path < ?', (lo, hi)).fetchall()
+        prefix_len = 0 if key == '.' else len(key) + 1
+        # 非递归核对只涉及直接子文件
+        known = {row[1]: row for row in rows if recursive or '/' not in row[1][prefix_len:]}
+        batch = []
+        for item in self._scan(abs_path, recursive):
+            row = known.pop(item[0], None)
+            if row is not None and row[2] == item[2] and row[3] == item[3]: continue
+            batch.append(item)
+            if len(batch) >= BATCH_SIZE:
+                self._index_files(batch)
+                batch = []
+        if batch: self._index_files(batch)
+        if known:
+            with conn:
+                self._delete_ids(conn, [row[0] for row in known.values()])
+
+    def _index_files(self, batch):
+        texts = self._read_batch([item[1] for item in batch])
+        conn = self._connect()
+        with conn:
+            for (key, _, size, mtime_ns), text in zip(batch, texts):
+                conn.execute('INSERT INTO files (path, size, mtime_ns) VALUES (?, ?, ?) '
+                             'ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns',
+                             (key, size, mtime_ns))
+                file_id = conn.execute('SELECT id FROM files WHERE path = ?', (key,)).fetchone()[0]
+                conn.execute('DELETE FROM content_fts WHERE rowid = ?', (file_id,))
+                conn.execute('INSERT INTO content_fts (rowid, body) VALUES (?, ?)', (file_id, text))
+
+    # --- 查询 ---
+    def query_too_short(self, query):
+        return self.use_trigram and len(query) < MIN_QUERY_LENGTH
+
+    def search(self, query, scope_abs_dir, limit, offset=0):
+        """
+        在 scope_abs_dir 范围内搜索文件内容，返回 (path, snippet) 列表。path 为相对于根目录的路径，
+        snippet 中的匹配部分以 SNIPPET_START / SNIPPET_END 标记。查询过短 (见 query_too_short) 时返回空列表。
+        """
+        if not self.available or self.query_too_short(query): return []
+        scope = self.to_key(scope_abs_dir)
+        params = [SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS, '"' + query.replace('"', '""') + '"']
+        sql = ('SELECT f.path, snippet(content_fts, 0, ?, ?, \'…\', ?) FROM content_fts '
+               'JOIN files f ON f.id = content_fts.rowid WHERE content_fts MATCH ?')
+        if scope != '.':
+            lo, hi = self._prefix_range(scope)
+            sql += ' AND f.path >= ? AND f.path < ?'
+            params.extend([lo, hi])
+        # 相关度相同的结果按路径排序，翻页时结果稳定
+        sql += ' ORDER BY rank, f.path LIMIT ? OFFSET ?'
+        params.extend([limit, offset])
+        return self._connect().execute(sql, params).fetchall()
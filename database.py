@@ -1,25 +1,68 @@
 import sqlite3
 import os
+import threading
 from werkzeug.security import generate_password_hash
 
 # --- 配置 ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'file_manager.db')
-UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
+# 数据位置可通过环境变量覆盖 (基准测试、同一台机器上运行多个实例时使用)；
+# DATA_DIR 下还会存放文件名索引、上传暂存区和缩略图缓存等
+DATA_DIR = os.environ.get('FILE_MANAGER_DATA_DIR', BASE_DIR)
+DB_PATH = os.environ.get('FILE_MANAGER_DB_PATH', os.path.join(DATA_DIR, 'file_manager.db'))
+UPLOADS_DIR = os.environ.get('FILE_MANAGER_UPLOADS_DIR', os.path.join(DATA_DIR, 'uploads'))
 
-def create_database():
+# --- 连接池 ---
+# 每个线程对每个数据库文件只保持一个长连接并重复使用，连接上的语句缓存 (cached_statements)
+# 因此可以跨请求复用已编译的语句。连接按进程号区分，gunicorn 等预先 fork 的服务器中子进程
+# 不会继承父进程的连接。
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT = 30
+_local = threading.local()
+# 可选的语句回调 (如运行指标统计 SQL 语句数)，在创建连接时作为 trace callback 安装
+statement_callback = None
+# 触发器等使用的自定义 SQL 函数 {名称: (参数个数, 函数)}，在创建连接时注册
+sql_functions = {}
+
+def configure_connection(conn):
+    conn.row_factory = sqlite3.Row
+    if statement_callback is not None: conn.set_trace_callback(statement_callback)
+    for name, (num_params, func) in sql_functions.items():
+        conn.create_function(name, num_params, func, deterministic=True)
+    # WAL 模式下读写互不阻塞，多个线程/进程可以同时读取
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-16000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+def get_connection(db_path=DB_PATH):
     """
-    创建或更新数据库、用户表和设置表。
+    返回当前线程复用的数据库连接。调用方不要关闭它；写操作完成后照常 commit。
     """
-    print("正在连接数据库...")
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # --- 创建 users 表 (带有权限列) ---
-    print("正在创建 'users' 表...")
-    cursor.execute("DROP TABLE IF EXISTS users")
-    cursor.execute('''
-    CREATE TABLE users (
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid, _local.connections = os.getpid(), {}
+    conn = _local.connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+        _local.connections[db_path] = configure_connection(conn)
+    return conn
+
+def release_connections():
+    """在请求结束时调用：回滚未提交的事务，使连接以干净的状态留给下一个请求。"""
+    if getattr(_local, 'pid', None) != os.getpid(): return
+    for conn in _local.connections.values():
+        if conn.in_transaction: conn.rollback()
+
+def close_connections():
+    if getattr(_local, 'pid', None) != os.getpid(): return
+    for conn in _local.connections.values(): conn.close()
+    _local.connections = {}
+
+# --- 表结构迁移 ---
+# 通过 PRAGMA user_version 记录已应用的版本，只追加、不删除已有数据。
+def _migration_1(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         username TEXT UNIQUE NOT NULL,
         password TEXT NOT NULL,
@@ -31,38 +74,129 @@ def create_database():
         can_create_folder BOOLEAN NOT NULL DEFAULT 1
     )
     ''')
-    print(" 'users' 表创建成功。")
-
-    # --- 插入默认管理员用户 ---
-    print("正在插入默认管理员 'admin'...")
-    admin_password = generate_password_hash('admin')
-    # 管理员所有权限默认为 True (1)
-    cursor.execute(
-        "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-        ('admin', admin_password, 'admin')
-    )
-    
-    # --- 创建 settings 表 ---
-    print("正在创建 'settings' 表...")
-    cursor.execute("DROP TABLE IF EXISTS settings")
-    cursor.execute('''
-    CREATE TABLE settings (
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS settings (
         key TEXT PRIMARY KEY,
         value TEXT NOT NULL
     )
     ''')
     # 默认禁止新用户注册
-    cursor.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ('registration_enabled', 'false'))
-    print(" 'settings' 表创建成功，并设置默认禁止注册。")
+    conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", ('registration_enabled', 'false'))
+    if conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0:
+        # 管理员所有权限默认为 True (1)
+        conn.execute(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+            ('admin', generate_password_hash('admin'), 'admin')
+        )
 
-    conn.commit()
-    conn.close()
+def _migration_2(conn):
+    # 后台任务 (批量删除/移动等) 的状态和结果，供任意进程查询进度
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        created REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated)')
+
+def _migration_3(conn):
+    # 去重存储模式下的 blob 记录，按 (dev, ino) 反查用户文件对应的 blob
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS blobs (
+        digest TEXT PRIMARY KEY,
+        dev INTEGER NOT NULL,
+        ino INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_blobs_inode ON blobs (dev, ino)')
+
+def _migration_4(conn):
+    # 存储配额 (0 表示不限) 和增量维护的已用空间，单位均为字节
+    conn.execute('ALTER TABLE users ADD COLUMN quota_bytes INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE users ADD COLUMN used_bytes INTEGER NOT NULL DEFAULT 0')
+
+def _migration_5(conn):
+    # 同步接口：变更记录 (id 即客户端游标，AUTOINCREMENT 保证清理之后编号也不会复用)
+    # 和按 inode 缓存的文件内容哈希 (重命名、移动后仍然有效，size/mtime 变化即失效)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        path TEXT NOT NULL,
+        old_path TEXT,
+        is_dir INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_changes_created_at ON changes (created_at)')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS file_hashes (
+        dev INTEGER NOT NULL,
+        ino INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        hashed_at REAL NOT NULL,
+        PRIMARY KEY (dev, ino)
+    )
+    ''')
+
+def _migration_6(conn):
+    # 程序内部状态 (如变更记录的游标下限) 与管理员可修改的 settings 分开存放
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT key, value FROM settings WHERE key = 'change_journal_floor'")
+    conn.execute("DELETE FROM settings WHERE key = 'change_journal_floor'")
+
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5, _migration_6]
+
+def migrate(db_path=DB_PATH):
+    """把数据库升级到最新版本，返回 (原版本, 新版本)。"""
+    conn = get_connection(db_path)
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current: continue
+        # 多个进程可能同时升级：先取得写锁，再在事务中重新读取版本，其他进程已应用的步骤直接跳过
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] < version:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return current, len(MIGRATIONS)
+
+def create_database():
+    """
+    创建或更新数据库、用户表和设置表。已有的用户和设置会被保留。
+    """
+    print("正在连接数据库...")
+    old_version, new_version = migrate()
+    if old_version == new_version:
+        print(f"数据库已是最新版本 (v{new_version})。")
+    else:
+        print(f"数据库已从 v{old_version} 升级到 v{new_version}。")
+    close_connections()
     print("数据库初始化完成。")
-    
+
     # --- 确保 uploads 目录存在 ---
     if not os.path.exists(UPLOADS_DIR):
         print(f"正在创建主上传目录: {UPLOADS_DIR}")
         os.makedirs(UPLOADS_DIR)
 
 if __name__ == '__main__':
-    create_database()
\ No newline at end of file
+    create_database()
@@ -0,0 +1,201 @@
+import os
+import threading
+import metrics
+from collections import OrderedDict, namedtuple
+
+# --- 文件系统缓存 ---
+# 缓存条目均以目录的绝对路径为键，并记录目录自身的 st_mtime_ns：
+# 目录中新增、删除或重命名条目都会改变其 mtime，读取时只需一次 stat 即可判断缓存是否仍然有效。
+# 目录内已有文件被覆盖写入时 mtime 不变，这种情况由路由调用 invalidate() 处理。
+
+
+class DirSizeCache:
+    """
+    目录大小缓存。每个目录只缓存“直属文件的总大小 + 子目录列表”，
+    目录总大小由各层缓存相加得到，因此某个目录变化时只需重新扫描这一层。
+    """
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None: self._entries.move_to_end(path)
+            return entry
+
+    def _put(self, path, entry):
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _scan(path):
+        # DirEntry 自带文件类型并缓存 stat 结果，每个文件最多一次 lstat
+        files_size, subdirs = 0, []
+        with metrics.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files_size += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+        return files_size, tuple(subdirs)
+
+    def get_size(self, directory):
+        """返回目录总大小 (不计符号链接)，权限不足时抛出 PermissionError。"""
+        total, stack = 0, [os.path.abspath(directory)]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = metrics.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            entry = self._get(path)
+            if entry is None or entry[0] != mtime_ns:
+                try:
+                    files_size, subdirs = self._scan(path)
+                except FileNotFoundError:
+                    continue
+                entry = (mtime_ns, files_size, subdirs)
+                self._put(path, entry)
+            total += entry[1]
+            stack.extend(entry[2])
+        return total
+
+    def invalidate(self, directory):
+        with self._lock:
+            self._entries.pop(os.path.abspath(directory), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+DirEntryInfo = namedtuple('DirEntryInfo', 'name is_dir size mtime')
+
+
+LISTING_SORT_KEYS = {
+    'name': lambda e: e.name.lower(),
+    'size': lambda e: e.size or 0,
+    'mtime': lambda e: e.mtime or 0,
+}
+
+
+class DirListingCache:
+    """
+    目录列表缓存。一次 os.scandir 得到名称、类型、大小和修改时间，
+    每种排序方式只排序一次，并记录名称到位置的映射以支持游标分页。
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(path):
+        entries = []
+        with metrics.scandir(path) as it:
+            for entry in it:
+                # 与 os.path.isdir / getsize 一致，跟随符号链接；失效的链接大小为空
+                try: is_dir = entry.is_dir()
+                except OSError: is_dir = False
+                try:
+                    st = entry.stat()
+                    size, mtime = (None if is_dir else st.st_size), st.st_mtime
+                except OSError:
+                    size, mtime = None, None
+                entries.append(DirEntryInfo(entry.name, is_dir, size, mtime))
+        return entries
+
+    def list_dir(self, directory, sort='name', reverse=False):
+        """
+        返回 (已排序的条目列表, {名称: 位置})。目录始终排在文件之前。
+        目录不存在或无权限时抛出 OSError。
+        """
+        path = os.path.abspath(directory)
+        mtime_ns = metrics.stat(path).st_mtime_ns
+        with self._lock:
+            record = self._entries.get(path)
+            if record is not None: self._entries.move_to_end(path)
+        if record is None or record['mtime_ns'] != mtime_ns:
+            record = {'mtime_ns': mtime_ns, 'entries': self._scan(path), 'sorted': {}}
+            with self._lock:
+                self._entries[path] = record
+                self._entries.move_to_end(path)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        variant = record['sorted'].get((sort, reverse))
+        if variant is None:
+            key = LISTING_SORT_KEYS[sort]
+            sort_key = lambda e: (key(e), e.name.lower(), e.name)
+            dirs = sorted((e for e in record['entries'] if e.is_dir), key=sort_key, reverse=reverse)
+            files = sorted((e for e in record['entries'] if not e.is_dir), key=sort_key, reverse=reverse)
+            items = dirs + files
+            variant = (items, {e.name: i for i, e in enumerate(items)})
+            record['sorted'][(sort, reverse)] = variant
+        return variant
+
+    def invalidate(self, directory):
+        with self._lock:
+            self._entries.pop(os.path.abspath(directory), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DirTreeCache:
+    """
+    目录树缓存。每个目录缓存其子目录名称列表，用于按需逐级展开的目录选择器。
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def subdirs(self, directory):
+        """返回按名称排序的子目录名称元组，目录不存在或无法读取时返回空元组。"""
+        path = os.path.abspath(directory)
+        try:
+            mtime_ns = metrics.stat(path).st_mtime_ns
+        except OSError:
+            return ()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None: self._entries.move_to_end(path)
+        if entry is not None and entry[0] == mtime_ns:
+            return entry[1]
+        names = []
+        try:
+            with metrics.scandir(path) as it:
+                for item in it:
+                    try:
+                        if item.is_dir(): names.append(item.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return ()
+        names = tuple(sorted(names))
+        with self._lock:
+            self._entries[path] = (mtime_ns, names)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return names
+
+    def invalidate(self, directory):
+        with self._lock:
+            self._entries.pop(os.path.abspath(directory), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
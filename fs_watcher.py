@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+# --- 文件系统监视 ---
+# rsync、cron 等绕过路由直接修改 uploads 目录时，应用内的缓存和文件名索引会过期。
+# 监视器在后台线程中运行：Linux 下通过 ctypes 调用 inotify 递归监视所有目录，
+# 其他平台或 inotify 不可用 (如监视数量超出 max_user_watches) 时退化为定期扫描目录的 mtime。
+# 短时间内的大量事件会被合并，之后以"发生变化的目录集合"为单位回调一次；
+# 回调参数为 None 时表示无法确定变化范围 (事件队列溢出)，调用方应整体失效。
+
+logger = logging.getLogger(__name__)
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+# 不监视 IN_MODIFY：写入大文件时每次 write 都会产生一个事件，内容的变化在关闭文件时由 IN_CLOSE_WRITE 报告一次
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch, self._rm_watch = libc.inotify_add_watch, libc.inotify_rm_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+
+    def add_watch(self, path):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """读取当前可用的全部事件，产生 (wd, mask, name)。"""
+        while True:
+            try:
+                buf = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                yield wd, mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileSystemWatcher:
+    """
+    监视 root_dir 下的所有变化。on_changes(dirs) 在后台线程中被调用，dirs 为直接子项发生变化的目录绝对路径集合。
+    """
+
+    def __init__(self, root_dir, on_changes, scan_interval=60, debounce=0.5):
+        self.root_dir = os.path.abspath(root_dir)
+        self.on_changes = on_changes
+        self.scan_interval = scan_interval
+        self.debounce = debounce
+        self.mode = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None: return
+        self._thread = threading.Thread(target=self._run, name='fs-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _publish(self, dirs):
+        try:
+            self.on_changes(dirs)
+        except Exception:
+            logger.exception('处理文件变更通知失败')
+
+    def _run(self):
+        if sys.platform.startswith('linux'):
+            try:
+                self.mode = 'inotify'
+                self._run_inotify()
+                return
+            except OSError as e:
+                logger.warning('inotify 不可用 (%s)，改为定期扫描', e)
+        self.mode = 'scan'
+        self._run_scan()
+
+    # --- inotify ---
+    def _watch_tree(self, ino, watches, top):
+        stack = [top]
+        while stack:
+            current = stack.pop()
+            try:
+                wd = ino.add_watch(current)
+            except OSError as e:
+                # 监视数量达到上限时无法保证完整性，交给扫描模式处理
+                if e.errno == errno.ENOSPC: raise
+                continue
+            watches[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    stack.extend(entry.path for entry in it if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def _unwatch_tree(self, ino, watches, top):
+        prefix = top + os.sep
+        for wd, path in list(watches.items()):
+            if path == top or path.startswith(prefix):
+                ino.rm_watch(wd)
+                del watches[wd]
+
+    def _run_inotify(self):
+        ino, watches = _Inotify(), {}
+        try:
+            self._watch_tree(ino, watches, self.root_dir)
+            poller = select.poll()
+            poller.register(ino.fd, select.POLLIN)
+            while not self._stop.is_set():
+                if not poller.poll(1000): continue
+                changed, overflow, deadline = set(), False, time.monotonic() + self.debounce
+                # 收到第一个事件后继续收集 debounce 秒内的事件，合并成一次通知
+                while True:
+                    for wd, mask, name in ino.read_events():
+                        if mask & IN_Q_OVERFLOW:
+                            overflow = True
+                            continue
+                        parent = watches.get(wd)
+                        if parent is None: continue
+                        if mask & IN_IGNORED:
+                            del watches[wd]
+                            continue
+                        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                            changed.add(os.path.dirname(parent))
+                            continue
+                        changed.add(parent)
+                        path = os.path.join(parent, name)
+                        if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                            self._unwatch_tree(ino, watches, path)
+                        elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                            self._watch_tree(ino, watches, path)
+                            changed.add(path)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not poller.poll(remaining * 1000): break
+                if overflow:
+                    self._unwatch_tree(ino, watches, self.root_dir)
+                    self._watch_tree(ino, watches, self.root_dir)
+                    self._publish(None)
+                else:
+                    self._publish(changed)
+        finally:
+            ino.close()
+
+    # --- 定期扫描 ---
+    @staticmethod
+    def _scan(root_dir):
+        """返回 {目录: 签名}，签名包含目录 mtime 以及直接子文件的数量、总大小和最新 mtime。"""
+        signatures, stack = {}, [root_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                dir_mtime = os.stat(current).st_mtime_ns
+                count = total = latest = 0
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        count, total, latest = count + 1, total + st.st_size, max(latest, st.st_mtime_ns)
+            except OSError:
+                continue
+            signatures[current] = (dir_mtime, count, total, latest)
+        return signatures
+
+    def _run_scan(self):
+        previous = self._scan(self.root_dir)
+        while not self._stop.wait(self.scan_interval):
+            current = self._scan(self.root_dir)
+            changed = {path for path, sig in current.items() if previous.get(path) != sig}
+            changed.update(os.path.dirname(path) for path in previous.keys() - current.keys())
+            previous = current
+            if changed: self._publish(changed)
@@ -0,0 +1,48 @@
+import os
+import shutil
+import multiprocessing
+
+# --- gunicorn 配置 ---
+# 用法: gunicorn -c gunicorn.conf.py wsgi:app
+# 每个工作进程独立导入应用。目录监视、内容索引、配额校正等只需一个进程完成的工作通过文件锁选出一个进程负责，
+# 其他进程只维护自己的内存缓存；会话是签名 Cookie，密钥见 app.load_secret_key，任何进程都能校验。
+
+bind = os.environ.get('FILE_MANAGER_BIND', '0.0.0.0:8000')
+# 请求大多在等待磁盘和网络，每个进程再开若干线程
+workers = int(os.environ.get('FILE_MANAGER_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('FILE_MANAGER_THREADS', 8))
+# 后台线程不能跨 fork 继承，应用必须在各个工作进程中导入
+preload_app = False
+# 大文件上传和流式 ZIP 下载可能持续较长时间
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+# 直接发送文件时使用 sendfile 零拷贝 (gunicorn 默认开启，HTTPS 由 gunicorn 终止时不可用)
+sendfile = True
+# 定期重启工作进程，释放缓存积累的内存
+max_requests = 10000
+max_requests_jitter = 1000
+forwarded_allow_ips = os.environ.get('FILE_MANAGER_FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('FILE_MANAGER_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # 在主进程中升级一次表结构，工作进程导入应用时不再各自执行
+    import database
+    if os.path.exists(database.DB_PATH):
+        database.migrate(database.DB_PATH)
+        database.close_connections()
+    os.environ['FILE_MANAGER_MIGRATED'] = '1'
+    # 各工作进程把指标快照写入同一目录，/metrics 汇总全部进程；计数器随服务器重启清零
+    metrics_dir = os.environ.setdefault('FILE_MANAGER_METRICS_DIR', os.path.join(database.DATA_DIR, 'metrics'))
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+
+def child_exit(server, worker):
+    # 已退出工作进程的指标合并到归档快照中
+    import metrics
+    metrics.archive_process(os.environ['FILE_MANAGER_METRICS_DIR'], worker.pid)
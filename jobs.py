@@ -0,0 +1,121 @@
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import database
+
+# --- 后台任务 ---
+# 删除、移动等可能耗时很长的批量操作放到线程池中执行，路由只负责校验并立即返回任务 ID。
+# 任务状态保存在数据库的 jobs 表中，多进程部署时任何一个进程都能查询到进度。
+# 执行任务的进程定期刷新 updated 作为心跳；进程退出 (如 gunicorn 按 max_requests 重启) 后任务不会再完成，
+# 心跳超过 STALE_AFTER 未更新的任务在查询或启动时被标记为失败。
+
+PROGRESS_INTERVAL = 0.5  # 秒，进度写入数据库的最小间隔
+HEARTBEAT_INTERVAL = 10
+STALE_AFTER = 60
+JOB_RETENTION = 24 * 3600
+ORPHANED_RESULT = json.dumps({'error': '执行任务的进程已退出，任务未完成，请刷新后检查结果', 'code': 500}, ensure_ascii=False)
+
+
+class JobManager:
+    def __init__(self, db_path, workers=4, logger=None):
+        self.db_path = db_path
+        self.logger = logger
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._heartbeat = None
+
+    def _db(self):
+        return database.get_connection(self.db_path)
+
+    def submit(self, owner, kind, items, handler, summarize):
+        """
+        items 为 (名称, 参数) 列表，handler(参数) 处理单个项目，出错时抛出异常；
+        summarize(成功名称列表, 错误列表) 返回 (HTTP 状态码, 结果字典)，作为任务的最终结果。
+        """
+        job_id, now = uuid.uuid4().hex, time.time()
+        conn = self._db()
+        with conn:
+            conn.execute('DELETE FROM jobs WHERE updated < ? AND status IN (?, ?)', (now - JOB_RETENTION, 'done', 'failed'))
+            conn.execute('INSERT INTO jobs (id, owner, kind, status, total, done, created, updated) VALUES (?, ?, ?, ?, ?, 0, ?, ?)',
+                         (job_id, owner, kind, 'queued', len(items), now, now))
+        with self._active_lock:
+            self._active.add(job_id)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+        self._pool.submit(self._run, job_id, items, handler, summarize)
+        return job_id
+
+    def _beat(self):
+        """为本进程中排队和执行中的任务刷新 updated (单个项目可能执行很久，期间没有进度写入)。"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._active_lock:
+                active = list(self._active)
+            if not active: continue
+            try:
+                conn = self._db()
+                with conn:
+                    conn.executemany('UPDATE jobs SET updated = ? WHERE id = ? AND status IN (?, ?)',
+                                     [(time.time(), job_id, 'queued', 'running') for job_id in active])
+            except Exception:
+                if self.logger: self.logger.exception('刷新后台任务心跳失败')
+            finally:
+                database.release_connections()
+
+    def fail_stale(self, job_id=None):
+        """把心跳超时的排队/执行中任务标记为失败；job_id 为 None 时处理所有任务。"""
+        now = time.time()
+        sql = 'UPDATE jobs SET status = ?, result = ?, updated = ? WHERE status IN (?, ?) AND updated < ?'
+        params = ['failed', ORPHANED_RESULT, now, 'queued', 'running', now - STALE_AFTER]
+        if job_id is not None:
+            sql += ' AND id = ?'
+            params.append(job_id)
+        conn = self._db()
+        with conn:
+            conn.execute(sql, params)
+
+    def _run(self, job_id, items, handler, summarize):
+        conn = self._db()
+        success_list, error_list, last_report = [], [], 0
+        try:
+            with conn:
+                conn.execute('UPDATE jobs SET status = ?, updated = ? WHERE id = ?', ('running', time.time(), job_id))
+            for index, (name, params) in enumerate(items, start=1):
+                try:
+                    handler(params)
+                    success_list.append(name)
+                except Exception as e:
+                    error_list.append({'name': name, 'error': str(e)})
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    with conn:
+                        conn.execute('UPDATE jobs SET done = ?, updated = ? WHERE id = ?', (index, now, job_id))
+            code, result = summarize(success_list, error_list)
+            result['code'] = code
+            with conn:
+                conn.execute('UPDATE jobs SET status = ?, done = total, result = ?, updated = ? WHERE id = ?',
+                             ('done', json.dumps(result, ensure_ascii=False), time.time(), job_id))
+        except Exception as e:
+            if self.logger: self.logger.exception('后台任务 %s 执行失败', job_id)
+            with conn:
+                conn.execute('UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ?',
+                             ('failed', json.dumps({'error': str(e), 'code': 500}, ensure_ascii=False), time.time(), job_id))
+        finally:
+            with self._active_lock:
+                self._active.discard(job_id)
+            database.release_connections()
+
+    def get(self, job_id):
+        row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None: return None
+        if row['status'] in ('queued', 'running') and row['updated'] < time.time() - STALE_AFTER:
+            self.fail_stale(job_id)
+            row = self._db().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
@@ -0,0 +1,288 @@
+import os
+import io
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import threading
+
+# --- 运行指标 ---
+# 进程内的计数器和直方图，以 Prometheus 文本格式导出。
+# 多进程部署时各进程定期把快照写入共享目录 (见 MultiProcessCollector)，抓取时汇总所有进程的数据。
+# 记录一次数据只是在锁内做几次加法，未开启性能分析时的开销可以忽略。
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values):
+    if not names: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self, values=None):
+        """values 为 {标签值: 数值}，省略时使用当前进程的数据。"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        items = sorted((self.snapshot() if values is None else values).items())
+        lines.extend(f'{self.name}{_format_labels(self.labels, k)} {v}' for k, v in items)
+        return lines
+
+
+class Gauge:
+    """值在抓取时由回调函数计算。"""
+
+    def __init__(self, name, help_text, func):
+        self.name, self.help_text, self.func = name, help_text, func
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {self.func()}']
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值 -> [各桶计数..., 总数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def render(self, values=None):
+        """values 为 {标签值: [各桶计数..., 总数, 总和]}，省略时使用当前进程的数据。"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        items = sorted((self.snapshot() if values is None else values).items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labels + ('le',), label_values + (bound,))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+            lines.append(f'{self.name}_bucket{labels} {series[-2]}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_count{labels} {series[-2]}')
+            lines.append(f'{self.name}_sum{labels} {series[-1]:.6f}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """可序列化为 JSON 的计数器和直方图数据：{指标名: [[标签值列表, 数据], ...]}。"""
+        return {metric.name: [[list(k), v] for k, v in metric.snapshot().items()]
+                for metric in self._metrics if hasattr(metric, 'snapshot')}
+
+    def render(self, snapshots=None):
+        """snapshots 为多个进程的 snapshot() 结果，指定时汇总后导出；回调计算的 Gauge 总是取当前进程的值。"""
+        if snapshots is not None: merged = merge_snapshots(snapshots)
+        lines = []
+        for metric in self._metrics:
+            if snapshots is not None and hasattr(metric, 'snapshot'):
+                lines.extend(metric.render({tuple(k): v for k, v in merged.get(metric.name, [])}))
+            else:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def merge_snapshots(snapshots):
+    """按指标名和标签值相加多个快照 (计数器为数值，直方图为逐项相加的列表)。"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, items in snapshot.items():
+            series = merged.setdefault(name, {})
+            for labels, value in items:
+                key = json.dumps(labels)
+                if key not in series:
+                    series[key] = [labels, value]
+                elif isinstance(value, list):
+                    series[key][1] = [a + b for a, b in zip(series[key][1], value)]
+                else:
+                    series[key][1] += value
+    return {name: list(series.values()) for name, series in merged.items()}
+
+
+class MultiProcessCollector:
+    """
+    多进程部署时每个进程把自己的快照写入 directory/<pid>.json (定期、抓取时和进程退出时)，
+    抓取时读取目录中的所有快照汇总导出，因此无论请求落到哪个进程，得到的都是全部进程的合计。
+    已退出进程的快照由 gunicorn 主进程合并到 archive.json (见 archive_process)，计数器不会因进程重启而回退。
+    """
+
+    def __init__(self, registry, directory):
+        self.registry, self.directory = registry, directory
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, f'{os.getpid()}.json')
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        atexit.register(self.flush)
+
+    def flush(self):
+        with self._lock:
+            _write_snapshot(self._path, self.registry.snapshot())
+
+    def start(self, interval):
+        def run():
+            while not self._stop.wait(interval):
+                try: self.flush()
+                except OSError: pass
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def render(self):
+        self.flush()
+        return self.registry.render(_read_snapshots(self.directory))
+
+
+def _write_snapshot(path, snapshot):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def _read_snapshots(directory):
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json'): continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def archive_process(directory, pid):
+    """工作进程退出后由 gunicorn 主进程调用，把它的快照合并到 archive.json，避免快照文件随进程重启无限增多。"""
+    path = os.path.join(directory, f'{pid}.json')
+    archive = os.path.join(directory, 'archive.json')
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    snapshots = [snapshot]
+    try:
+        with open(archive) as f:
+            snapshots.append(json.load(f))
+    except (OSError, ValueError):
+        pass
+    _write_snapshot(archive, merge_snapshots(snapshots))
+    os.remove(path)
+
+
+# --- 默认指标 ---
+registry = Registry()
+START_TIME = time.time()
+request_latency = registry.register(Histogram(
+    'file_manager_request_duration_seconds', '请求处理耗时', ('method', 'route', 'status')))
+template_latency = registry.register(Histogram(
+    'file_manager_template_render_seconds', '模板渲染耗时', ('template',)))
+db_queries = registry.register(Counter('file_manager_db_queries_total', '执行的 SQLite 语句数'))
+fs_calls = registry.register(Counter('file_manager_fs_calls_total', '文件系统调用次数', ('call',)))
+bytes_received = registry.register(Counter('file_manager_request_bytes_total', '接收的请求体字节数'))
+bytes_sent = registry.register(Counter('file_manager_response_bytes_total', '发送的响应体字节数'))
+registry.register(Gauge('file_manager_process_start_time_seconds', '进程启动时间', lambda: START_TIME))
+
+
+def count_db_statement(_sql):
+    """作为 sqlite3 连接的 trace callback，每执行一条语句调用一次。"""
+    db_queries.inc()
+
+
+# --- 文件系统调用计数 ---
+# 处理请求的代码 (目录列表、目录大小、缩略图、同步清单等) 通过下面的函数调用 os.stat / os.lstat / os.scandir，
+# 不替换 os 模块中的函数，库内部和后台线程 (索引、目录监视) 的调用不计入。
+# DirEntry 的 is_dir()/stat() 通常直接使用 readdir 返回的信息，也不单独计数。
+def stat(path, **kwargs):
+    fs_calls.inc(1, 'stat')
+    return os.stat(path, **kwargs)
+
+
+def lstat(path):
+    fs_calls.inc(1, 'lstat')
+    return os.lstat(path)
+
+
+def scandir(path):
+    fs_calls.inc(1, 'scandir')
+    return os.scandir(path)
+
+
+def iter_counted(iterable, counter):
+    """包装流式响应体，统计实际发送的字节数 (str 块按 WSGI 服务器编码后的 UTF-8 长度计算)。"""
+    try:
+        for chunk in iterable:
+            counter.inc(len(chunk.encode()) if isinstance(chunk, str) else len(chunk))
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close: close()
+
+
+# --- 单个请求的性能分析 ---
+class RequestProfiler:
+    """对一个请求启用 cProfile，结束时生成按累计耗时排序的文本报告。"""
+
+    def __init__(self):
+        self._profiler = cProfile.Profile()
+        self._start = time.perf_counter()
+        self._db_start = db_queries.total()
+        self._fs_start = fs_calls.total()
+
+    def start(self):
+        self._profiler.enable()
+
+    def report(self, limit=60):
+        self._profiler.disable()
+        elapsed = time.perf_counter() - self._start
+        out = io.StringIO()
+        # 计数器为进程级，并发请求较多时差值中会混入其他请求的调用
+        out.write(f'耗时: {elapsed * 1000:.2f} ms  SQL 语句: {db_queries.total() - self._db_start}  '
+                  f'文件系统调用: {fs_calls.total() - self._fs_start}\n\n')
+        pstats.Stats(self._profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,40 @@
+try:
+    import fcntl
+except ImportError:  # Windows 下不做跨进程互斥，每个进程各自执行
+    fcntl = None
+
+# --- 跨进程互斥 ---
+# gunicorn 等多进程部署中，每个工作进程都会导入应用并启动自己的后台线程。
+# 全量重建索引、定期校正配额这类只需要一个进程做的工作，用文件锁选出一个进程执行。
+
+
+class ProcessLock:
+    """基于 flock 的文件锁；进程退出时由操作系统自动释放。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.held = False
+        self._file = None
+
+    def acquire(self, blocking=False):
+        """获取锁，非阻塞模式下已被其他进程持有时返回 False。"""
+        if fcntl is None or self.held: return True
+        if self._file is None: self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            return False
+        self.held = True
+        return True
+
+    def release(self):
+        if fcntl is None or not self.held: return
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self.held = False
+
+    def close(self):
+        """释放锁并关闭锁文件 (只在短时间内使用的锁，如单个上传会话)。"""
+        self.release()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
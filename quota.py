@@ -0,0 +1,79 @@
+import os
+import logging
+import threading
+import database
+from process_lock import ProcessLock
+
+# --- 存储配额 ---
+# 每个普通用户的已用空间保存在 users.used_bytes 中，由上传、删除、移动等路由增量更新，
+# 查询和检查配额只需读取一行；外部修改和各种误差由后台线程定期按实际目录大小校正。
+# quota_bytes 为 0 表示不限制。多进程部署时只有持有文件锁的一个进程执行校正。
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaManager:
+    def __init__(self, db_path, uploads_dir, dir_size):
+        """dir_size(目录绝对路径) 返回目录总大小 (字节)，用于校正。"""
+        self.db_path = db_path
+        self.uploads_dir = os.path.abspath(uploads_dir)
+        self.dir_size = dir_size
+        self._stop = threading.Event()
+        self._reconcile_lock = ProcessLock(db_path + '-quota.lock')
+
+    def _db(self):
+        return database.get_connection(self.db_path)
+
+    def owner_of(self, abs_path):
+        """返回路径所属的用户名 (UPLOADS_DIR 下的第一级目录)，不在任何用户目录中时返回 None。"""
+        rel = os.path.relpath(os.path.abspath(abs_path), self.uploads_dir)
+        if rel == '.' or rel.startswith('..'): return None
+        return rel.split(os.sep, 1)[0]
+
+    def usage(self, username):
+        """返回 (已用字节, 配额字节)；用户不存在时返回 None。"""
+        row = self._db().execute('SELECT used_bytes, quota_bytes FROM users WHERE username = ?', (username,)).fetchone()
+        return (row['used_bytes'], row['quota_bytes']) if row else None
+
+    def would_exceed(self, username, incoming_bytes):
+        usage = self.usage(username) if username else None
+        if usage is None: return False
+        used, quota = usage
+        return quota > 0 and used + incoming_bytes > quota
+
+    def adjust(self, username, delta):
+        if not username or not delta: return
+        conn = self._db()
+        with conn:
+            conn.execute('UPDATE users SET used_bytes = MAX(0, used_bytes + ?) WHERE username = ?', (delta, username))
+
+    # --- 定期校正 ---
+    def reconcile(self):
+        """按实际目录大小重新计算所有普通用户的已用空间。"""
+        users = self._db().execute("SELECT username FROM users WHERE role = 'user'").fetchall()
+        for row in users:
+            user_dir = os.path.join(self.uploads_dir, row['username'])
+            try:
+                size = self.dir_size(user_dir) if os.path.isdir(user_dir) else 0
+            except OSError:
+                continue
+            if size < 0: continue
+            conn = self._db()
+            with conn:
+                conn.execute('UPDATE users SET used_bytes = ? WHERE username = ?', (size, row['username']))
+
+    def start_reconciler(self, interval):
+        def run():
+            # 启动时先校正一次，之后每隔 interval 秒一次
+            while True:
+                try:
+                    if self._reconcile_lock.acquire(): self.reconcile()
+                except Exception:
+                    logger.exception('校正用户已用空间失败')
+                finally:
+                    database.release_connections()
+                if self._stop.wait(interval): return
+        threading.Thread(target=run, name='quota-reconcile', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import threading
+import database
+from process_lock import ProcessLock
+
+# --- 文件名索引 ---
+# 在 UPLOADS_DIR 之外的独立 SQLite 文件中保存所有文件/文件夹的相对路径，
+# 使用 FTS5 trigram 分词实现子串搜索，避免每次搜索都 os.walk 整个目录树。
+# trigram 无法用索引匹配少于 3 个字符的查询 (中文文件名中很常见)，因此另建一个 FTS5 表 entries_grams，
+# 保存每个名称中所有 1、2 个字符的子串，短查询先从中取得候选再用 LIKE 确认。
+# 两个 FTS5 表都按 rowid (即 entries.id) 顺序返回结果，查询按 id 游标翻页，不需要排序全部匹配项。
+
+BATCH_SIZE = 5000
+
+
+def name_grams(name):
+    """名称中所有不重复的 1、2 个字符的子串，排序后以空格分隔 (删除时需要得到与写入时相同的文本)。"""
+    name = name.lower()
+    return ' '.join(sorted(set(name) | {name[i:i + 2] for i in range(len(name) - 1)}))
+
+
+database.sql_functions['name_grams'] = (1, name_grams)
+
+
+class FileNameIndex:
+    """
+    以 UPLOADS_DIR 为根的文件名索引。路径统一保存为以 '/' 分隔的相对路径。
+    """
+
+    def __init__(self, db_path, root_dir):
+        self.db_path = db_path
+        self.root_dir = os.path.abspath(root_dir)
+        self._rebuild_lock = threading.Lock()
+        self._process_lock = ProcessLock(db_path + '.lock')
+        self._rebuilding = False
+        self._current_gen = 0
+        self.use_fts = True
+        self._init_schema()
+
+    # --- 连接与表结构 ---
+    def _connect(self):
+        return database.get_connection(self.db_path)
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY,
+            path TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            is_dir INTEGER NOT NULL,
+            gen INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        ''')
+        try:
+            conn.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                name, content='entries', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                INSERT INTO entries_fts(rowid, name) VALUES (new.id, new.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            END;
+            CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF name ON entries BEGIN
+                INSERT INTO entries_fts(entries_fts, rowid, name) VALUES ('delete', old.id, old.name);
+                INSERT INTO entries_fts(rowid, name) VALUES (new.id, new.name);
+            END;
+            ''')
+        except sqlite3.OperationalError:
+            # 当前 SQLite 未编译 FTS5 或不支持 trigram，退化为 LIKE 查询
+            self.use_fts = False
+        conn.commit()
+        if self.use_fts: self._init_grams(conn)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'gen'").fetchone()
+        self._current_gen = int(row[0]) if row else 0
+
+    @staticmethod
+    def _init_grams(conn):
+        # 不保存原文 (content='')、不记录词位置 (detail='none')，索引只占很少的空间；
+        # 已有索引升级时在同一个事务中为现有条目补全，多个进程同时启动时只有一个执行
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_grams'").fetchone():
+                conn.execute("CREATE VIRTUAL TABLE entries_grams USING fts5(grams, content='', detail='none')")
+                conn.execute('INSERT INTO entries_grams(rowid, grams) SELECT id, name_grams(name) FROM entries')
+            for statement in (
+                '''CREATE TRIGGER IF NOT EXISTS entries_grams_ai AFTER INSERT ON entries BEGIN
+                    INSERT INTO entries_grams(rowid, grams) VALUES (new.id, name_grams(new.name));
+                END''',
+                '''CREATE TRIGGER IF NOT EXISTS entries_grams_ad AFTER DELETE ON entries BEGIN
+                    INSERT INTO entries_grams(entries_grams, rowid, grams) VALUES ('delete', old.id, name_grams(old.name));
+                END''',
+                '''CREATE TRIGGER IF NOT EXISTS entries_grams_au AFTER UPDATE OF name ON entries BEGIN
+                    INSERT INTO entries_grams(entries_grams, rowid, grams) VALUES ('delete', old.id, name_grams(old.name));
+                    INSERT INTO entries_grams(rowid, grams) VALUES (new.id, name_grams(new.name));
+                END'''):
+                conn.execute(statement)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    # --- 路径换算 ---
+    def to_key(self, abs_path):
+        return os.path.relpath(os.path.abspath(abs_path), self.root_dir).replace('\\', '/')
+
+    @staticmethod
+    def _prefix_range(key):
+        # 'a/b/' 到 'a/b0' 之间的字符串恰好是 'a/b/' 下的所有子路径 ('0' 紧跟在 '/' 之后)
+        return key + '/', key + '0'
+
+    def is_ready(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'ready'").fetchone()
+        return bool(row and row[0] == '1')
+
+    def is_rebuilding(self):
+        return self._rebuilding
+
+    # --- 增量维护 ---
+    def add(self, abs_path, is_dir):
+        key = self.to_key(abs_path)
+        if key == '.' or key.startswith('..'): return
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO entries (path, name, is_dir, gen) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, gen = excluded.gen',
+            (key, os.path.basename(key), int(is_dir), self._current_gen))
+        conn.commit()
+
+    def add_tree(self, abs_path):
+        """索引一个目录及其下的全部内容 (用于移入的新目录)。"""
+        self.add(abs_path, True)
+        conn = self._connect()
+        self._index_walk(conn, abs_path, self._current_gen)
+        conn.commit()
+
+    def remove(self, abs_path):
+        key = self.to_key(abs_path)
+        if key.startswith('..'): return
+        conn = self._connect()
+        if key == '.':
+            conn.execute('DELETE FROM entries')
+        else:
+            lo, hi = self._prefix_range(key)
+            conn.execute('DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)', (key, lo, hi))
+        conn.commit()
+
+    def move(self, old_abs_path, new_abs_path):
+        old_key, new_key = self.to_key(old_abs_path), self.to_key(new_abs_path)
+        if old_key.startswith('..') or new_key.startswith('..'): return
+        old_lo, old_hi = self._prefix_range(old_key)
+        new_lo, new_hi = self._prefix_range(new_key)
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM entries WHERE path = ? OR (path >= ? AND path < ?)', (new_key, new_lo, new_hi))
+            conn.execute('UPDATE entries SET path = ?, name = ? WHERE path = ?',
+                         (new_key, os.path.basename(new_key), old_key))
+            conn.execute('UPDATE entries SET path = ? || substr(path, ?) WHERE path >= ? AND path < ?',
+                         (new_key, len(old_key) + 1, old_lo, old_hi))
+
+    def sync_dir(self, abs_dir):
+        """
+        让索引中 abs_dir 的直接子项与磁盘一致 (用于绕过路由的外部修改)：
+        删除已不存在的条目及其子树，新出现的目录连同其内容一起索引。
+        """
+        key = self.to_key(abs_dir)
+        if key.startswith('..'): return
+        try:
+            with os.scandir(abs_dir) as it:
+                on_disk = {}
+                for entry in it:
+                    try: on_disk[entry.name] = entry.is_dir(follow_symlinks=False)
+                    except OSError: on_disk[entry.name] = False
+        except FileNotFoundError:
+            if key != '.': self.remove(abs_dir)
+            return
+        conn = self._connect()
+        if key == '.':
+            indexed = conn.execute("SELECT name, is_dir FROM entries WHERE instr(path, '/') = 0").fetchall()
+        else:
+            lo, hi = self._prefix_range(key)
+            indexed = conn.execute("SELECT name, is_dir FROM entries WHERE path >= ? AND path < ? AND instr(substr(path, ?), '/') = 0",
+                                   (lo, hi, len(lo) + 1)).fetchall()
+        indexed = {row[0]: bool(row[1]) for row in indexed}
+        for name, was_dir in indexed.items():
+            if on_disk.get(name) != was_dir:
+                self.remove(os.path.join(abs_dir, name))
+        for name, is_dir in on_disk.items():
+            if indexed.get(name) == is_dir: continue
+            if is_dir: self.add_tree(os.path.join(abs_dir, name))
+            else: self.add(os.path.join(abs_dir, name), False)
+
+    # --- 全量重建 ---
+    def _index_walk(self, conn, start_dir, gen):
+        batch, stack = [], [start_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try: is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError: is_dir = False
+                        batch.append((self.to_key(entry.path), entry.name, int(is_dir), gen))
+                        if is_dir: stack.append(entry.path)
+            except OSError:
+                continue
+            if len(batch) >= BATCH_SIZE:
+                self._write_batch(conn, batch)
+                batch = []
+        if batch: self._write_batch(conn, batch)
+
+    @staticmethod
+    def _write_batch(conn, batch):
+        conn.executemany(
+            'INSERT INTO entries (path, name, is_dir, gen) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET is_dir = excluded.is_dir, gen = excluded.gen',
+            batch)
+        conn.commit()
+
+    def rebuild(self):
+        """全量重建索引；其他进程正在重建时直接返回 False。"""
+        with self._rebuild_lock:
+            if not self._process_lock.acquire(): return False
+            self._rebuilding = True
+            try:
+                conn = self._connect()
+                # 新一代编号：遍历到的条目使用新编号，结束时核对剩下的旧编号条目。
+                # 其他进程的路由在重建期间写入的条目仍是旧编号 (各进程的编号不同步)，因此只删除磁盘上已不存在的路径
+                row = conn.execute("SELECT value FROM meta WHERE key = 'gen'").fetchone()
+                gen = max(self._current_gen, int(row[0]) if row else 0) + 1
+                self._current_gen = gen
+                self._index_walk(conn, self.root_dir, gen)
+                stale = conn.execute('SELECT id, path FROM entries WHERE gen < ?', (gen,)).fetchall()
+                missing = [(i,) for i, path in stale if not os.path.lexists(os.path.join(self.root_dir, path))]
+                with conn:
+                    conn.executemany('DELETE FROM entries WHERE id = ?', missing)
+                    conn.execute('UPDATE entries SET gen = ? WHERE gen < ?', (gen, gen))
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('gen', ?)", (str(gen),))
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('ready', '1')")
+                if self.use_fts:
+                    conn.execute("INSERT INTO entries_fts(entries_fts) VALUES ('optimize')")
+                    conn.execute("INSERT INTO entries_grams(entries_grams) VALUES ('optimize')")
+                    conn.commit()
+            finally:
+                self._rebuilding = False
+                self._process_lock.release()
+            return True
+
+    def rebuild_async(self):
+        if self._rebuilding: return False
+        threading.Thread(target=self.rebuild, name='file-index-rebuild', daemon=True).start()
+        return True
+
+    # --- 查询 ---
+    def search(self, query, scope_abs_dir, limit, after=None, before=None):
+        """
+        在 scope_abs_dir 范围内按名称子串搜索，按 id 顺序返回 (id, path, name, is_dir) 列表，
+        path 为相对于 UPLOADS_DIR 的路径。after/before 为上一页最后/下一页第一个结果的 id。
+        """
+        scope = self.to_key(scope_abs_dir)
+        where, params = [], []
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        if self.use_fts and len(query) >= 3:
+            sql = 'SELECT e.id, e.path, e.name, e.is_dir FROM entries_fts f JOIN entries e ON e.id = f.rowid'
+            where.append('entries_fts MATCH ?')
+            params.append('"' + query.replace('"', '""') + '"')
+        elif self.use_fts and any(ch.isalnum() for ch in query):
+            # 候选中可能混入分词时被标点拆开的子串 (如 '_1' 只索引了 '1')，由 LIKE 排除
+            sql = 'SELECT e.id, e.path, e.name, e.is_dir FROM entries_grams f JOIN entries e ON e.id = f.rowid'
+            where.extend(['entries_grams MATCH ?', "e.name LIKE ? ESCAPE '\\'"])
+            params.extend(['"' + query.replace('"', '""') + '"', f'%{escaped}%'])
+        else:
+            # 只包含标点的短查询没有可用的索引，逐行扫描
+            sql = 'SELECT e.id, e.path, e.name, e.is_dir FROM entries e'
+            where.append("e.name LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+        order = 'f.rowid' if 'JOIN' in sql else 'e.id'
+        if after is not None:
+            where.append(f'{order} > ?')
+            params.append(after)
+        if before is not None:
+            where.append(f'{order} < ?')
+            params.append(before)
+        if scope != '.':
+            lo, hi = self._prefix_range(scope)
+            where.append('e.path >= ? AND e.path < ?')
+            params.extend([lo, hi])
+        # 向前翻页时倒序取出再反转，两个方向都由 FTS5/主键按 rowid 顺序直接产生，不需要排序
+        sql += ' WHERE ' + ' AND '.join(where) + f' ORDER BY {order} {"DESC" if before is not None else "ASC"} LIMIT ?'
+        params.append(limit)
+        rows = self._connect().execute(sql, params).fetchall()
+        return rows[::-1] if before is not None else rows
@@ -39,6 +39,17 @@ $(document).ready(function() {
         });
     });
 
+    // 重建文件索引
+    $('#rebuildIndexBtn').on('click', function() {
+        $.ajax({
+            url: '/admin/rebuild_index',
+            type: 'POST',
+            data: { csrf_token },
+            success: (response) => showAlert(response.message, 'success'),
+            error: (xhr) => showAlert(xhr.responseJSON.error, 'danger')
+        });
+    });
+
     // 添加用户
     $('#addUserForm').on('submit', function(e) {
         e.preventDefault();
@@ -64,6 +75,7 @@ $(document).ready(function() {
                         <td class="text-center"><i class="bi bi-check-lg text-success"></i></td>
                         <td class="text-center"><i class="bi bi-check-lg text-success"></i></td>
                         <td class="text-center"><i class="bi bi-check-lg text-success"></i></td>
+                        <td data-field="usage">${newUser.role === 'admin' ? '<em class="text-muted">-</em>' : '0.00 B / 不限'}</td>
                         <td class="text-end">
                             <button class="btn btn-sm btn-outline-secondary edit-user-btn" data-bs-toggle="modal" data-bs-target="#editUserModal">
                                 <i class="bi bi-pencil-square"></i> 编辑
@@ -92,12 +104,14 @@ $(document).ready(function() {
         const can_rename = row.find('input[name="can_rename"]').val() === 'true';
         const can_move = row.find('input[name="can_move"]').val() === 'true';
         const can_create_folder = row.find('input[name="can_create_folder"]').val() === 'true';
+        const quota_bytes = parseInt(row.find('input[name="quota_bytes"]').val() || '0', 10);
 
 
         $('#editUserId').val(userId);
         $('#editUsername').val(username);
         $('#editRole').val(role);
         $('#editPassword').val('');
+        $('#editQuota').val(quota_bytes ? +(quota_bytes / 1024 / 1024).toFixed(2) : 0);
         
         // 填充权限复选框
         $('#editCanUpload').prop('checked', can_upload);
@@ -120,6 +134,7 @@ $(document).ready(function() {
             can_rename: $('#editCanRename').is(':checked'),
             can_move: $('#editCanMove').is(':checked'),
             can_create_folder: $('#editCanCreateFolder').is(':checked'),
+            quota_mb: $('#editQuota').val() || 0,
             csrf_token: csrf_token
         };
 
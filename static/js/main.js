@@ -3,6 +3,7 @@ $(document).ready(function () {
     const selectAllCheckbox = $('#selectAll');
     const deleteSelectedBtn = $('#deleteSelectedBtn');
     const moveSelectedBtn = $('#moveSelectedBtn');
+    const downloadSelectedBtn = $('#downloadSelectedBtn');
     const fileListBody = $('#file-list-body');
     const emptyFolderRow = $('#empty-folder-row');
 
@@ -18,6 +19,12 @@ $(document).ready(function () {
         const checkedCount = fileListBody.find('.item-checkbox:checked').length;
         deleteSelectedBtn.prop('disabled', checkedCount === 0);
         moveSelectedBtn.prop('disabled', checkedCount === 0);
+        downloadSelectedBtn.prop('disabled', checkedCount === 0);
+    }
+
+    // showAlert 的消息按 HTML 插入，文件名和服务器返回的错误信息需要先转义
+    function escapeHtml(text) {
+        return $('<div>').text(String(text)).html();
     }
 
     function showAlert(message, category = 'success', duration = 5000) {
@@ -35,44 +42,69 @@ $(document).ready(function () {
         }
     }
 
+    // 路径中的每一段分别编码，文件名中的 #、? 等字符不会破坏 URL
+    function encodePath(path) {
+        return path.split('/').map(encodeURIComponent).join('/');
+    }
+
+    // 文件名来自用户输入，所有字段都通过 DOM API 写入 (text/attr)，不拼接进 HTML
     function createTableRow(item) {
-        const previewBtnHtml = item.previewable ? `
-            <button type="button" class="btn btn-sm btn-outline-info preview-btn"
-                    data-bs-toggle="modal" data-bs-target="#previewModal"
-                    data-path="${item.path}" data-name="${item.name}">
-                <i class="bi bi-eye"></i> 预览
-            </button>` : '';
-
-        const renameBtnHtml = user_permissions.can_rename ? `
-            <button type="button" class="btn btn-sm btn-outline-secondary rename-btn" 
-                    data-bs-toggle="modal" data-bs-target="#renameModal" 
-                    data-old-name="${item.name}">
-                <i class="bi bi-pencil-square"></i> 重命名
-            </button>` : '';
-
-        const downloadBtnHtml = item.is_dir ? '' : `
-            <a href="/download/${item.path}" class="btn btn-sm btn-outline-primary"><i class="bi bi-download"></i> 下载</a>`;
-        
-        const sizeHtml = item.is_dir ? 
-            `<span class="dir-size-display" data-path="${item.path}">-</span>
-             <button type="button" class="btn btn-sm btn-outline-secondary p-0 px-1 ms-1 calc-dir-size-btn" data-path="${item.path}" title="计算目录大小">
-                 <i class="bi bi-calculator"></i>
-             </button>` : 
-            item.size;
-
-        const nameHtml = item.is_dir ? 
-            `<i class="bi bi-folder-fill text-primary"></i> <a href="/${item.path}" class="text-decoration-none text-dark fw-bold">${item.name}</a>` :
-            `<i class="bi bi-file-earmark-text text-secondary"></i> <span>${item.name}</span>`;
-
-        return `
-            <tr data-name="${item.name}">
-                <td><input class="form-check-input item-checkbox" type="checkbox" name="items[]" value="${item.name}"></td>
-                <td>${nameHtml}</td>
-                <td><small class="text-muted">${sizeHtml}</small></td>
-                <td class="text-end">${previewBtnHtml} ${renameBtnHtml} ${downloadBtnHtml}</td>
-            </tr>`;
+        const $name = $('<td>');
+        if (item.is_dir) {
+            $name.append('<i class="bi bi-folder-fill text-primary"></i> ',
+                $('<a class="text-decoration-none text-dark fw-bold">').attr('href', '/' + encodePath(item.path)).text(item.name));
+        } else {
+            $name.append(item.thumb ? $('<img class="item-thumb" loading="lazy" alt="">').attr('src', item.thumb)
+                                    : $('<i class="bi bi-file-earmark-text text-secondary"></i>'),
+                ' ', $('<span>').text(item.name));
+        }
+
+        const $size = $('<small class="text-muted">');
+        if (item.is_dir) {
+            $size.append(
+                $('<span class="dir-size-display">-</span>').attr('data-path', item.path),
+                $('<button type="button" class="btn btn-sm btn-outline-secondary p-0 px-1 ms-1 calc-dir-size-btn" title="计算目录大小"><i class="bi bi-calculator"></i></button>')
+                    .attr('data-path', item.path));
+        } else {
+            $size.text(item.size);
+        }
+
+        const $actions = $('<td class="text-end">');
+        if (item.previewable) {
+            $actions.append($('<button type="button" class="btn btn-sm btn-outline-info preview-btn" data-bs-toggle="modal" data-bs-target="#previewModal"><i class="bi bi-eye"></i> 预览</button>')
+                .attr({ 'data-path': item.path, 'data-name': item.name }), ' ');
+        }
+        if (user_permissions.can_rename) {
+            $actions.append($('<button type="button" class="btn btn-sm btn-outline-secondary rename-btn" data-bs-toggle="modal" data-bs-target="#renameModal"><i class="bi bi-pencil-square"></i> 重命名</button>')
+                .attr('data-old-name', item.name), ' ');
+        }
+        $actions.append($('<a class="btn btn-sm btn-outline-primary"><i class="bi bi-download"></i> 下载</a>')
+            .attr('href', '/download/' + encodePath(item.path)));
+
+        return $('<tr>').attr('data-name', item.name).append(
+            $('<td>').append($('<input class="form-check-input item-checkbox" type="checkbox" name="items[]">').val(item.name)),
+            $name,
+            $('<td>').append($size),
+            $('<td>').append($('<small class="text-muted item-mtime">').text(item.mtime || '')),
+            $actions);
     }
 
+    // 缩略图生成超时时服务器返回 503，稍后重新加载，最多重试 THUMB_MAX_RETRIES 次
+    const THUMB_RETRY_DELAY = 3000;
+    const THUMB_MAX_RETRIES = 5;
+    document.addEventListener('error', function (e) {
+        const img = e.target;
+        if (!(img instanceof HTMLImageElement) || !img.classList.contains('item-thumb')) return;
+        const retries = Number(img.dataset.retries || 0);
+        if (retries >= THUMB_MAX_RETRIES) return;
+        img.dataset.retries = retries + 1;
+        setTimeout(() => {
+            const url = new URL(img.src, window.location.href);
+            url.searchParams.set('retry', retries + 1);
+            img.src = url.toString();
+        }, THUMB_RETRY_DELAY);
+    }, true);
+
     function getSelectedItems() {
         return fileListBody.find('.item-checkbox:checked').map(function() {
             return $(this).val();
@@ -144,7 +176,8 @@ $(document).ready(function () {
                 const newPath = current_path ? `${current_path}/${newName}` : newName;
                 const newItem = {
                     name: newName, is_dir: isDir, path: newPath,
-                    size: oldRow.find('small').text(), 
+                    size: oldRow.find('small').first().text(),
+                    mtime: oldRow.find('.item-mtime').text(),
                     previewable: !isDir && isPreviewable(newName)
                 };
                 oldRow.replaceWith(createTableRow(newItem));
@@ -162,13 +195,65 @@ $(document).ready(function () {
         const previewFrame = document.getElementById('previewFrame');
 
         modalTitle.textContent = `预览: ${fileName}`;
-        previewFrame.src = `/view/${filePath}`;
+        previewFrame.src = '/view/' + encodePath(filePath);
     });
 
     previewModalElement.addEventListener('hidden.bs.modal', function () {
         document.getElementById('previewFrame').src = 'about:blank';
     });
 
+    // 批量删除/移动在服务器后台执行：提交后得到任务 ID，轮询进度直到完成
+    // 执行任务的进程退出时服务器会把任务标记为失败；查询连续出错 JOB_POLL_MAX_ERRORS 次或轮询超过
+    // JOB_POLL_TIMEOUT 后停止轮询并提示，不再无限期等待
+    const JOB_POLL_INTERVAL = 1000;
+    const JOB_POLL_MAX_INTERVAL = 5000;
+    const JOB_POLL_MAX_ERRORS = 3;
+    const JOB_POLL_TIMEOUT = 60 * 60 * 1000;
+    function pollJob(jobId, label, onFinished, state = { started: Date.now(), interval: JOB_POLL_INTERVAL, errors: 0 }) {
+        const retry = (message) => {
+            if (Date.now() - state.started > JOB_POLL_TIMEOUT) {
+                showAlert(`${label}仍未完成，已停止查询进度，请稍后刷新页面查看结果`, 'warning');
+                return;
+            }
+            if (message) showAlert(message, 'info', 0);
+            setTimeout(() => pollJob(jobId, label, onFinished, state), state.interval);
+            state.interval = Math.min(state.interval * 2, JOB_POLL_MAX_INTERVAL);
+        };
+        $.getJSON(`/api/jobs/${jobId}`).done(function(job) {
+            state.errors = 0;
+            if (job.status === 'queued' || job.status === 'running') {
+                retry(`正在${label}... (${job.done}/${job.total})`);
+                return;
+            }
+            onFinished(job.result || { error: `${label}失败`, code: 500 });
+        }).fail(function(xhr) {
+            // 404 表示任务已不存在，不必重试
+            if (xhr.status === 404 || ++state.errors >= JOB_POLL_MAX_ERRORS) {
+                const error = xhr.responseJSON ? xhr.responseJSON.error : `无法获取${label}进度`;
+                showAlert(`${escapeHtml(error)}，请刷新页面查看结果`, 'danger');
+                return;
+            }
+            retry();
+        });
+    }
+
+    function removeRowsAfterJob(result, names) {
+        if (result.code === 200) {
+            showAlert(result.message, 'success');
+        } else {
+            const details = (result.errors || []).map(e => escapeHtml(`${e.name}: ${e.error}`)).join('<br>');
+            const error = escapeHtml(result.error);
+            showAlert(details ? `${error}<br>${details}` : error, 'danger');
+        }
+        // 名称可能包含引号等字符，不拼接到选择器中
+        const removed = new Set(names || []);
+        fileListBody.children('tr').filter(function() { return removed.has($(this).attr('data-name')); }).remove();
+        toggleActionButtons();
+        if (fileListBody.children().length === 0) {
+            emptyFolderRow.show();
+        }
+    }
+
     // 删除
     deleteSelectedBtn.on('click', () => deleteConfirmModal.show());
     $('#confirmDeleteBtn').on('click', function() {
@@ -179,14 +264,8 @@ $(document).ready(function () {
             traditional: true, 
             success: function(response) {
                 deleteConfirmModal.hide();
-                showAlert(response.message, 'success');
-                response.deleted.forEach(name => {
-                    fileListBody.find(`tr[data-name="${name}"]`).remove();
-                });
-                toggleActionButtons();
-                if (fileListBody.children().length === 0) {
-                    emptyFolderRow.show();
-                }
+                showAlert(response.message, 'info', 0);
+                pollJob(response.job_id, '删除', (result) => removeRowsAfterJob(result, result.deleted));
             },
             error: (xhr) => showAlert(xhr.responseJSON.error, 'danger')
         });
@@ -203,92 +282,230 @@ $(document).ready(function () {
             traditional: true,
             success: function(response) {
                 moveModal.hide();
-                showAlert(response.message, 'success');
-                response.moved.forEach(name => {
-                    fileListBody.find(`tr[data-name="${name}"]`).remove();
-                });
-                toggleActionButtons();
-                 if (fileListBody.children().length === 0) {
-                    emptyFolderRow.show();
-                }
+                showAlert(response.message, 'info', 0);
+                pollJob(response.job_id, '移动', (result) => removeRowsAfterJob(result, result.moved));
             },
             error: (xhr) => showAlert(xhr.responseJSON.error, 'danger')
         });
     });
 
-    // 填充目录选择下拉框
-    $('#uploadModal, #moveModal').on('show.bs.modal', function () {
-        $.getJSON('/api/get_dirs', function (dirs) {
-            const $uploadSelect = $('#destinationPathUpload');
-            const $moveSelect = $('#destinationFolderMove');
-            function buildDirOptions(dirs, selectElement, level = 0) {
-                dirs.forEach(dir => {
-                    const prefix = ' '.repeat(level * 4) + (level > 0 ? '└─ ' : '');
-                    selectElement.append($('<option>', { value: dir.path, html: prefix + dir.name }));
-                    if (dir.children && dir.children.length > 0) {
-                        buildDirOptions(dir.children, selectElement, level + 1);
-                    }
-                });
-            }
-            $uploadSelect.empty().append($('<option>', { value: '', html: '根目录' }));
-            $moveSelect.empty().append($('<option>', { value: '', html: '根目录' }));
-            buildDirOptions(dirs, $uploadSelect);
-            buildDirOptions(dirs, $moveSelect);
-            $uploadSelect.val(current_path);
+    // 打包下载：以普通表单提交，由浏览器直接接收服务器边打包边发送的 ZIP 流
+    downloadSelectedBtn.on('click', function() {
+        const form = $('<form>', { method: 'POST', action: '/download_zip' });
+        form.append($('<input>', { type: 'hidden', name: 'current_path', value: current_path }));
+        form.append($('<input>', { type: 'hidden', name: 'csrf_token', value: csrf_token }));
+        getSelectedItems().forEach(name => {
+            form.append($('<input>', { type: 'hidden', name: 'items[]', value: name }));
         });
+        form.appendTo('body').submit().remove();
     });
 
-    // 文件上传逻辑
-    $('#startUploadBtn').on('click', function () {
+    // 目录选择器：打开模态框时只加载第一层，点击箭头时再按需加载下一层
+    function renderDirNodes(dirs) {
+        return dirs.map(dir => $('<li>').attr('data-path', dir.path).append(
+            $('<span class="dir-toggle">').html(dir.has_children ? '<i class="bi bi-caret-right-fill"></i>' : ''),
+            $('<a href="#" class="dir-select text-decoration-none text-dark"><i class="bi bi-folder"></i> </a>').append(document.createTextNode(dir.name)),
+            '<ul class="list-unstyled ms-3 mb-0 dir-children" style="display: none;"></ul>'));
+    }
+
+    function selectDir($picker, path) {
+        $($picker.data('input')).val(path);
+        $picker.find('.dir-select').removeClass('active');
+        $picker.find('li').filter(function() { return $(this).attr('data-path') === path; })
+            .children('.dir-select').addClass('active');
+        $picker.closest('.modal').find('.dir-picker-selected').text(path || '根目录');
+    }
+
+    function initDirPicker($picker, selectedPath) {
+        $picker.html(`
+            <ul class="list-unstyled mb-0">
+                <li data-path="">
+                    <span class="dir-toggle"></span>
+                    <a href="#" class="dir-select text-decoration-none text-dark"><i class="bi bi-house-door"></i> 根目录</a>
+                    <ul class="list-unstyled ms-3 mb-0 dir-children" data-loaded="true"></ul>
+                </li>
+            </ul>`);
+        selectDir($picker, selectedPath);
+        $.getJSON('/api/dir_tree', { path: '' }, function (data) {
+            $picker.find('.dir-children').first().empty().append(renderDirNodes(data.children));
+        });
+    }
+
+    $('.dir-picker').on('click', '.dir-toggle', function () {
+        const $li = $(this).closest('li');
+        const $children = $li.children('.dir-children');
+        const $icon = $(this).find('i');
+        if (!$icon.length) return;
+        const expanded = $children.is(':visible');
+        $icon.toggleClass('bi-caret-right-fill', expanded).toggleClass('bi-caret-down-fill', !expanded);
+        if (expanded) {
+            $children.hide();
+        } else if ($children.attr('data-loaded')) {
+            $children.show();
+        } else {
+            $.getJSON('/api/dir_tree', { path: $li.attr('data-path') }, function (data) {
+                $children.attr('data-loaded', 'true').empty().append(renderDirNodes(data.children)).show();
+            });
+        }
+    });
+
+    $('.dir-picker').on('click', '.dir-select', function (e) {
+        e.preventDefault();
+        selectDir($(this).closest('.dir-picker'), $(this).closest('li').attr('data-path'));
+    });
+
+    $('#uploadModal').on('show.bs.modal', function () {
+        initDirPicker($(this).find('.dir-picker'), current_path);
+    });
+    $('#moveModal').on('show.bs.modal', function () {
+        initDirPicker($(this).find('.dir-picker'), '');
+    });
+
+    // 文件上传逻辑：大文件切分为固定大小的分块并发上传，失败的分块自动重试；
+    // 会话 ID 保存在 localStorage 中，中断后重新选择同一文件即可从缺失的分块继续
+    const UPLOAD_CONCURRENCY = 4;
+    const UPLOAD_MAX_RETRIES = 3;
+
+    function uploadSessionKey(file, destination) {
+        return `upload:${destination}:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function apiRequest(method, url, body, headers = {}) {
+        return fetch(url, {
+            method: method, body: body, credentials: 'same-origin',
+            headers: Object.assign({ 'X-CSRFToken': csrf_token }, headers)
+        }).then(res => res.json().catch(() => ({})).then(data => {
+            if (!res.ok) throw new Error(data.error || `上传失败 (HTTP ${res.status})`);
+            return data;
+        }));
+    }
+
+    async function openUploadSession(file, destination) {
+        const key = uploadSessionKey(file, destination);
+        const savedId = localStorage.getItem(key);
+        if (savedId) {
+            try {
+                return await apiRequest('GET', `/upload/chunked/${savedId}`);
+            } catch (e) {
+                localStorage.removeItem(key);
+            }
+        }
+        const form = new FormData();
+        form.append('destination_path', destination);
+        form.append('filename', file.name);
+        form.append('size', file.size);
+        const uploadSession = await apiRequest('POST', '/upload/chunked', form);
+        localStorage.setItem(key, uploadSession.upload_id);
+        return uploadSession;
+    }
+
+    async function putChunk(uploadSession, file, index) {
+        const start = index * uploadSession.chunk_size;
+        const blob = file.slice(start, Math.min(start + uploadSession.chunk_size, file.size));
+        for (let attempt = 0; ; attempt++) {
+            try {
+                await apiRequest('PUT', `/upload/chunked/${uploadSession.upload_id}/${index}`, blob,
+                                 { 'Content-Type': 'application/octet-stream' });
+                return blob.size;
+            } catch (e) {
+                if (attempt >= UPLOAD_MAX_RETRIES) throw e;
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+            }
+        }
+    }
+
+    async function uploadFile(file, destination, onProgress) {
+        const uploadSession = await openUploadSession(file, destination);
+        const missing = uploadSession.missing.slice();
+        const chunkSize = uploadSession.chunk_size;
+        const pendingBytes = missing.reduce((sum, i) => sum + Math.min(chunkSize, file.size - i * chunkSize), 0);
+        onProgress(file.size - pendingBytes);
+        const workers = Array.from({ length: Math.min(UPLOAD_CONCURRENCY, missing.length) }, async () => {
+            while (missing.length > 0) {
+                onProgress(await putChunk(uploadSession, file, missing.shift()));
+            }
+        });
+        await Promise.all(workers);
+        await apiRequest('POST', `/upload/chunked/${uploadSession.upload_id}/finalize`);
+        localStorage.removeItem(uploadSessionKey(file, destination));
+    }
+
+    $('#startUploadBtn').on('click', async function () {
         const files = $('#fileInput')[0].files;
         if (files.length === 0) {
             showAlert('请先选择要上传的文件！', 'warning');
             return;
         }
-        const formData = new FormData();
-        for (let i = 0; i < files.length; i++) {
-            formData.append('files[]', files[i]);
-        }
-        formData.append('destination_path', $('#destinationPathUpload').val());
-        formData.append('csrf_token', csrf_token);
+        const destination = $('#destinationPathUpload').val();
+        const progressBar = $('#uploadProgressBar');
+        const totalBytes = Array.from(files).reduce((sum, f) => sum + f.size, 0);
+        let uploadedBytes = 0;
+        const onProgress = (bytes) => {
+            uploadedBytes += bytes;
+            const percentComplete = totalBytes ? Math.round((uploadedBytes / totalBytes) * 100) : 100;
+            progressBar.width(percentComplete + '%').text(percentComplete + '%');
+        };
 
-        $.ajax({
-            url: '/upload/', type: 'POST',
-            data: formData, processData: false, contentType: false,
-            xhr: function() {
-                const xhr = new window.XMLHttpRequest();
-                const progressBar = $('#uploadProgressBar');
-                $('#uploadProgressContainer').show();
-                $('#uploadSuccessMessage').hide();
-                progressBar.width('0%').text('0%').removeClass('bg-success');
-                xhr.upload.addEventListener('progress', function(evt) {
-                    if (evt.lengthComputable) {
-                        const percentComplete = Math.round((evt.loaded / evt.total) * 100);
-                        progressBar.width(percentComplete + '%').text(percentComplete + '%');
-                    }
-                }, false);
-                return xhr;
-            },
-            success: function(res) {
-                $('#uploadProgressBar').addClass('bg-success');
-                $('#uploadSuccessMessage').show();
-                setTimeout(() => window.location.reload(), 1000); 
-            },
-            error: (err) => {
-                showAlert(err.responseJSON ? err.responseJSON.error : '上传失败', 'danger');
-                $('#uploadProgressContainer').hide();
+        $('#uploadProgressContainer').show();
+        $('#uploadSuccessMessage').hide();
+        progressBar.width('0%').text('0%').removeClass('bg-success');
+        $(this).prop('disabled', true);
+        try {
+            for (const file of files) {
+                await uploadFile(file, destination, onProgress);
             }
-        });
+            progressBar.addClass('bg-success');
+            $('#uploadSuccessMessage').show();
+            setTimeout(() => window.location.reload(), 1000);
+        } catch (e) {
+            showAlert(`${e.message}，重新开始上传将从中断处继续`, 'danger');
+            $('#uploadProgressContainer').hide();
+        } finally {
+            $(this).prop('disabled', false);
+        }
     });
 
+    // 滚动到列表底部时按游标分页加载剩余条目。已加载的行保留在 DOM 中 (勾选、全选、删除/移动后移除行都基于这些行)，
+    // 没有做行回收；首屏只渲染一页，超大目录只有真正滚动到的部分才会被请求和渲染
+    const listingSentinel = $('#listing-sentinel');
+    let listingLoading = false;
+    function loadMoreItems(observer) {
+        const cursor = listingSentinel.attr('data-next-cursor');
+        if (!cursor || listingLoading) return;
+        listingLoading = true;
+        $.getJSON('/api/list/' + encodePath(current_path), { cursor: cursor, sort: listing_sort, order: listing_order })
+            .done(function(data) {
+                fileListBody.append(data.items.map(item => createTableRow(item)));
+                $('#listing-loaded-count').text(fileListBody.find('.item-checkbox').length);
+                selectAllCheckbox.prop('checked', false);
+                listingSentinel.attr('data-next-cursor', data.next_cursor || '');
+                if (data.next_cursor) {
+                    // 重新观察以便在哨兵仍然可见时立即加载下一页
+                    observer.unobserve(listingSentinel[0]);
+                    observer.observe(listingSentinel[0]);
+                } else {
+                    observer.disconnect();
+                    listingSentinel.hide();
+                }
+            })
+            .fail(() => showAlert('加载目录列表失败', 'danger'))
+            .always(() => { listingLoading = false; });
+    }
+    if (listingSentinel.attr('data-next-cursor') && 'IntersectionObserver' in window) {
+        const listingObserver = new IntersectionObserver(function(entries, observer) {
+            if (entries[0].isIntersecting) loadMoreItems(observer);
+        }, { rootMargin: '400px' });
+        listingObserver.observe(listingSentinel[0]);
+    }
+
     // 计算目录大小
     fileListBody.on('click', '.calc-dir-size-btn', function(e) {
         e.preventDefault();
         const $btn = $(this);
-        const dirPath = $btn.data('path');
-        const $sizeDisplay = $(`.dir-size-display[data-path="${dirPath}"]`);
+        const dirPath = $btn.attr('data-path');
+        const $sizeDisplay = $btn.siblings('.dir-size-display');
         $btn.prop('disabled', true).html('<i class="bi bi-hourglass-split"></i>');
-        $.getJSON(`/api/get_dir_size/${dirPath}`)
+        $.getJSON('/api/get_dir_size/' + encodePath(dirPath))
             .done(function(data) {
                 $sizeDisplay.text(data.size);
                 $btn.remove();
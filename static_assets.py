@@ -0,0 +1,120 @@
+import os
+import gzip
+import shutil
+import hashlib
+import logging
+import threading
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只生成 gzip 版本
+    brotli = None
+
+# --- 静态资源 ---
+# 模板中的静态资源 URL 带上内容哈希 (?v=...)，内容变化时 URL 随之变化，因此可以让浏览器长期缓存；
+# 可压缩的文件预先生成 gzip / brotli 版本保存在缓存目录中，按 Accept-Encoding 直接发送，不在请求中压缩。
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ttf', '.otf', '.eot'}
+MIN_COMPRESS_SIZE = 1024
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # 按优先顺序
+
+
+def tree_signature(*directories):
+    """根据目录下所有文件的路径、大小和 mtime 计算签名，用于判断模板或静态资源是否变化。"""
+    digest = hashlib.sha1()
+    for directory in directories:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                digest.update(f'{path}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()[:16]
+
+
+class StaticAssets:
+    def __init__(self, static_dir, cache_dir):
+        self.static_dir = static_dir
+        self.cache_dir = cache_dir
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, filename):
+        """返回静态文件内容哈希的前 12 位，文件不存在时返回 None。结果按 (mtime, 大小) 缓存。"""
+        path = safe_join(self.static_dir, filename)
+        if path is None: return None
+        try: st = os.stat(path)
+        except OSError: return None
+        cached = self._versions.get(filename)
+        if cached and cached[0] == (st.st_mtime_ns, st.st_size): return cached[1]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(block)
+        version = digest.hexdigest()[:12]
+        with self._lock:
+            self._versions[filename] = ((st.st_mtime_ns, st.st_size), version)
+        return version
+
+    # --- 预压缩 ---
+    def _variant_path(self, filename, suffix):
+        return safe_join(self.cache_dir, filename + suffix)
+
+    def compress_all(self):
+        """为所有可压缩的静态文件生成 gzip (以及 brotli) 版本，已是最新的跳过。"""
+        for dirpath, _, filenames in os.walk(self.static_dir):
+            for name in filenames:
+                if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS: continue
+                src = os.path.join(dirpath, name)
+                filename = os.path.relpath(src, self.static_dir).replace(os.sep, '/')
+                try:
+                    self._compress(src, filename)
+                except OSError as e:
+                    logger.warning('预压缩静态文件 %s 失败: %s', filename, e)
+
+    def compress_async(self):
+        threading.Thread(target=self.compress_all, name='static-compress', daemon=True).start()
+
+    def _compress(self, src, filename):
+        st = os.stat(src)
+        if st.st_size < MIN_COMPRESS_SIZE: return
+        for encoding, suffix in ENCODINGS:
+            if encoding == 'br' and brotli is None: continue
+            dest = self._variant_path(filename, suffix)
+            try:
+                if os.stat(dest).st_mtime_ns == st.st_mtime_ns: continue
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = f'{dest}.{os.getpid()}.tmp'
+            with open(src, 'rb') as f_in:
+                if encoding == 'br':
+                    with open(tmp, 'wb') as f_out: f_out.write(brotli.compress(f_in.read()))
+                else:
+                    with open(tmp, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as f_out:
+                        shutil.copyfileobj(f_in, f_out)
+            # 压缩版本的 mtime 与原文件一致，用于判断是否过期
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp, dest)
+
+    def variant(self, filename, accept_encodings):
+        """
+        返回 (压缩文件路径, 编码)；客户端不接受任何已生成的编码或压缩版本已过期时返回 None。
+        accept_encodings 为 request.accept_encodings。
+        """
+        src = safe_join(self.static_dir, filename)
+        if src is None: return None
+        try: src_mtime = os.stat(src).st_mtime_ns
+        except OSError: return None
+        for encoding, suffix in ENCODINGS:
+            if not accept_encodings[encoding]: continue
+            path = self._variant_path(filename, suffix)
+            try:
+                if path and os.stat(path).st_mtime_ns == src_mtime: return path, encoding
+            except OSError:
+                continue
+        return None
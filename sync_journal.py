@@ -0,0 +1,279 @@
+import os
+import time
+import posixpath
+import json
+import stat
+import hashlib
+import logging
+import threading
+import database
+import metrics
+from process_lock import ProcessLock
+
+# --- 同步接口 ---
+# 镜像脚本先获取一次清单 (路径、大小、mtime，可选内容哈希)，之后按游标拉取变更记录，只传输变化的部分。
+# 变更记录由修改文件的路由和文件系统监视器写入主数据库的 changes 表，游标就是记录编号。
+# 超过保留期的记录会被清理；游标早于清理位置 (或监视器无法确定变化范围) 时，客户端需要重新获取清单。
+#
+# 变更类型：
+#   put    - 文件被创建或覆盖，或目录被创建/移入 (目录需要重新获取该子树的清单)
+#   delete - 文件或目录 (及其全部内容) 被删除
+#   move   - 从 old_path 移动或重命名到 path
+#   rescan - 目录的直接子项被外部程序修改，需要重新获取该目录的非递归清单
+#
+# 按目录范围读取时，范围目录的上级被删除或移走返回 delete ''；上级被移入、创建或被外部修改返回 put ''
+# (重新获取整个范围的清单)。
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+FLOOR_KEY = 'change_journal_floor'
+
+
+class CursorExpired(Exception):
+    pass
+
+
+class ChangeJournal:
+    def __init__(self, db_path, root_dir, retention):
+        """retention 为变更记录和哈希缓存的保留时间 (秒)。"""
+        self.db_path = db_path
+        self.root_dir = os.path.abspath(root_dir)
+        self.retention = retention
+        self._stop = threading.Event()
+        self._prune_lock = ProcessLock(db_path + '-journal-prune.lock')
+
+    def _db(self):
+        return database.get_connection(self.db_path)
+
+    def to_key(self, abs_path):
+        return os.path.relpath(os.path.abspath(abs_path), self.root_dir).replace('\\', '/')
+
+    def to_abs(self, key):
+        return os.path.normpath(os.path.join(self.root_dir, key))
+
+    # --- 写入 ---
+    def record(self, op, abs_path, is_dir=False, old_abs_path=None):
+        key = self.to_key(abs_path)
+        old_key = self.to_key(old_abs_path) if old_abs_path else None
+        if key == '.' or key.startswith('..'): return
+        conn = self._db()
+        with conn:
+            conn.execute('INSERT INTO changes (op, path, old_path, is_dir, created_at) VALUES (?, ?, ?, ?, ?)',
+                         (op, key, old_key, int(is_dir), time.time()))
+
+    def record_external(self, dirs):
+        """文件系统监视器报告的变化；dirs 为 None 时无法确定范围，所有游标失效。"""
+        if dirs is None:
+            self.reset()
+            return
+        conn = self._db()
+        now = time.time()
+        with conn:
+            for directory in dirs:
+                key = self.to_key(directory)
+                if key.startswith('..'): continue
+                conn.execute("INSERT INTO changes (op, path, is_dir, created_at) VALUES ('rescan', ?, 1, ?)", (key, now))
+
+    def without_own_changes(self, dirs, window):
+        """
+        从监视器报告的目录中去掉最近 window 秒内路由已经记录过变化的目录。路由修改文件后已经更新了缓存和索引
+        并写入了变更记录，监视器随后收到的只是同一个变化的事件；记录来自任意进程，因此在数据库中查询。
+        """
+        rows = self._db().execute("SELECT path, old_path, is_dir FROM changes WHERE created_at >= ? "
+                                  "AND op IN ('put', 'delete', 'move')", (time.time() - window,)).fetchall()
+        if not rows: return dirs
+        parents, trees = set(), []
+        for row in rows:
+            for key in (row['path'], row['old_path']):
+                if key is None: continue
+                parents.add(posixpath.dirname(key) or '.')
+                # 目录整体被创建、删除或移动时，其中各级子目录的事件也都来自这次操作
+                if row['is_dir']: trees.append(key)
+        def own(directory):
+            key = self.to_key(directory)
+            return key in parents or any(key == tree or key.startswith(tree + '/') for tree in trees)
+        return {directory for directory in dirs if not own(directory)}
+
+    def reset(self):
+        """写入一条标记并把游标下限移到它，之前的所有游标失效。"""
+        conn = self._db()
+        with conn:
+            cursor = conn.execute("INSERT INTO changes (op, path, is_dir, created_at) VALUES ('reset', '.', 1, ?)",
+                                  (time.time(),)).lastrowid
+            self._set_floor(conn, cursor)
+
+    # --- 读取 ---
+    def current_cursor(self):
+        row = self._db().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def _floor(self, conn):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (FLOOR_KEY,)).fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _set_floor(conn, cursor):
+        conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (FLOOR_KEY, str(cursor)))
+
+    def changes(self, scope_abs_dir, cursor, limit):
+        """
+        返回 scope_abs_dir 范围内游标之后的变更 (changes, 新游标, 是否还有更多)，路径相对于 scope_abs_dir。
+        游标已被清理或不属于当前数据库时抛出 CursorExpired。
+        """
+        conn = self._db()
+        latest = self.current_cursor()
+        if cursor < self._floor(conn) or cursor > latest: raise CursorExpired()
+        scope = self.to_key(scope_abs_dir)
+        sql = 'SELECT id, op, path, old_path, is_dir, created_at FROM changes WHERE id > ? AND id <= ?'
+        params = [cursor, latest]
+        ancestors = self._ancestors(scope)
+        if scope != '.':
+            lo, hi = scope + '/', scope + '0'
+            marks = ', '.join('?' * len(ancestors))
+            sql += (' AND (path = ? OR (path >= ? AND path < ?) OR old_path = ? OR (old_path >= ? AND old_path < ?)'
+                    f' OR path IN ({marks}) OR old_path IN ({marks}))')
+            params.extend([scope, lo, hi, scope, lo, hi, *ancestors, *ancestors])
+        sql += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+        rows = conn.execute(sql, params).fetchall()
+        has_more = len(rows) == limit
+        next_cursor = rows[-1]['id'] if has_more else latest
+        changes = [change for change in (self._relative(row, scope, ancestors) for row in rows) if change is not None]
+        return changes, next_cursor, has_more
+
+    @staticmethod
+    def _ancestors(scope):
+        """范围目录的所有上级 (包括根目录 '.')；范围为根目录时为空。"""
+        if scope == '.': return set()
+        parts = scope.split('/')
+        return {'.'} | {'/'.join(parts[:i]) for i in range(1, len(parts))}
+
+    @staticmethod
+    def _relative(row, scope, ancestors):
+        def relative(key):
+            if key is None: return None
+            if scope == '.': return key
+            # 上级目录的变化作用于整个范围
+            if key == scope or key in ancestors: return ''
+            return key[len(scope) + 1:] if key.startswith(scope + '/') else None
+
+        op, path, old_path = row['op'], relative(row['path']), relative(row['old_path'])
+        if op == 'reset': return None
+        ancestral = row['path'] in ancestors or row['old_path'] in ancestors
+        # 上级目录的直接子项被外部修改时范围目录本身可能已被替换，需要重新获取整个范围
+        if op == 'rescan' and ancestral: op = 'put'
+        if op == 'move':
+            # 从范围外移入视为新建，移出到范围外视为删除
+            if old_path is None: op = 'put'
+            elif path is None: op, path, old_path = 'delete', old_path, None
+        change = {'cursor': row['id'], 'op': op, 'path': path, 'type': 'dir' if row['is_dir'] or ancestral else 'file',
+                  'time': row['created_at']}
+        if op == 'move': change['old_path'] = old_path
+        return change
+
+    def follow(self, callback, interval):
+        """后台线程每隔 interval 秒读取新写入的变更记录，以 sqlite3.Row 列表回调 callback。"""
+        def run():
+            cursor = None
+            while True:
+                try:
+                    if cursor is None:
+                        cursor = self.current_cursor()
+                    else:
+                        rows = self._db().execute('SELECT id, op, path, old_path, is_dir FROM changes WHERE id > ? '
+                                                  'ORDER BY id LIMIT 10000', (cursor,)).fetchall()
+                        if rows:
+                            cursor = rows[-1]['id']
+                            callback(rows)
+                except Exception:
+                    logger.exception('读取变更记录失败')
+                finally:
+                    database.release_connections()
+                if self._stop.wait(interval): return
+        threading.Thread(target=run, name='change-journal-follow', daemon=True).start()
+
+    # --- 定期清理 ---
+    def prune(self):
+        conn = self._db()
+        cutoff = time.time() - self.retention
+        with conn:
+            row = conn.execute('SELECT MAX(id) FROM changes WHERE created_at < ?', (cutoff,)).fetchone()
+            if row[0] is not None:
+                conn.execute('DELETE FROM changes WHERE id <= ?', (row[0],))
+                self._set_floor(conn, max(row[0], self._floor(conn)))
+            conn.execute('DELETE FROM file_hashes WHERE hashed_at < ?', (cutoff,))
+
+    def start_pruner(self, interval):
+        def run():
+            while True:
+                try:
+                    if self._prune_lock.acquire(): self.prune()
+                except Exception:
+                    logger.exception('清理变更记录失败')
+                finally:
+                    database.release_connections()
+                if self._stop.wait(interval): return
+        threading.Thread(target=run, name='change-journal-prune', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# --- 内容哈希 ---
+def file_sha256(abs_path, st, db_path):
+    """
+    返回文件的 SHA-256。按 (dev, inode) 缓存，大小和 mtime 不变时直接使用缓存；
+    去重存储中的文件直接使用 blob 记录中的摘要。
+    """
+    conn = database.get_connection(db_path)
+    row = conn.execute('SELECT size, mtime_ns, sha256 FROM file_hashes WHERE dev = ? AND ino = ?',
+                       (st.st_dev, st.st_ino)).fetchone()
+    if row and row['size'] == st.st_size and row['mtime_ns'] == st.st_mtime_ns: return row['sha256']
+    if st.st_nlink > 1:
+        blob = conn.execute('SELECT digest FROM blobs WHERE dev = ? AND ino = ?', (st.st_dev, st.st_ino)).fetchone()
+        if blob: return blob['digest']
+    digest = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    # 计算期间文件被修改时不缓存，下次重新计算
+    if metrics.stat(abs_path).st_mtime_ns != st.st_mtime_ns: return digest.hexdigest()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO file_hashes (dev, ino, size, mtime_ns, sha256, hashed_at) VALUES (?, ?, ?, ?, ?, ?)',
+                     (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, digest.hexdigest(), time.time()))
+    return digest.hexdigest()
+
+
+def iter_manifest(abs_dir, recursive=True, hash_db_path=None):
+    """
+    以 NDJSON 逐行产生 abs_dir 下的条目 (同一目录内按名称排序)，路径相对于 abs_dir。
+    指定 hash_db_path 时为文件附带 sha256 (可能需要读取文件计算)。不跟随符号链接。
+    """
+    stack = ['']
+    while stack:
+        prefix = stack.pop()
+        try:
+            with metrics.scandir(os.path.join(abs_dir, prefix)) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            path = prefix + entry.name
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                item = {'path': path, 'type': 'dir', 'mtime': st.st_mtime}
+                subdirs.append(path + '/')
+            elif stat.S_ISREG(st.st_mode):
+                item = {'path': path, 'type': 'file', 'size': st.st_size, 'mtime': st.st_mtime}
+                if hash_db_path:
+                    try: item['sha256'] = file_sha256(entry.path, st, hash_db_path)
+                    except OSError: continue
+            else:
+                continue
+            yield json.dumps(item, ensure_ascii=False) + '\n'
+        if recursive: stack.extend(reversed(subdirs))
@@ -0,0 +1,75 @@
+import os
+import sys
+import uuid
+import shutil
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 应用在导入时读取数据目录的位置，测试使用独立的临时目录，不会碰到开发环境中的数据库和 uploads
+DATA_DIR = tempfile.mkdtemp(prefix='file-manager-test-')
+os.environ['FILE_MANAGER_DATA_DIR'] = DATA_DIR
+for name in ('FILE_MANAGER_DB_PATH', 'FILE_MANAGER_UPLOADS_DIR', 'FILE_MANAGER_METRICS_DIR',
+             'FILE_MANAGER_STORAGE_MODE', 'FILE_MANAGER_SENDFILE', 'FILE_MANAGER_MIGRATED'):
+    os.environ.pop(name, None)
+
+import database  # noqa: E402
+
+database.migrate()
+database.close_connections()
+os.makedirs(database.UPLOADS_DIR, exist_ok=True)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def _cleanup_data_dir():
+    yield
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return app
+
+
+def login(app_module, username, password):
+    client = app_module.app.test_client()
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client(app_module):
+    """以管理员身份登录的 test client，管理员的根目录就是 UPLOADS_DIR。"""
+    return login(app_module, 'admin', 'admin')
+
+
+@pytest.fixture
+def workdir(app_module):
+    """UPLOADS_DIR 下本测试独占的目录，返回 (相对路径, 绝对路径)。"""
+    name = f'test-{uuid.uuid4().hex[:8]}'
+    path = os.path.join(app_module.UPLOADS_DIR, name)
+    os.makedirs(path)
+    return name, path
+
+
+@pytest.fixture
+def make_user(app_module, client):
+    """创建普通用户并返回已登录的 test client；quota_mb 不为 None 时同时设置配额。"""
+    def make(quota_mb=None, **permissions):
+        username = f'user-{uuid.uuid4().hex[:8]}'
+        response = client.post('/admin/add_user', data={'username': username, 'password': 'secret', 'role': 'user'})
+        assert response.status_code == 201
+        if quota_mb is not None or permissions:
+            form = {'username': username, 'role': 'user', 'quota_mb': '' if quota_mb is None else str(quota_mb)}
+            for key in ('can_upload', 'can_delete', 'can_rename', 'can_move', 'can_create_folder'):
+                form[key] = 'true' if permissions.get(key, True) else 'false'
+            assert client.post(f"/admin/edit_user/{response.get_json()['user']['id']}", data=form).status_code == 200
+        user_client = login(app_module, username, 'secret')
+        user_client.username, user_client.user_id = username, response.get_json()['user']['id']
+        return user_client
+    return make
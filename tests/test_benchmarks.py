@@ -0,0 +1,19 @@
+import os
+import sys
+import json
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_runs_and_writes_report(tmp_path):
+    output = tmp_path / 'results.json'
+    env = {key: value for key, value in os.environ.items() if not key.startswith('FILE_MANAGER_')}
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, 'benchmarks', 'bench_routes.py'), '--scale', '0.01',
+                    '-n', '4', '-c', '2', '--scenarios', 'wide', 'huge', '-o', str(output)],
+                   check=True, env=env, cwd=str(tmp_path), capture_output=True, timeout=300)
+    report = json.loads(output.read_text(encoding='utf-8'))
+    assert {result['scenario'] for result in report['results']} == {'wide', 'huge'}
+    for result in report['results']:
+        assert result['errors'] == 0, result
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import errno
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+import blob_store as blob_store_module  # noqa: E402
+from blob_store import BlobStore  # noqa: E402
+
+
+def _store(tmp_path):
+    db_path = str(tmp_path / 'blobs.db')
+    database.migrate(db_path)
+    (tmp_path / 'uploads').mkdir()
+    return BlobStore(str(tmp_path / 'store'), db_path), tmp_path / 'uploads'
+
+
+def _blob_count(store):
+    return database.get_connection(store.db_path).execute('SELECT COUNT(*) FROM blobs').fetchone()[0]
+
+
+def test_identical_uploads_share_one_blob_until_last_reference_is_gone(tmp_path):
+    store, uploads = _store(tmp_path)
+    a, b = uploads / 'a.txt', uploads / 'b.txt'
+    store.save_stream(io.BytesIO(b'same content'), str(a))
+    store.save_stream(io.BytesIO(b'same content'), str(b))
+    assert os.path.samestat(os.stat(a), os.stat(b))
+    assert os.stat(a).st_nlink == 3 and _blob_count(store) == 1
+
+    st = os.lstat(a)
+    os.remove(a)
+    store.release(st)
+    assert b.read_bytes() == b'same content' and _blob_count(store) == 1
+
+    st = os.lstat(b)
+    os.remove(b)
+    store.release(st)
+    assert _blob_count(store) == 0
+    assert not any(files for _, _, files in os.walk(store.store_dir))
+    database.close_connections()
+
+
+def test_overwriting_a_linked_file_releases_the_old_blob(tmp_path):
+    store, uploads = _store(tmp_path)
+    target = uploads / 'doc.txt'
+    store.save_stream(io.BytesIO(b'version 1'), str(target))
+    store.save_stream(io.BytesIO(b'version 2'), str(target))
+    assert target.read_bytes() == b'version 2' and _blob_count(store) == 1
+    database.close_connections()
+
+
+def test_copy_fallback_does_not_keep_a_blob(tmp_path, monkeypatch):
+    store, uploads = _store(tmp_path)
+    def no_link(src, dst):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+    monkeypatch.setattr(blob_store_module.os, 'link', no_link)
+    store.save_stream(io.BytesIO(b'copied'), str(uploads / 'copy.txt'))
+    assert (uploads / 'copy.txt').read_bytes() == b'copied'
+    assert _blob_count(store) == 0
+    database.close_connections()
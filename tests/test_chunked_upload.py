@@ -0,0 +1,53 @@
+import os
+
+
+def _start(client, rel, name, size):
+    response = client.post('/upload/chunked', data={'filename': name, 'size': str(size), 'destination_path': rel})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def _put(client, upload_id, data, index, chunk_size):
+    chunk = data[index * chunk_size:(index + 1) * chunk_size]
+    return client.put(f'/upload/chunked/{upload_id}/{index}', data=chunk)
+
+
+def test_resume_after_interruption(app_module, client, workdir, monkeypatch):
+    monkeypatch.setattr(app_module.chunked_uploads, 'chunk_size', 4)
+    rel, path = workdir
+    data = b'0123456789abcdefghij'
+    session = _start(client, rel, 'data.bin', len(data))
+    upload_id, chunk_size = session['upload_id'], session['chunk_size']
+    assert session['missing'] == [0, 1, 2, 3, 4]
+
+    for index in (0, 3):
+        assert _put(client, upload_id, data, index, chunk_size).status_code == 200
+    # 中断之后查询状态，只需补传缺失的分块
+    missing = client.get(f'/upload/chunked/{upload_id}').get_json()['missing']
+    assert missing == [1, 2, 4]
+    assert client.post(f'/upload/chunked/{upload_id}/finalize').status_code == 409
+    for index in reversed(missing):
+        assert _put(client, upload_id, data, index, chunk_size).status_code == 200
+
+    assert client.post(f'/upload/chunked/{upload_id}/finalize').status_code == 200
+    with open(os.path.join(path, 'data.bin'), 'rb') as f:
+        assert f.read() == data
+
+
+def test_repeated_finalize_is_idempotent(client, workdir):
+    rel, path = workdir
+    session = _start(client, rel, 'small.txt', 5)
+    assert _put(client, session['upload_id'], b'hello', 0, session['chunk_size']).status_code == 200
+    for _ in range(3):
+        assert client.post(f"/upload/chunked/{session['upload_id']}/finalize").status_code == 200
+    with open(os.path.join(path, 'small.txt'), 'rb') as f:
+        assert f.read() == b'hello'
+    # 已完成的会话不再接受分块
+    assert _put(client, session['upload_id'], b'hello', 0, session['chunk_size']).status_code == 404
+
+
+def test_chunk_length_must_match(client, workdir):
+    rel, _ = workdir
+    session = _start(client, rel, 'short.txt', 5)
+    assert client.put(f"/upload/chunked/{session['upload_id']}/0", data=b'hey').status_code == 400
+    assert client.put(f"/upload/chunked/{session['upload_id']}/1", data=b'hello').status_code == 400
@@ -0,0 +1,36 @@
+import os
+
+
+def test_listing_etag_and_not_modified(client, workdir):
+    rel, path = workdir
+    open(os.path.join(path, 'a.txt'), 'w').close()
+    first = client.get(f'/api/list/{rel}')
+    etag = first.headers['ETag']
+    assert client.get(f'/api/list/{rel}', headers={'If-None-Match': etag}).status_code == 304
+
+    # 目录内容变化后 ETag 随之变化
+    open(os.path.join(path, 'b.txt'), 'w').close()
+    changed = client.get(f'/api/list/{rel}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_text_preview_not_modified(client, workdir):
+    rel, path = workdir
+    with open(os.path.join(path, 'notes.txt'), 'w') as f:
+        f.write('hello\n')
+    first = client.get(f'/view/{rel}/notes.txt')
+    assert first.status_code == 200
+    assert client.get(f'/view/{rel}/notes.txt', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+    # 不同的查询参数对应不同的内容
+    assert client.get(f'/view/{rel}/notes.txt?mode=head', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_static_immutable_only_for_current_version(app_module, client):
+    version = app_module.static_assets.version('js/main.js')
+    current = client.get(f'/static/js/main.js?v={version}')
+    assert current.status_code == 200
+    assert current.cache_control.immutable
+    stale = client.get('/static/js/main.js?v=000000000000')
+    assert stale.status_code == 200
+    assert not stale.cache_control.immutable
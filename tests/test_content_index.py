@@ -0,0 +1,53 @@
+import os
+
+from content_index import ContentIndex, SNIPPET_START, SNIPPET_END
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def test_sync_indexes_changes_and_removals(tmp_path):
+    root = str(tmp_path / 'root')
+    _write(os.path.join(root, 'docs', 'a.txt'), '季度报告 quarterly report')
+    _write(os.path.join(root, 'docs', 'b.md'), 'nothing here')
+    _write(os.path.join(root, 'c.bin'), 'quarterly report')  # 扩展名不在列表中，不索引
+    index = ContentIndex(str(tmp_path / 'content.db'), root, {'.txt', '.md'})
+    index.sync(root, recursive=True)
+
+    rows = index.search('quarterly', root, 10)
+    assert [path for path, _ in rows] == ['docs/a.txt']
+    assert f'{SNIPPET_START}quarterly{SNIPPET_END}' in rows[0][1]
+    assert [path for path, _ in index.search('季度报', os.path.join(root, 'docs'), 10)] == ['docs/a.txt']
+
+    # 内容变化后只需核对所在目录；删除的文件从索引中移除
+    _write(os.path.join(root, 'docs', 'b.md'), 'another quarterly summary')
+    os.remove(os.path.join(root, 'docs', 'a.txt'))
+    index.sync(os.path.join(root, 'docs'))
+    assert [path for path, _ in index.search('quarterly', root, 10)] == ['docs/b.md']
+
+
+def test_short_query_returns_nothing(tmp_path):
+    root = str(tmp_path / 'root')
+    _write(os.path.join(root, 'a.txt'), 'ab ab ab')
+    index = ContentIndex(str(tmp_path / 'content.db'), root, {'.txt'})
+    index.sync(root, recursive=True)
+    assert index.query_too_short('ab')
+    assert index.search('ab', root, 10) == []
+
+
+def test_content_search_route(app_module, client, workdir):
+    rel, path = workdir
+    _write(os.path.join(path, 'notes.txt'), 'meeting <b>minutes</b> for review')
+    app_module.content_index.sync(path)
+
+    body = client.get('/search', query_string={'q': 'minutes', 'mode': 'content'}).get_data(as_text=True)
+    assert f'/download/{rel}/notes.txt' in body
+    # 片段中的原始 HTML 被转义，只有匹配部分使用 <mark>
+    assert '&lt;b&gt;<mark>minutes</mark>' in body
+
+    body = client.get('/search', query_string={'q': 'mi', 'mode': 'content'}).get_data(as_text=True)
+    assert '至少需要输入 3 个字符' in body
+    assert '没有找到匹配的文件' not in body
@@ -0,0 +1,34 @@
+import os
+
+
+def test_dir_tree_is_depth_limited(client, workdir):
+    rel, path = workdir
+    os.makedirs(os.path.join(path, 'a', 'b', 'c'))
+    os.makedirs(os.path.join(path, 'z'))
+    open(os.path.join(path, 'a', 'file.txt'), 'w').close()
+
+    data = client.get('/api/dir_tree', query_string={'path': rel}).get_json()
+    assert data['path'] == rel
+    assert [(node['name'], node['has_children']) for node in data['children']] == [('a', True), ('z', False)]
+    assert 'children' not in data['children'][0]
+
+    data = client.get('/api/dir_tree', query_string={'path': f'{rel}/a', 'depth': 2}).get_json()
+    (b,) = data['children']
+    assert b['path'] == f'{rel}/a/b'
+    assert [node['path'] for node in b['children']] == [f'{rel}/a/b/c']
+
+
+def test_dir_tree_sees_new_directories(client, workdir):
+    rel, path = workdir
+    assert client.get('/api/dir_tree', query_string={'path': rel}).get_json()['children'] == []
+    assert client.post('/create_folder', data={'current_path': rel, 'folder_name': 'new'}).status_code == 201
+    children = client.get('/api/dir_tree', query_string={'path': rel}).get_json()['children']
+    assert [node['name'] for node in children] == ['new']
+
+
+def test_dir_tree_rejects_files_and_paths_outside_the_user_directory(client, make_user, workdir):
+    rel, path = workdir
+    open(os.path.join(path, 'file.txt'), 'w').close()
+    assert client.get('/api/dir_tree', query_string={'path': f'{rel}/file.txt'}).status_code == 400
+    user = make_user()
+    assert user.get('/api/dir_tree', query_string={'path': '../admin'}).status_code == 403
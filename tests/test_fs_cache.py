@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+from fs_cache import DirSizeCache  # noqa: E402
+
+
+def _write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+
+
+def _scandir_calls():
+    return metrics.fs_calls.value('scandir')
+
+
+def test_dir_size_is_cached_per_directory(tmp_path):
+    _write(tmp_path / 'a' / 'one.bin', 100)
+    _write(tmp_path / 'a' / 'b' / 'two.bin', 50)
+    _write(tmp_path / 'c' / 'three.bin', 7)
+    cache = DirSizeCache()
+    assert cache.get_size(str(tmp_path)) == 157
+    calls = _scandir_calls()
+    assert cache.get_size(str(tmp_path)) == 157
+    assert _scandir_calls() == calls
+
+    # 新增文件改变了所在目录的 mtime，只有这一层需要重新扫描
+    _write(tmp_path / 'a' / 'b' / 'new.bin', 10)
+    assert cache.get_size(str(tmp_path)) == 167
+    assert _scandir_calls() == calls + 1
+
+
+def test_invalidate_picks_up_overwritten_file(tmp_path):
+    _write(tmp_path / 'd' / 'file.bin', 10)
+    cache = DirSizeCache()
+    assert cache.get_size(str(tmp_path)) == 10
+    # 覆盖写入已有文件不改变目录 mtime，需要由调用方失效
+    mtime = os.stat(tmp_path / 'd').st_mtime_ns
+    (tmp_path / 'd' / 'file.bin').write_bytes(b'x' * 30)
+    os.utime(tmp_path / 'd', ns=(mtime, mtime))
+    assert cache.get_size(str(tmp_path)) == 10
+    cache.invalidate(str(tmp_path / 'd'))
+    assert cache.get_size(str(tmp_path)) == 30
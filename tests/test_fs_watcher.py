@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import queue
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+from fs_watcher import FileSystemWatcher  # noqa: E402
+from sync_journal import ChangeJournal  # noqa: E402
+
+
+def _changes(watcher, results, timeout=5):
+    """收集 timeout 秒内报告的目录，直到出现空闲。"""
+    dirs = set(results.get(timeout=timeout))
+    while True:
+        try: dirs |= results.get(timeout=watcher.debounce * 3)
+        except queue.Empty: return dirs
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='需要 inotify')
+def test_watcher_reports_changed_directories(tmp_path):
+    (tmp_path / 'a' / 'b').mkdir(parents=True)
+    results = queue.Queue()
+    watcher = FileSystemWatcher(str(tmp_path), lambda dirs: results.put(dirs), debounce=0.1)
+    watcher.start()
+    try:
+        deadline = time.time() + 5
+        while watcher.mode is None and time.time() < deadline: time.sleep(0.01)
+        time.sleep(0.2)
+        (tmp_path / 'a' / 'b' / 'new.txt').write_text('x')
+        assert _changes(watcher, results) == {str(tmp_path / 'a' / 'b')}
+        # 新建的子目录会被加入监视
+        (tmp_path / 'a' / 'c').mkdir()
+        assert str(tmp_path / 'a') in _changes(watcher, results)
+        (tmp_path / 'a' / 'c' / 'deep.txt').write_text('x')
+        assert _changes(watcher, results) == {str(tmp_path / 'a' / 'c')}
+    finally:
+        watcher.stop()
+
+
+def test_own_changes_are_filtered(tmp_path):
+    db_path = str(tmp_path / 'journal.db')
+    database.migrate(db_path)
+    root = tmp_path / 'uploads'
+    journal = ChangeJournal(db_path, str(root), retention=3600)
+    journal.record('put', str(root / 'docs' / 'a.txt'))
+    journal.record('delete', str(root / 'old'), is_dir=True)
+    reported = {str(root / 'docs'), str(root / 'old' / 'sub'), str(root / 'other')}
+    assert journal.without_own_changes(reported, 5) == {str(root / 'other')}
+    assert journal.without_own_changes(reported, -1) == reported
+    database.close_connections()
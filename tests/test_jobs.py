@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+import jobs  # noqa: E402
+
+
+def _wait(manager, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in ('done', 'failed'): return job
+        time.sleep(0.02)
+    raise AssertionError('任务未在限定时间内完成')
+
+
+def _summarize(ok, errors):
+    return (200, {'done': ok}) if not errors else (207, {'done': ok, 'errors': errors})
+
+
+def test_job_runs_in_background_and_reports_result(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    database.migrate(db_path)
+    manager = jobs.JobManager(db_path)
+    seen = []
+    def handler(value):
+        if value < 0: raise ValueError('负数')
+        seen.append(value)
+    job_id = manager.submit('alice', 'test', [('a', 1), ('b', -1), ('c', 3)], handler, _summarize)
+    job = _wait(manager, job_id)
+    assert job['status'] == 'done' and job['owner'] == 'alice'
+    assert (job['done'], job['total']) == (3, 3)
+    assert job['result'] == {'code': 207, 'done': ['a', 'c'], 'errors': [{'name': 'b', 'error': '负数'}]}
+    assert seen == [1, 3]
+    database.close_connections()
+
+
+def test_summarize_failure_marks_job_failed(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    database.migrate(db_path)
+    manager = jobs.JobManager(db_path)
+    job = _wait(manager, manager.submit('alice', 'test', [('a', 1)], lambda _: None, lambda ok, errors: 1 / 0))
+    assert job['status'] == 'failed' and job['result']['code'] == 500
+    database.close_connections()
+
+
+def test_orphaned_job_is_failed_after_heartbeat_timeout(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    database.migrate(db_path)
+    conn = database.get_connection(db_path)
+    # 模拟执行任务的进程已经退出：状态停留在 running，心跳早已超时
+    with conn:
+        conn.execute("INSERT INTO jobs (id, owner, kind, status, total, done, created, updated) "
+                     "VALUES ('orphan', 'alice', 'delete', 'running', 5, 2, ?, ?)",
+                     (time.time() - 600, time.time() - jobs.STALE_AFTER - 1))
+    job = jobs.JobManager(db_path).get('orphan')
+    assert job['status'] == 'failed' and job['result']['code'] == 500
+    database.close_connections()
@@ -0,0 +1,37 @@
+import os
+
+
+def test_cursor_pagination_returns_every_entry_once(app_module, client, workdir):
+    rel, path = workdir
+    for i in range(25):
+        open(os.path.join(path, f'file_{i:02d}.txt'), 'w').close()
+    os.makedirs(os.path.join(path, 'subdir'))
+
+    names, cursor = [], None
+    while True:
+        response = client.get(f'/api/list/{rel}', query_string={'limit': 10, 'cursor': cursor} if cursor else {'limit': 10})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['total'] == 26
+        names += [item['name'] for item in data['items']]
+        cursor = data['next_cursor']
+        if cursor is None: break
+    # 目录排在文件之前，各自按名称排序
+    assert names == ['subdir'] + [f'file_{i:02d}.txt' for i in range(25)]
+
+
+def test_cursor_continues_after_last_name_when_directory_changes(app_module, client, workdir):
+    rel, path = workdir
+    for name in 'bdf':
+        open(os.path.join(path, name), 'w').close()
+    first = client.get(f'/api/list/{rel}', query_string={'limit': 2}).get_json()
+    assert [item['name'] for item in first['items']] == ['b', 'd']
+    # 翻页期间在已读取的位置之前插入新条目，不应导致重复
+    open(os.path.join(path, 'a'), 'w').close()
+    second = client.get(f'/api/list/{rel}', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert [item['name'] for item in second['items']] == ['f']
+
+
+def test_invalid_cursor_is_rejected(client, workdir):
+    rel, _ = workdir
+    assert client.get(f'/api/list/{rel}', query_string={'cursor': 'not-a-cursor'}).status_code == 400
@@ -0,0 +1,48 @@
+import os
+
+import metrics
+
+
+def _registry():
+    registry = metrics.Registry()
+    counter = registry.register(metrics.Counter('test_requests_total', '请求数', ('route',)))
+    histogram = registry.register(metrics.Histogram('test_latency_seconds', '耗时', buckets=(0.1, 1)))
+    return registry, counter, histogram
+
+
+def test_merge_snapshots_adds_counters_and_histograms():
+    registry, counter, histogram = _registry()
+    counter.inc(2, '/a')
+    histogram.observe(0.05)
+    first = registry.snapshot()
+    counter.inc(3, '/a')
+    counter.inc(1, '/b')
+    histogram.observe(0.5)
+    second = registry.snapshot()
+
+    merged = {name: {tuple(k): v for k, v in items} for name, items in metrics.merge_snapshots([first, second]).items()}
+    assert merged['test_requests_total'] == {('/a',): 7, ('/b',): 1}
+    # 各桶计数、总数、总和逐项相加
+    assert merged['test_latency_seconds'][()][:3] == [2, 1, 3]
+
+
+def test_collector_renders_sum_of_all_processes(tmp_path):
+    registry, counter, _ = _registry()
+    directory = str(tmp_path)
+    # 另一个工作进程写入的快照
+    metrics._write_snapshot(os.path.join(directory, '999999.json'), {'test_requests_total': [[['/a'], 5]]})
+    collector = metrics.MultiProcessCollector(registry, directory)
+    counter.inc(1, '/a')
+    assert 'test_requests_total{route="/a"} 6' in collector.render()
+
+    # 进程退出后快照并入 archive.json，合计不变
+    metrics.archive_process(directory, 999999)
+    assert not os.path.exists(os.path.join(directory, '999999.json'))
+    assert 'test_requests_total{route="/a"} 6' in collector.render()
+    collector.stop()
+
+
+def test_iter_counted_counts_encoded_bytes():
+    counter = metrics.Counter('test_bytes_total', '字节数')
+    assert list(metrics.iter_counted(['中文', b'abc'], counter)) == ['中文', b'abc']
+    assert counter.value() == 9
@@ -0,0 +1,73 @@
+import os
+import sys
+import sqlite3
+import threading
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+
+WORKERS = 8
+
+
+def _migrate_when_released(db_path, start, results):
+    start.wait()
+    try:
+        database.migrate(db_path)
+        results.put(None)
+    except Exception as e:
+        results.put(repr(e))
+
+
+def _baseline_db(path, version):
+    """按旧版本应用前 version 个迁移，模拟升级前的数据库。"""
+    conn = database.configure_connection(sqlite3.connect(path))
+    for step, migration in enumerate(database.MIGRATIONS[:version], start=1):
+        with conn:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {step}')
+    conn.close()
+
+
+def test_concurrent_migrate(tmp_path):
+    for trial in range(3):
+        db_path = str(tmp_path / f'baseline_{trial}.db')
+        _baseline_db(db_path, 3)
+        ctx = multiprocessing.get_context('spawn')
+        start, results = ctx.Event(), ctx.Queue()
+        procs = [ctx.Process(target=_migrate_when_released, args=(db_path, start, results)) for _ in range(WORKERS)]
+        for p in procs: p.start()
+        start.set()
+        errors = [results.get(timeout=60) for _ in procs]
+        for p in procs: p.join(timeout=60)
+        assert errors == [None] * WORKERS
+        conn = sqlite3.connect(db_path)
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(database.MIGRATIONS)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+        assert columns.count('quota_bytes') == 1
+        conn.close()
+
+
+def test_migrate_is_idempotent(tmp_path):
+    db_path = str(tmp_path / 'fresh.db')
+    assert database.migrate(db_path) == (0, len(database.MIGRATIONS))
+    assert database.migrate(db_path) == (len(database.MIGRATIONS), len(database.MIGRATIONS))
+    database.close_connections()
+
+
+def test_connections_are_reused_per_thread(tmp_path):
+    db_path = str(tmp_path / 'pool.db')
+    conn = database.get_connection(db_path)
+    assert database.get_connection(db_path) is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    others = []
+    def other_thread():
+        others.append(database.get_connection(db_path))
+        database.close_connections()
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    assert others[0] is not conn
+    database.close_connections()
+    assert database.get_connection(db_path) is not conn
+    database.close_connections()
@@ -0,0 +1,46 @@
+import os
+
+
+def _write_lines(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(f'line {i:07d}\n')
+
+
+def test_raw_text_supports_range_requests(client, workdir):
+    rel, path = workdir
+    with open(os.path.join(path, 'notes.txt'), 'w') as f:
+        f.write('0123456789')
+    response = client.get(f'/view/{rel}/notes.txt', query_string={'raw': 1}, headers={'Range': 'bytes=2-5'})
+    assert response.status_code == 206
+    assert response.data == b'2345'
+    assert response.headers['Content-Range'] == 'bytes 2-5/10'
+
+
+def test_head_and_tail_read_only_the_requested_part(app_module, client, workdir):
+    rel, path = workdir
+    _write_lines(os.path.join(path, 'big.txt'), 200000)  # 2.6 MB，超过一次性预览的上限
+    head = client.get(f'/view/{rel}/big.txt', query_string={'mode': 'head', 'kb': 1}).get_data(as_text=True)
+    assert 'line 0000000' in head and 'line 0000200' not in head
+    tail = client.get(f'/view/{rel}/big.txt', query_string={'mode': 'tail', 'kb': 1}).get_data(as_text=True)
+    assert 'line 0199999' in tail and 'line 0000000' not in tail
+
+
+def test_large_files_are_paged(app_module, client, workdir):
+    rel, path = workdir
+    _write_lines(os.path.join(path, 'big.txt'), 200000)
+    response = client.get(f'/view/{rel}/big.txt')
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    assert '第 1 / 10 页' in body
+    assert len(body) < app_module.PREVIEW_PAGE_SIZE + 4096
+    last = client.get(f'/view/{rel}/big.txt', query_string={'page': 10}).get_data(as_text=True)
+    assert 'line 0199999' in last
+
+
+def test_preview_escapes_html(client, workdir):
+    rel, path = workdir
+    with open(os.path.join(path, 'page.html'), 'w') as f:
+        f.write('<script>alert(1)</script>')
+    body = client.get(f'/view/{rel}/page.html').get_data(as_text=True)
+    assert '<script>alert' not in body and '&lt;script&gt;' in body
@@ -0,0 +1,40 @@
+import io
+
+import pytest
+
+
+def _upload(user, content):
+    return user.post('/upload/', data={'destination_path': '', 'files[]': (io.BytesIO(content), 'file.bin')},
+                     content_type='multipart/form-data')
+
+
+def test_upload_over_quota_is_rejected(app_module, make_user):
+    user = make_user(quota_mb=0.001)  # 约 1 KB
+    small = _upload(user, b'x' * 100)
+    assert small.status_code == 200
+    assert app_module.quota.usage(user.username)[0] == 100
+
+    assert _upload(user, b'x' * 2048).status_code == 413
+    response = user.post('/upload/chunked', data={'destination_path': '', 'filename': 'big.bin', 'size': 2048})
+    assert response.status_code == 413
+
+
+def test_user_without_quota_is_not_limited(make_user):
+    user = make_user()
+    assert _upload(user, b'x' * 4096).status_code == 200
+
+
+@pytest.mark.parametrize('value', ['-1', 'inf', 'nan', '1e12', 'abc'])
+def test_edit_user_rejects_invalid_quota(client, make_user, value):
+    user = make_user()
+    response = client.post(f'/admin/edit_user/{user.user_id}', data={'username': user.username, 'role': 'user', 'quota_mb': value})
+    assert response.status_code == 400
+
+
+def test_adjust_never_goes_below_zero(app_module, make_user):
+    user = make_user(quota_mb=1)
+    app_module.quota.adjust(user.username, 1000)
+    assert not app_module.quota.would_exceed(user.username, 1024 * 1024 - 1000)
+    assert app_module.quota.would_exceed(user.username, 1024 * 1024)
+    app_module.quota.adjust(user.username, -5000)
+    assert app_module.quota.usage(user.username) == (0, 1024 * 1024)
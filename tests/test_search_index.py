@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+from search_index import FileNameIndex  # noqa: E402
+
+
+def _index(tmp_path, names):
+    root = tmp_path / 'uploads'
+    for name in names:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    index = FileNameIndex(str(tmp_path / 'index.db'), str(root))
+    index.rebuild()
+    return index, str(root)
+
+
+def _names(rows):
+    return sorted(row['path'] for row in rows)
+
+
+def test_short_and_long_queries(tmp_path):
+    index, root = _index(tmp_path, ['报告.txt', 'sub/年度报告.doc', 'a_1.jpg', 'photo.JPG', 'x%y.txt'])
+    assert _names(index.search('报', root, 10)) == ['sub/年度报告.doc', '报告.txt']
+    assert _names(index.search('jpg', root, 10)) == ['a_1.jpg', 'photo.JPG']
+    # 短查询中的标点和 LIKE 通配符按字面匹配
+    assert _names(index.search('_1', root, 10)) == ['a_1.jpg']
+    assert _names(index.search('%', root, 10)) == ['x%y.txt']
+    assert _names(index.search('报', os.path.join(root, 'sub'), 10)) == ['sub/年度报告.doc']
+    database.close_connections()
+
+
+def test_short_query_index_follows_renames_and_removals(tmp_path):
+    index, root = _index(tmp_path, ['报告.txt', 'dir/季度.txt'])
+    index.move(os.path.join(root, '报告.txt'), os.path.join(root, 'notes.txt'))
+    assert _names(index.search('报', root, 10)) == []
+    assert _names(index.search('no', root, 10)) == ['notes.txt']
+    index.remove(os.path.join(root, 'dir'))
+    assert _names(index.search('季', root, 10)) == []
+    database.close_connections()
+
+
+def test_keyset_paging_in_both_directions(tmp_path):
+    index, root = _index(tmp_path, [f'file_{i:02d}.txt' for i in range(25)])
+    pages, after = [], None
+    while True:
+        rows = index.search('fi', root, 10, after=after)
+        if not rows: break
+        pages.append([row['id'] for row in rows])
+        after = rows[-1]['id']
+    ids = [i for page in pages for i in page]
+    assert len(ids) == 25 and ids == sorted(set(ids))
+    # 从第三页向前翻页得到与第二页相同的结果
+    assert [row['id'] for row in index.search('fi', root, 10, before=pages[2][0])] == pages[1]
+    database.close_connections()
@@ -0,0 +1,39 @@
+import os
+from urllib.parse import quote
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_x_accel_redirect_for_large_files(app_module, client, workdir, monkeypatch):
+    monkeypatch.setattr(app_module, 'SENDFILE_MODE', 'x-accel')
+    monkeypatch.setattr(app_module, 'SENDFILE_MIN_SIZE', 1024)
+    rel, path = workdir
+    _write(os.path.join(path, '报告.bin'), 4096)
+    response = client.get(f'/download/{rel}/报告.bin')
+    assert response.status_code == 200
+    assert response.headers['X-Accel-Redirect'] == app_module.X_ACCEL_PREFIX + quote(f'{rel}/报告.bin')
+    assert 'X-Sendfile' not in response.headers
+    assert response.data == b''
+
+
+def test_x_sendfile_header(app_module, client, workdir, monkeypatch):
+    monkeypatch.setattr(app_module, 'SENDFILE_MODE', 'x-sendfile')
+    monkeypatch.setattr(app_module, 'SENDFILE_MIN_SIZE', 1024)
+    rel, path = workdir
+    _write(os.path.join(path, 'big.bin'), 4096)
+    response = client.get(f'/download/{rel}/big.bin')
+    assert response.headers['X-Sendfile'] == os.path.join(path, 'big.bin')
+    assert response.data == b''
+
+
+def test_small_files_are_sent_by_the_app(app_module, client, workdir, monkeypatch):
+    monkeypatch.setattr(app_module, 'SENDFILE_MODE', 'x-accel')
+    monkeypatch.setattr(app_module, 'SENDFILE_MIN_SIZE', 1024)
+    rel, path = workdir
+    _write(os.path.join(path, 'small.bin'), 100)
+    response = client.get(f'/download/{rel}/small.bin')
+    assert 'X-Accel-Redirect' not in response.headers
+    assert response.data == b'x' * 100
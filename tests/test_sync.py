@@ -0,0 +1,32 @@
+import os
+import json
+import hashlib
+
+
+def test_manifest_then_changes(client, workdir):
+    rel, path = workdir
+    os.makedirs(os.path.join(path, 'sub'))
+    with open(os.path.join(path, 'sub', 'a.txt'), 'wb') as f:
+        f.write(b'hello')
+
+    response = client.get('/api/sync/manifest', query_string={'path': rel, 'hash': '1'})
+    assert response.status_code == 200
+    items = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(item['path'], item['type']) for item in items] == [('sub', 'dir'), ('sub/a.txt', 'file')]
+    assert items[1]['sha256'] == hashlib.sha256(b'hello').hexdigest()
+    cursor = response.headers['X-Sync-Cursor']
+
+    assert client.post('/create_folder', data={'current_path': rel, 'folder_name': 'new'}).status_code == 201
+    data = client.get('/api/sync/changes', query_string={'path': rel, 'cursor': cursor}).get_json()
+    assert [(change['op'], change['path']) for change in data['changes']] == [('put', 'new')]
+    assert not data['has_more']
+
+    # 用新游标再次查询时没有新的变更
+    data = client.get('/api/sync/changes', query_string={'path': rel, 'cursor': data['cursor']}).get_json()
+    assert data['changes'] == []
+
+
+def test_changes_requires_valid_cursor(client, workdir):
+    rel, _ = workdir
+    assert client.get('/api/sync/changes', query_string={'path': rel}).status_code == 400
+    assert client.get('/api/sync/changes', query_string={'path': rel, 'cursor': 10 ** 12}).status_code == 410
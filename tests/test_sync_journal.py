@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database  # noqa: E402
+from sync_journal import ChangeJournal  # noqa: E402
+
+
+def _journal(tmp_path):
+    db_path = str(tmp_path / 'journal.db')
+    database.migrate(db_path)
+    root = tmp_path / 'uploads'
+    root.mkdir()
+    return ChangeJournal(db_path, str(root), retention=3600), str(root)
+
+
+def _ops(journal, scope, cursor):
+    changes, _, _ = journal.changes(scope, cursor, 100)
+    return [(c['op'], c['path'], c['type']) for c in changes]
+
+
+def test_scope_sees_ancestor_delete_and_move(tmp_path):
+    journal, root = _journal(tmp_path)
+    scope = os.path.join(root, 'alice', 'docs')
+    cursor = journal.current_cursor()
+    journal.record('delete', os.path.join(root, 'alice'), is_dir=True)
+    journal.record('move', os.path.join(root, 'bob'), True, os.path.join(root, 'alice'))
+    journal.record('move', os.path.join(root, 'alice'), True, os.path.join(root, 'carol'))
+    journal.record('put', os.path.join(root, 'alice', 'other.txt'))
+    journal.record_external([root])
+    assert _ops(journal, scope, cursor) == [('delete', '', 'dir'), ('delete', '', 'dir'), ('put', '', 'dir'),
+                                            ('put', '', 'dir')]
+    database.close_connections()
+
+
+def test_floor_is_not_an_admin_setting(tmp_path):
+    journal, root = _journal(tmp_path)
+    journal.record('put', os.path.join(root, 'a.txt'))
+    journal.reset()
+    conn = database.get_connection(journal.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM settings WHERE key = 'change_journal_floor'").fetchone()[0] == 0
+    assert journal._floor(conn) == journal.current_cursor()
+    database.close_connections()
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+Image = pytest.importorskip('PIL.Image')
+from thumbnails import ThumbnailService  # noqa: E402
+
+
+def test_thumbnail_is_generated_once_and_cached(tmp_path):
+    source = tmp_path / 'photo.png'
+    Image.new('RGBA', (1200, 800), (255, 0, 0, 128)).save(source)
+    service = ThumbnailService(str(tmp_path / 'cache'), size=(64, 64))
+    thumb = service.get(str(source))
+    with Image.open(thumb) as im:
+        assert im.format == 'JPEG' and im.size == (64, 43)
+    assert service.get(str(source)) == thumb
+
+    # 原图修改后对应新的缓存文件
+    Image.new('RGB', (100, 100)).save(source)
+    assert service.get(str(source)) != thumb
+
+
+def test_undecodable_image_returns_none(tmp_path):
+    source = tmp_path / 'broken.jpg'
+    source.write_bytes(b'not an image')
+    assert ThumbnailService(str(tmp_path / 'cache')).get(str(source)) is None
+
+
+def test_cache_is_trimmed_to_max_bytes(tmp_path):
+    service = ThumbnailService(str(tmp_path / 'cache'), max_bytes=4096, size=(128, 128))
+    for i in range(20):
+        source = tmp_path / f'{i}.png'
+        Image.effect_noise((400, 400), 100).save(source)
+        service.get(str(source))
+    total = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tmp_path / 'cache') for f in files)
+    assert total <= 4096
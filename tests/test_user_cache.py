@@ -0,0 +1,26 @@
+import database
+
+
+def test_user_row_is_read_once_per_request(app_module):
+    queries = []
+    with app_module.app.test_request_context():
+        conn = app_module.get_db()
+        conn.set_trace_callback(queries.append)
+        try:
+            app_module.invalidate_user_cache()
+            first = app_module.get_user_row('admin')
+            for _ in range(5):
+                assert app_module.get_user_row('admin') is first
+        finally:
+            conn.set_trace_callback(database.statement_callback)
+    assert sum('FROM users' in sql for sql in queries) == 1
+
+
+def test_permission_changes_apply_immediately(client, make_user):
+    user = make_user()
+    assert user.post('/create_folder', data={'current_path': '', 'folder_name': 'before'}).status_code == 201
+    form = {'username': user.username, 'role': 'user', 'can_upload': 'true', 'can_delete': 'true',
+            'can_rename': 'true', 'can_move': 'true', 'can_create_folder': 'false'}
+    assert client.post(f'/admin/edit_user/{user.user_id}', data=form).status_code == 200
+    # 修改用户的路由会清空缓存，不必等待缓存过期
+    assert user.post('/create_folder', data={'current_path': '', 'folder_name': 'after'}).status_code == 403
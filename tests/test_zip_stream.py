@@ -0,0 +1,40 @@
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import zip_stream  # noqa: E402
+
+
+def test_archive_is_streamed_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(zip_stream, 'READ_SIZE', 4096)
+    folder = tmp_path / 'folder'
+    (folder / 'sub').mkdir(parents=True)
+    (folder / 'big.bin').write_bytes(os.urandom(64 * 1024))
+    (folder / 'sub' / 'note.txt').write_text('hello')
+    os.symlink('/etc/passwd', folder / 'link')
+
+    chunks = list(zip_stream.iter_zip([(str(folder), 'folder')]))
+    # 每读取一块就产出数据，而不是打包完成后一次返回
+    assert len(chunks) >= 8 and max(len(chunk) for chunk in chunks) < 32 * 1024
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert sorted(zf.namelist()) == ['folder/', 'folder/big.bin', 'folder/sub/', 'folder/sub/note.txt']
+        assert zf.read('folder/big.bin') == (folder / 'big.bin').read_bytes()
+        assert zf.getinfo('folder/big.bin').compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read('folder/sub/note.txt') == b'hello'
+
+
+def test_download_zip_route_streams_selection(client, workdir):
+    rel, path = workdir
+    for name in ('a.txt', 'b.jpg'):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(name)
+    response = client.post('/download_zip', data={'current_path': rel, 'items[]': ['a.txt', 'b.jpg']})
+    assert response.status_code == 200 and response.is_streamed
+    assert response.headers['X-Accel-Buffering'] == 'no'
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zf:
+        assert zf.read('a.txt') == b'a.txt'
+        # 已压缩的格式以存储模式写入
+        assert zf.getinfo('b.jpg').compress_type == zipfile.ZIP_STORED
+    assert client.post('/download_zip', data={'current_path': rel, 'items[]': ['missing']}).status_code == 404
@@ -0,0 +1,125 @@
+import os
+import time
+import hashlib
+import threading
+import metrics
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖，未安装时预览直接使用原图
+    Image = ImageOps = None
+
+# --- 缩略图服务 ---
+# 缩略图在后台线程池中生成，保存在磁盘缓存目录中。缓存键由原图路径、mtime、大小和缩略图尺寸组成，
+# 原图被修改后自然对应新的缓存文件；旧文件按最近使用时间 (文件 mtime) 淘汰，总大小不超过上限。
+
+THUMBNAIL_SIZE = (256, 256)
+
+
+class ThumbnailPending(Exception):
+    """缩略图仍在生成中 (等待超时)，稍后重试即可。"""
+
+TOUCH_INTERVAL = 3600  # 命中缓存时最多每小时更新一次 mtime，用于 LRU 淘汰
+
+
+class ThumbnailService:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, size=THUMBNAIL_SIZE, workers=2, timeout=30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.size = size
+        self.timeout = timeout
+        self.available = Image is not None
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._account_lock = threading.Lock()
+        self._cache_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_path(self, abs_path, st):
+        raw = f'{abs_path}\0{st.st_mtime_ns}\0{st.st_size}\0{self.size[0]}x{self.size[1]}'
+        key = hashlib.sha1(raw.encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.jpg')
+
+    def get(self, abs_path):
+        """
+        返回缩略图文件路径；原图无法解码时返回 None，生成超时抛出 ThumbnailPending。
+        需要生成时在线程池中排队，同一张图片的并发请求共用一次生成。
+        """
+        st = metrics.stat(abs_path)
+        thumb_path = self._cache_path(abs_path, st)
+        try:
+            thumb_st = metrics.stat(thumb_path)
+            if thumb_st.st_size == 0: raise FileNotFoundError
+            if thumb_st.st_mtime < time.time() - TOUCH_INTERVAL:
+                os.utime(thumb_path)
+            return thumb_path
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            future = self._pending.get(thumb_path)
+            if future is None:
+                future = self._pool.submit(self._generate, abs_path, thumb_path)
+                self._pending[thumb_path] = future
+                future.add_done_callback(lambda _: self._pending.pop(thumb_path, None))
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise ThumbnailPending() from None
+
+    def _generate(self, abs_path, thumb_path):
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        tmp_path = f'{thumb_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with Image.open(abs_path) as im:
+                # JPEG 可以在解码时直接按比例缩小，大幅减少大图的解码开销
+                im.draft('RGB', self.size)
+                im = ImageOps.exif_transpose(im)
+                im.thumbnail(self.size)
+                if im.mode in ('RGBA', 'LA', 'P'):
+                    im = im.convert('RGBA')
+                    background = Image.new('RGB', im.size, (255, 255, 255))
+                    background.paste(im, mask=im.getchannel('A'))
+                    im = background
+                elif im.mode != 'RGB':
+                    im = im.convert('RGB')
+                im.save(tmp_path, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp_path, thumb_path)
+        except Exception:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            return None
+        self._account(os.path.getsize(thumb_path))
+        return thumb_path
+
+    # --- 缓存容量控制 ---
+    def _scan_cache(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _account(self, added_bytes):
+        with self._account_lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self._scan_cache())
+            else:
+                self._cache_bytes += added_bytes
+            if self._cache_bytes <= self.max_bytes: return
+            # 超出上限时按最近使用时间从旧到新删除，直到降到上限的 90%
+            files = sorted(self._scan_cache())
+            total = sum(size for _, size, _ in files)
+            target = self.max_bytes * 0.9
+            for _, size, path in files:
+                if total <= target: break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+            self._cache_bytes = total
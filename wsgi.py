@@ -0,0 +1,11 @@
+import os
+import database
+
+# 生产环境入口：gunicorn -c gunicorn.conf.py wsgi:app
+# (python app.py 启动的是单进程的开发服务器，只用于调试)
+if not os.path.exists(database.DB_PATH):
+    raise SystemExit(f"数据库 '{database.DB_PATH}' 不存在，请先运行 'python database.py' 来初始化数据库。")
+
+from app import app  # noqa: E402
+
+application = app
@@ -0,0 +1,84 @@
+import os
+import zipfile
+
+# --- 流式 ZIP 打包 ---
+# zipfile 支持写入不可 seek 的流 (使用数据描述符记录大小和 CRC)，
+# 这里把写入的数据暂存在内存中并由生成器逐块取走，因此不需要临时文件，
+# 内存占用只与读取块大小有关，第一个文件开始读取时就能发出响应的首个字节。
+
+READ_SIZE = 256 * 1024
+# 已经压缩过的格式再次 deflate 几乎没有收益，直接以存储模式写入以节省 CPU
+STORED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.aac', '.ogg', '.flac', '.m4a',
+    '.mp4', '.mkv', '.avi', '.mov', '.webm',
+    '.docx', '.xlsx', '.pptx', '.pdf', '.apk', '.jar', '.whl',
+}
+
+
+class _ZipOutput:
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def iter_archive_entries(roots):
+    """
+    roots 为 (绝对路径, 包内名称) 列表，展开目录后依次产生 (绝对路径, 包内名称, 是否目录)。
+    符号链接会被跳过，避免把链接指向的用户目录之外的内容打包进去。
+    """
+    for abs_path, arcname in roots:
+        if os.path.islink(abs_path): continue
+        if os.path.isfile(abs_path):
+            yield abs_path, arcname, False
+            continue
+        for dirpath, dirnames, filenames in os.walk(abs_path):
+            dirnames.sort()
+            rel_dir = os.path.relpath(dirpath, abs_path).replace('\\', '/')
+            base = arcname if rel_dir == '.' else f'{arcname}/{rel_dir}'
+            yield dirpath, base, True
+            for name in sorted(filenames):
+                file_path = os.path.join(dirpath, name)
+                if not os.path.islink(file_path):
+                    yield file_path, f'{base}/{name}', False
+
+
+def iter_zip(roots):
+    """生成 ZIP 文件内容的字节块。"""
+    out = _ZipOutput()
+    with zipfile.ZipFile(out, 'w', allowZip64=True) as zf:
+        for abs_path, arcname, is_dir in iter_archive_entries(roots):
+            try:
+                info = zipfile.ZipInfo.from_file(abs_path, arcname)
+            except OSError:
+                continue
+            if is_dir:
+                zf.writestr(info, b'')
+            else:
+                ext = os.path.splitext(abs_path)[1].lower()
+                info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                try:
+                    src = open(abs_path, 'rb')
+                except OSError:
+                    continue
+                with src, zf.open(info, 'w') as dst:
+                    while True:
+                        data = src.read(READ_SIZE)
+                        if not data: break
+                        dst.write(data)
+                        chunk = out.drain()
+                        if chunk: yield chunk
+            chunk = out.drain()
+            if chunk: yield chunk
+    yield out.drain()